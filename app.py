@@ -1,34 +1,49 @@
+import time
+
 from sgtk.platform import Application
 
+# app settings (info.yml) handed to the agent, at the top level of its settings or under "upload"
+SETTINGS = [
+    "log_folder", "sources", "tail_cycle_kb", "matcher", "traceback", "context", "watch_backend", "poll_interval",
+    "idle_after_sec", "cold_after_sec", "cold_interval_sec", "occurrence_flush_sec", "upload_workers",
+    "metrics_interval_sec", "metrics_file", "cooldown_sec", "throttle_max_signatures", "burst_sketch",
+    "max_uploads_per_minute", "min_uploads_per_minute", "fptr_latency_target_sec", "rate_adjust_sec",
+    "breaker_failures", "breaker_pause_sec", "breaker_pause_max_sec", "spool", "spool_max_items",
+    "spool_max_age_hours", "upload_retry_base_sec", "upload_retry_max_sec", "upload_max_attempts", "forwarding",
+]
+UPLOAD_SETTINGS = [
+    "shotgun_project_id", "ticket_entity_type", "attachment_mode",
+    "excerpt_before_kb", "excerpt_after_kb", "excerpt_header_kb", "excerpt_before_lines", "excerpt_after_lines",
+    "excerpt_compression", "occurrence_count_field", "occurrence_last_seen_field", "occurrence_notes",
+    "title_cache_size", "title_cache_ttl_sec", "title_cache_persist", "title_prefetch_days", "title_prefetch_limit",
+]
+
 
 class ObservabilityStarterApp(Application):
     def init_app(self):
+        started = time.perf_counter()
         # Collect configuration (Toolkit merges defaults + site/config)
         project_id = self.get_setting("shotgun_project_id")
-
-        try:
-            proj = self.shotgun.find_one("Project", [["id", "is", project_id]], ["id"])
-        except Exception as e:
-            self.logger.error(f"cannot access project_id={project_id}. skip start. ({e})")
-            return
-
-        if not proj:
-            self.logger.error(f"project_id={project_id} not found or no access. skip start.")
+        if not project_id:
+            self.logger.error("shotgun_project_id is not set. skip start.")
             return
 
         settings = {}
-        keys = ["shotgun_project_id", "ticket_entity_type"]
-        for key in keys:
+        for key in SETTINGS + UPLOAD_SETTINGS:
             value = self.get_setting(key)
-            if value:
-                if key in ("shotgun_project_id", "ticket_entity_type"):
-                    settings.setdefault("upload", {})[key] = value
-                else:
-                    settings[key] = value
+            # unset / empty means the agent default; False and 0 are real values
+            if value is None or value in ("", [], {}):
+                continue
+            if key in UPLOAD_SETTINGS:
+                settings.setdefault("upload", {})[key] = value
+            else:
+                settings[key] = value
 
-        # Start bootstrap, passing logger and shotgun handle
+        # Start bootstrap, passing logger and shotgun handle. Nothing here waits on FPTR:
+        # the project check and user / schema lookups run in the background once tailing started
         self._tk_incident = self.import_module("tk_incident")
         self._tk_incident.bootstrap.start(logger=self.logger, shotgun=self.shotgun, settings=settings)
+        self.logger.debug(f"tk-incidentreporter init_app took {time.perf_counter() - started:.3f}s")
 
     def destroy_app(self):
         try:
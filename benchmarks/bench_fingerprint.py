@@ -0,0 +1,85 @@
+"""
+Fingerprint micro-benchmark: fingerprints/sec with and without the memo.
+
+    python benchmarks/bench_fingerprint.py [--events 50000] [--distinct 200]
+
+Events are error lines drawn from a fixed set of messages whose numbers,
+paths, ids and addresses change on every occurrence; every line has its own
+timestamp, like a real log. "cold" calls the normalizers on every event,
+"memo" goes through the memo, where repeats of the same message (e.g. a
+retry loop logging the same error, --repeat-ratio) are hits even though
+their timestamps differ. Also prints how many distinct fingerprints the
+events collapse into.
+"""
+import argparse
+import random
+import uuid
+
+from common import best_of, load
+
+fp_mod = load("fingerprint")
+
+TEMPLATES = (
+    "Failed to open {path} (frame {n}, id {uuid})",
+    "Publish of {path} failed after {f}s: ValueError: bad value {n}",
+    "Cannot reach {url} (attempt {n})",
+    "Object at {addr} was deleted while version {hex} was loading",
+    "Shot \"{name}\" has no entity id {n}",
+    "disk full at {path}",
+)
+
+
+def make_events(count, distinct, repeat_ratio, seed=1):
+    rnd = random.Random(seed)
+    uuids = [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(64)]
+    events = []
+    msg = None
+    for i in range(count):
+        stamp = "2026-01-14 %02d:%02d:%02d,%03d" % (i // 3600000 % 24, i // 60000 % 60, i // 1000 % 60, i % 1000)
+        if msg is not None and rnd.random() < repeat_ratio:
+            events.append("%s [ %d ERROR sgtk.env.project.tk-maya] %s" % (stamp, 2764, msg))
+            continue
+        template = TEMPLATES[rnd.randrange(distinct) % len(TEMPLATES)]
+        msg = template.format(
+            path="/mnt/proj/seq%03d/shot_%04d/v%03d/scene.ma" % (rnd.randrange(50), rnd.randrange(2000), i % 100),
+            n=rnd.randrange(100000),
+            f=rnd.random() * 10,
+            uuid=rnd.choice(uuids),
+            url="https://site.shotgrid.autodesk.com/api/v1/entity/%d" % rnd.randrange(1000),
+            addr=hex(0x7F0000000000 + rnd.randrange(1 << 32)),
+            hex="%012x" % rnd.getrandbits(48),
+            name="sh%04d" % rnd.randrange(2000),
+        )
+        events.append("%s [ %d ERROR sgtk.env.project.tk-maya] %s" % (stamp, 2764, msg))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--distinct", type=int, default=200)
+    parser.add_argument("--repeat-ratio", type=float, default=0.5)
+    args = parser.parse_args()
+
+    events = make_events(args.events, args.distinct, args.repeat_ratio)
+    cold = fp_mod.fingerprint_uncached
+    memo = fp_mod.fingerprint
+
+    def run_memo():
+        fp_mod.memo_clear()
+        for line in events:
+            memo(line)
+
+    t_cold = best_of(lambda: [cold(line) for line in events])
+    t_memo = best_of(run_memo)
+    stats = fp_mod.memo_stats()
+    keys = set(cold(line).key for line in events)
+
+    print("%-6s %14s" % ("mode", "fingerprints/s"))
+    print("%-6s %14.0f" % ("cold", len(events) / t_cold))
+    print("%-6s %14.0f   (memo hits %d / misses %d)" % ("memo", len(events) / t_memo, stats["hits"], stats["misses"]))
+    print("%d events -> %d distinct lines -> %d fingerprints" % (len(events), len(set(events)), len(keys)))
+
+
+if __name__ == "__main__":
+    main()
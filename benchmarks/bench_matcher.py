@@ -0,0 +1,66 @@
+"""
+Matcher micro-benchmark: throughput for 1..100 rules.
+
+    python benchmarks/bench_matcher.py [--lines 200000] [--error-ratio 0.01]
+
+Reports Matcher.match() on decoded lines and the bytes prefilter the tail
+reader runs on raw chunks. One rule is a plain literal search (fastest);
+from a few rules on, throughput drops once and then declines slowly.
+"""
+import argparse
+import random
+
+from common import best_of, load
+
+matcher_mod = load("matcher")
+
+RULE_COUNTS = (1, 5, 10, 25, 50, 100)
+
+
+def make_lines(count, error_ratio, seed=1):
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(count):
+        if rnd.random() < error_ratio:
+            level, msg = "ERROR", "Failed to load reference: ValueError: bad value %d" % i
+        else:
+            level, msg = "DEBUG", "Loaded hook %s in %.3fs" % ("tk-multi-loader2/hooks/scene_actions.py", rnd.random())
+        lines.append("2026-01-14 19:49:11,%03d [ %d %s sgtk.env.project.tk-maya] %s" % (i % 1000, 2764, level, msg))
+    return lines
+
+
+def make_settings(rule_count):
+    """One severity rule plus (rule_count - 1) extra rules, mostly literals and a few regexes."""
+    exceptions, rules = [], []
+    for i in range(rule_count - 1):
+        if i % 10 == 9:
+            rules.append({"name": "re%d" % i, "regex": r"custom failure #%d\b" % i})
+        elif i % 2:
+            exceptions.append("Custom%dError" % i)
+        else:
+            rules.append({"name": "lit%d" % i, "literal": "Studio pipeline fault %d" % i})
+    return {"matcher": {"levels": ["ERROR"], "exceptions": exceptions, "rules": rules}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--error-ratio", type=float, default=0.01)
+    args = parser.parse_args()
+
+    lines = make_lines(args.lines, args.error_ratio)
+    blob = ("\n".join(lines) + "\n").encode("utf-8")
+
+    print("%6s %16s %18s %8s" % ("rules", "match() lines/s", "prefilter MB/s", "hits"))
+    for count in RULE_COUNTS:
+        matcher = matcher_mod.Matcher(make_settings(count))
+        match = matcher.match
+        hits = sum(1 for line in lines if match(line))
+
+        t_match = best_of(lambda: [match(line) for line in lines])
+        t_pre = best_of(lambda: sum(1 for _ in matcher.prefilter.finditer(blob)))
+        print("%6d %16.0f %18.1f %8d" % (count, len(lines) / t_match, len(blob) / t_pre / 1e6, hits))
+
+
+if __name__ == "__main__":
+    main()
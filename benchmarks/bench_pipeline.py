@@ -0,0 +1,140 @@
+"""
+End-to-end pipeline benchmark: TailWorker -> Matcher -> AgentController (IncidentPipeline) -> Uploader
+against a FakeShotgun, with a synthetic log written by loggen.py in a child process.
+
+    python benchmarks/bench_pipeline.py [--duration 20] [--rate 5000] [--error-ratio 0.001]
+                                        [--latency-scale 1.0] [--failure-rate 0.0] [--workers 2] ...
+
+Needs sgtk (tk-core on PYTHONPATH) and a Qt binding, but no FPTR site: the
+uploader only talks to the fake. Nothing is written to the Toolkit cache
+(checkpoints and the disk spool are off).
+
+Reports lines/sec through the tail worker, detection-to-ticket latency
+percentiles (log write time -> ticket created), CPU time and peak RSS of this
+process (the log generator runs in its own process), FPTR calls per method
+and the agent's drop counters.
+"""
+import argparse
+import ast
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "python"))
+
+from sgtk.util.qt_importer import QtImporter  # noqa: E402
+
+from fake_shotgun import FakeShotgun  # noqa: E402
+from tk_incident.agent import AgentController  # noqa: E402
+
+QtCore = QtImporter().QtCore
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def pump(app, seconds=0.01):
+    app.processEvents()
+    time.sleep(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20, help="seconds of log writing")
+    parser.add_argument("--drain", type=float, default=30, help="max seconds to wait for pending tickets afterwards")
+    parser.add_argument("--rate", type=float, default=5000, help="log lines per second")
+    parser.add_argument("--error-ratio", type=float, default=0.001)
+    parser.add_argument("--traceback-ratio", type=float, default=0.5)
+    parser.add_argument("--burst", type=int, default=0)
+    parser.add_argument("--rotate-every", type=int, default=0)
+    parser.add_argument("--truncate-every", type=int, default=0)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier on the fake FPTR latencies")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fake FPTR call failure probability")
+    parser.add_argument("--workers", type=int, default=2, help="upload_workers")
+    args = parser.parse_args()
+
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    logging.basicConfig(level=logging.ERROR)
+    log_dir = tempfile.mkdtemp(prefix="tk-bench-")
+    fake = FakeShotgun(scale=args.latency_scale, failure_rate=args.failure_rate)
+    settings = {
+        "upload": {"shotgun_project_id": 1},
+        "log_folder": log_dir,
+        "glob_patterns": ["tk-*.log"],
+        "checkpoints": False,
+        "spool": False,
+        "cooldown_sec": 0,
+        "max_uploads_per_minute": 10 ** 9,
+        "burst_threshold": 10 ** 9,
+        "upload_workers": args.workers,
+        "upload_retry_base_sec": 1,
+        "metrics_interval_sec": 0,
+    }
+    agent = AgentController(logging.getLogger("bench"), fake, settings, connection_factory=lambda: fake)
+    agent.start()
+    for _ in range(20):
+        pump(app)
+
+    usage0 = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.time()
+    gen = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "loggen.py"), log_dir,
+         "--rate", str(args.rate), "--duration", str(args.duration), "--error-ratio", str(args.error_ratio),
+         "--traceback-ratio", str(args.traceback_ratio), "--burst", str(args.burst),
+         "--rotate-every", str(args.rotate_every), "--truncate-every", str(args.truncate_every)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    while gen.poll() is None:
+        pump(app)
+    written = ast.literal_eval(gen.stdout.read().strip())
+    t_written = time.time()
+
+    # let the tail worker and the uploaders catch up
+    deadline = time.time() + args.drain
+    while len(fake.created) < written["errors"] and time.time() < deadline:
+        pump(app, 0.05)
+    t_done = time.time()
+    usage1 = resource.getrusage(resource.RUSAGE_SELF)
+    snap = agent.metrics.snapshot()
+    agent.stop()
+    shutil.rmtree(log_dir, ignore_errors=True)
+
+    counters = snap["counters"]
+    cpu = (usage1.ru_utime - usage0.ru_utime) + (usage1.ru_stime - usage0.ru_stime)
+    elapsed = t_done - t0
+    latencies = fake.ticket_latencies()
+    print("log written:      %(lines)d lines, %(errors)d errors, %(rotations)d rotations, "
+          "%(truncations)d truncations in %(elapsed).1fs" % written)
+    print("tail:             %.0f lines/s, %.1f MB/s scanned, %d lines forwarded" % (
+        (counters.get("tail.lines_scanned") or 0) / (t_written - t0),
+        (counters.get("tail.bytes_read") or 0) / (t_written - t0) / 1e6,
+        counters.get("tail.lines_forwarded") or 0,
+    ))
+    print("tickets:          %d created (%d expected), drained %.1fs after the writer stopped" % (
+        len(fake.created), written["errors"], t_done - t_written))
+    print("detect->ticket:   p50 %.3fs  p95 %.3fs  p99 %.3fs  max %.3fs" % (
+        percentile(latencies, 0.5), percentile(latencies, 0.95), percentile(latencies, 0.99),
+        max(latencies) if latencies else float("nan")))
+    print("cpu:              %.2fs (%.1f%% of one core)" % (cpu, 100 * cpu / elapsed))
+    print("peak rss:         %.1f MB" % (usage1.ru_maxrss / 1024.0))
+    print("fptr calls:       %s  failures: %s" % (fake.calls, fake.failures))
+    print("drops:            %s" % {k: v for k, v in sorted(counters.items()) if k.startswith("drop.") and v})
+    print("rate limiter:     %s" % agent.pipeline.rate.state())
+
+
+if __name__ == "__main__":
+    main()
+    # skip interpreter teardown: some Qt bindings crash collecting signal objects
+    # of a finished QThread at exit, which would only hide the report above
+    sys.stdout.flush()
+    os._exit(0)
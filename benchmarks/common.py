@@ -0,0 +1,34 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+import importlib
+import os
+import sys
+import time
+import types
+
+PKG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "python", "tk_incident")
+
+
+def load(name):
+    """
+    Import tk_incident.<name> straight from the source tree, without the
+    package __init__. Only works for modules that don't import sgtk or Qt
+    themselves (not pipeline, uploader or the Qt adapters).
+    """
+    if "tk_incident" not in sys.modules:
+        pkg = types.ModuleType("tk_incident")
+        pkg.__path__ = [PKG_DIR]
+        sys.modules["tk_incident"] = pkg
+    return importlib.import_module("tk_incident." + name)
+
+
+def best_of(fn, repeat=5):
+    """Best wall time of fn() over a few runs, in seconds."""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
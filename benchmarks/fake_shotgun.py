@@ -0,0 +1,152 @@
+"""
+In-process fake of the shotgun_api3 handle used by the Uploader, for benchmarks.
+
+Simulates per-call latency (base + random jitter) and random failures for
+find / find_one / create / update / batch / upload / schema_field_read, and
+records every created ticket with its creation time (Notes are kept apart,
+in `notes`).
+"""
+import itertools
+import random
+import re
+import threading
+import time
+
+DEFAULT_LATENCY = {
+    "find": 0.08,
+    "find_one": 0.08,
+    "create": 0.15,
+    "update": 0.1,
+    "batch": 0.2,
+    "upload": 0.5,
+    "schema_field_read": 0.1,
+}
+
+_T_RE = re.compile(r"\bt=(\d+\.\d+)")
+
+
+class FakeShotgunError(Exception):
+    pass
+
+
+class FakeShotgun(object):
+    """
+    latency: seconds per method (see DEFAULT_LATENCY), scaled by `scale`;
+    jitter: +/- fraction of the latency; failure_rate: probability that a
+    call raises FakeShotgunError after its latency.
+    """
+
+    def __init__(self, latency=None, scale=1.0, jitter=0.3, failure_rate=0.0, title_field="title", seed=1):
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.scale = float(scale)
+        self.jitter = float(jitter)
+        self.failure_rate = float(failure_rate)
+        self.title_field = title_field
+        self.tickets = {}
+        self.created = []  # (created_at, ticket dict)
+        self.notes = []
+        self.uploads = []  # (ticket id, path, size)
+        self.calls = {}
+        self.failures = {}
+        self._ids = itertools.count(1)
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, method):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            delay = self.latency.get(method, 0.05) * self.scale * (1 + self._rnd.uniform(-self.jitter, self.jitter))
+            fail = self._rnd.random() < self.failure_rate
+        time.sleep(max(delay, 0))
+        if fail:
+            with self._lock:
+                self.failures[method] = self.failures.get(method, 0) + 1
+            raise FakeShotgunError(f"simulated {method} failure")
+
+    def _matches(self, entity, filters):
+        for field, op, value in filters:
+            if field == "project" or op == "in_last":
+                continue
+            have = entity.get(field)
+            if op == "is" and have != value:
+                return False
+            if op == "in" and have not in value:
+                return False
+            if op == "starts_with" and not str(have or "").startswith(value):
+                return False
+        return True
+
+    def _create(self, entity_type, data):
+        with self._lock:
+            if entity_type == "Note":
+                self.notes.append(dict(data))
+                return {"type": entity_type, "id": len(self.notes)}
+            ticket = dict(data, type=entity_type, id=next(self._ids))
+            self.tickets[ticket["id"]] = ticket
+            self.created.append((time.time(), ticket))
+        return {"type": entity_type, "id": ticket["id"]}
+
+    # -------------------------
+    # shotgun_api3 subset
+    # -------------------------
+    def find(self, entity_type, filters, fields=None, order=None, limit=0, **kwargs):
+        self._call("find")
+        with self._lock:
+            found = [dict(t) for t in self.tickets.values() if self._matches(t, filters)]
+        return found[:limit] if limit else found
+
+    def find_one(self, entity_type, filters, fields=None, **kwargs):
+        self._call("find_one")
+        if entity_type == "Project":
+            return {"type": "Project", "id": filters[0][2]}
+        with self._lock:
+            return next((dict(t) for t in self.tickets.values() if self._matches(t, filters)), None)
+
+    def create(self, entity_type, data, **kwargs):
+        self._call("create")
+        return self._create(entity_type, data)
+
+    def update(self, entity_type, entity_id, data, **kwargs):
+        self._call("update")
+        with self._lock:
+            self.tickets[entity_id].update(data)
+            return dict(self.tickets[entity_id])
+
+    def batch(self, requests):
+        self._call("batch")
+        out = []
+        for request in requests:
+            if request["request_type"] == "create":
+                out.append(self._create(request["entity_type"], request["data"]))
+            elif request["request_type"] == "update":
+                with self._lock:
+                    self.tickets[request["entity_id"]].update(request["data"])
+                    out.append(dict(self.tickets[request["entity_id"]]))
+        return out
+
+    def upload(self, entity_type, entity_id, path, field_name=None, **kwargs):
+        self._call("upload")
+        with open(path, "rb") as fh:
+            size = len(fh.read())
+        with self._lock:
+            self.uploads.append((entity_id, path, size))
+        return 1
+
+    def schema_field_read(self, entity_type, field_name=None, **kwargs):
+        self._call("schema_field_read")
+        return {self.title_field: {}, "description": {}, "project": {}, "attachments": {},
+                "sg_occurrences": {}, "sg_last_seen": {}}
+
+    # -------------------------
+    # benchmark helpers
+    # -------------------------
+    def ticket_latencies(self):
+        """Seconds from the "t=<epoch>" write time in each ticket's matched line to its creation."""
+        latencies = []
+        with self._lock:
+            created = list(self.created)
+        for created_at, ticket in created:
+            m = _T_RE.search(ticket.get("description", ""))
+            if m:
+                latencies.append(created_at - float(m.group(1)))
+        return latencies
@@ -0,0 +1,129 @@
+"""
+Synthetic tk-*.log generator.
+
+    python benchmarks/loggen.py OUT_DIR [--rate 2000] [--duration 30] [--error-ratio 0.001]
+                                [--traceback-ratio 0.5] [--burst 0] [--rotate-every 0] [--truncate-every 0]
+
+Writes Toolkit-style log records at a steady rate (lines/sec). Each error
+gets a unique exception name (Bench<seq>Error, so every error is a new
+ticket) and carries its write time as "t=<epoch>", which lets a benchmark
+measure detection-to-ticket latency. Options add traceback blocks, bursts of
+errors, and rotation (rename to .1 + new file) / truncation events.
+"""
+import argparse
+import os
+import random
+import time
+
+LOGGERS = ("sgtk.env.project.tk-maya", "sgtk.core.hook", "sgtk.env.project.tk-multi-publish2", "tk-desktop.site")
+DEBUG_MESSAGES = (
+    "Loaded hook /studio/config/hooks/scene_actions.py in %.3fs",
+    "Resolved template maya_shot_work for entity Shot %d",
+    "Cache hit for %d schema fields",
+    "Polling for new versions (%d pending)",
+)
+
+
+class LogGenerator(object):
+    """Writes synthetic log records to folder/name; see the module docstring."""
+
+    def __init__(self, folder, name="tk-bench.log", rate=2000, error_ratio=0.001, traceback_ratio=0.5,
+                 burst=0, rotate_every=0, truncate_every=0, seed=1):
+        self.path = os.path.join(folder, name)
+        self.rate = float(rate)
+        self.error_ratio = float(error_ratio)
+        self.traceback_ratio = float(traceback_ratio)
+        self.burst = int(burst)
+        self.rotate_every = int(rotate_every)
+        self.truncate_every = int(truncate_every)
+        self._rnd = random.Random(seed)
+        self.stats = {"lines": 0, "errors": 0, "rotations": 0, "truncations": 0}
+
+    def _record(self, level, logger, msg, now):
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        return "%s,%03d [ %d %s %s] %s\n" % (stamp, int(now * 1000) % 1000, os.getpid(), level, logger, msg)
+
+    def _error(self, now):
+        seq = self.stats["errors"]
+        self.stats["errors"] += 1
+        exc = "Bench%dError" % seq
+        text = self._record("ERROR", self._rnd.choice(LOGGERS), "%s: bench failure t=%.6f" % (exc, now), now)
+        if self._rnd.random() < self.traceback_ratio:
+            text += "Traceback (most recent call last):\n"
+            for depth in range(self._rnd.randint(2, 6)):
+                text += '  File "/studio/config/hooks/bench_%d.py", line %d, in step_%d\n' % (depth, 10 + depth, depth)
+                text += "    run_step(%d)\n" % depth
+            text += "%s: bench failure\n" % exc
+        return text
+
+    def _debug(self, now):
+        msg = self._rnd.choice(DEBUG_MESSAGES)
+        msg = msg % (self._rnd.random() if "%.3f" in msg else self._rnd.randrange(1000))
+        return self._record("DEBUG", self._rnd.choice(LOGGERS), msg, now)
+
+    def _event(self, fh):
+        """Rotation / truncation when due. Returns the (possibly new) file handle."""
+        lines = self.stats["lines"]
+        if self.rotate_every and lines % self.rotate_every == 0:
+            fh.close()
+            os.replace(self.path, self.path + ".1")
+            self.stats["rotations"] += 1
+            return open(self.path, "a", encoding="utf-8")
+        if self.truncate_every and lines % self.truncate_every == 0:
+            fh.truncate(0)
+            fh.seek(0)
+            self.stats["truncations"] += 1
+        return fh
+
+    def run(self, duration, stop=None, tick=0.01):
+        """Write for duration seconds (or until stop() returns True). Returns stats."""
+        fh = open(self.path, "a", encoding="utf-8")
+        start = time.time()
+        try:
+            while True:
+                now = time.time()
+                if now - start >= duration or (stop and stop()):
+                    break
+                due = int((now - start) * self.rate) - self.stats["lines"]
+                chunk = []
+                for _ in range(max(due, 0)):
+                    if self._rnd.random() < self.error_ratio:
+                        chunk.extend(self._error(now) for _ in range(max(self.burst, 1)))
+                    else:
+                        chunk.append(self._debug(now))
+                    self.stats["lines"] += 1
+                    if self.rotate_every or self.truncate_every:
+                        fh.write("".join(chunk))
+                        chunk = []
+                        fh = self._event(fh)
+                if chunk:
+                    fh.write("".join(chunk))
+                    fh.flush()
+                time.sleep(tick)
+        finally:
+            fh.close()
+        self.stats["elapsed"] = time.time() - start
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir")
+    parser.add_argument("--name", default="tk-bench.log")
+    parser.add_argument("--rate", type=float, default=2000, help="lines per second")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--error-ratio", type=float, default=0.001)
+    parser.add_argument("--traceback-ratio", type=float, default=0.5)
+    parser.add_argument("--burst", type=int, default=0, help="errors written at once per error event")
+    parser.add_argument("--rotate-every", type=int, default=0, help="rotate after this many lines")
+    parser.add_argument("--truncate-every", type=int, default=0, help="truncate after this many lines")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    gen = LogGenerator(args.out_dir, args.name, args.rate, args.error_ratio, args.traceback_ratio, args.burst,
+                       args.rotate_every, args.truncate_every, args.seed)
+    print(gen.run(args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import re
+import time
+
+
+# Toolkit log records start with "2026-01-14 19:49:11,961 [ 2764 ERROR ...]"
+DEFAULT_RECORD_START = rb"^\d{4}-\d{2}-\d{2}[ T]\d{1,2}:\d{2}"
+
+_FRAME_RE = re.compile(r'^\s*File "(?P<file>[^"]+)", line \d+, in (?P<func>\S+)', re.M)
+_EXC_LINE_RE = re.compile(r"^(?P<exc>[A-Za-z_][\w.]*(?:Error|Exception|Exit|Interrupt))\b", re.M)
+
+
+class IncidentAssembler(object):
+    """
+    Groups a matched line with its continuation lines (traceback frames,
+    chained exceptions, ...) into one incident block.
+
+    A block ends where the next timestamped record starts. If the writer is
+    still in the middle of it, the block is held back (see LogReader) and
+    emitted as-is once `timeout` seconds have passed (or right away when the
+    file is rotated, truncated or no longer tailed). Blocks are capped at
+    max_lines / max_bytes; the capped remainder is skipped, not re-matched.
+
+    The only per-file state is state["pending"] = (head_offset, since).
+    """
+
+    def __init__(self, record_start=None, timeout=2.0, max_lines=200, max_bytes=64 * 1024):
+        if isinstance(record_start, str):
+            record_start = record_start.encode("utf-8")
+        self.record_start = re.compile(record_start or DEFAULT_RECORD_START, re.M)
+        self.timeout = float(timeout)
+        self.max_lines = int(max_lines)
+        self.max_bytes = int(max_bytes)
+
+    def block_end(self, data, head_start, head_end, cut, offset, state, at_eof, final=False):
+        """
+        Find the end of the block whose head line is data[head_start:head_end].
+        Only data[:cut] (complete lines) is looked at. offset is the file
+        offset of the head line, used to track a pending block across reads.
+        final: no more data will come, the block ends at cut.
+
+        Returns (content_end, consumed_end), or None to hold the block back
+        until more data arrives or the timeout passes.
+        """
+        m = self.record_start.search(data, head_end, cut)
+        end = m.start() if m else cut
+        content_end = self._cap(data, head_start, head_end, end)
+
+        if m or content_end < end:
+            state.pop("pending", None)
+            return content_end, end
+        if final:
+            state.pop("pending", None)
+            return end, end
+
+        now = time.monotonic()
+        pending = state.get("pending")
+        if pending is None or pending[0] != offset:
+            state["pending"] = (offset, now)
+            return None
+        if at_eof and now - pending[1] >= self.timeout:
+            # writer went quiet: emit what we have
+            state.pop("pending", None)
+            return end, end
+        return None
+
+    def _cap(self, data, head_start, head_end, end):
+        if end - head_start > self.max_bytes:
+            end = max(data.rfind(b"\n", head_end, head_start + self.max_bytes) + 1, head_end)
+        pos = head_end
+        for _ in range(self.max_lines):
+            nl = data.find(b"\n", pos, end)
+            if nl < 0:
+                return end
+            pos = nl + 1
+        return pos
+
+
+def parse_traceback(text):
+    """
+    Return (exception_name, frames) from a traceback text, where frames is a
+    list of (file_basename, function) tuples. Line numbers and directories are
+    dropped so the same crash from another checkout/version groups together.
+    """
+    if not text:
+        return None, []
+    frames = [
+        (os.path.basename(m.group("file").replace("\\", "/")), m.group("func"))
+        for m in _FRAME_RE.finditer(text)
+    ]
+    exc = None
+    for m in _EXC_LINE_RE.finditer(text):
+        exc = m.group("exc").rsplit(".", 1)[-1]  # last one is the one that was raised
+    return exc, frames
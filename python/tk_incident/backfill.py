@@ -0,0 +1,358 @@
+"""
+Backfill: sweep existing (archived) logs for incidents the tailer never saw,
+since it starts at the end of each file.
+
+    python -m tk_incident.backfill FOLDER [FOLDER ...] [--settings settings.json] [--workers N]
+                                   [--report report.json] [--upload --max-uploads-per-minute 6]
+
+Files are split across a process pool and read in large binary chunks with
+the matcher's prefilter, so only candidate lines are decoded. Incidents are
+aggregated by fingerprint (count, first / last seen, files) into a report.
+With --upload, one ticket per fingerprint is filed through the Uploader,
+most frequent first, paced to a fixed rate.
+
+Progress is kept per file in a state file (offset + head fingerprint): an
+interrupted or repeated run skips finished files and only reads what was
+appended to the others.
+"""
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+from .assembler import IncidentAssembler
+from .checkpoint import FINGERPRINT_BYTES, head_fingerprint
+from .fingerprint import fingerprint
+from .matcher import Matcher
+from .reader import LogReader
+
+DEFAULT_PATTERNS = ["tk-*.log", "tk-*.log.[0-9]*"]
+
+_STAMP_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})[ T](\d{1,2}:\d{2}:\d{2})")
+_ROTATED_RE = re.compile(r"(\.log)\.\d+$")
+
+
+@lru_cache(maxsize=4096)
+def _epoch(day, clock):
+    return time.mktime(time.strptime(day + " " + clock, "%Y-%m-%d %H:%M:%S"))
+
+
+def record_time(line, default=None):
+    """Epoch of a "2026-01-14 19:49:11,961 [...]" record, or default."""
+    m = _STAMP_RE.match(line)
+    if not m:
+        return default
+    try:
+        return _epoch(m.group(1), m.group(2))
+    except ValueError:
+        return default
+
+
+def merge(into, key, entry):
+    """Fold one fingerprint entry into an aggregate dict (key -> entry)."""
+    have = into.get(key)
+    if have is None:
+        into[key] = dict(entry)
+        return
+    have["count"] += entry["count"]
+    if entry["first_seen"] < have["first_seen"]:
+        have["first_seen"] = entry["first_seen"]
+        have["sample"] = entry["sample"]
+    have["last_seen"] = max(have["last_seen"], entry["last_seen"])
+    have["files"] += entry["files"]
+
+
+def scan_file(path, settings, start=0, chunk_size=4 * 1024 * 1024):
+    """
+    Scan path from byte offset start (runs in a pool process).
+    Returns {"path", "start", "offset", "bytes", "lines", "fingerprints"} where
+    fingerprints maps key -> {label, count, first_seen, last_seen, files, sample}
+    and sample = [path, end offset, matched] of the first occurrence.
+    """
+    matcher = Matcher(settings)
+    if matcher.prefilter is None:
+        return {"path": path, "start": start, "offset": start, "bytes": 0, "lines": 0, "fingerprints": {}}
+    tb_cfg = settings.get("traceback") or {}
+    # files are complete: a block at the end of the file doesn't wait for its writer
+    assembler = IncidentAssembler(record_start=tb_cfg.get("record_start"), timeout=0,
+                                  max_lines=int(tb_cfg.get("max_lines", 200)))
+    reader = LogReader(prefilter=matcher.prefilter, assembler=assembler, chunk_size=chunk_size)
+    engine_path = _ROTATED_RE.sub(r"\1", path)  # tk-maya.log.3 -> engine tk-maya
+    default_ts = os.path.getmtime(path)
+
+    found = {}
+    state = {}
+    reader.reset(state, start)
+    while True:
+        for pos, raw in reader.read(path, state):
+            line, _, stack = raw.decode("utf-8", errors="ignore").partition("\n")
+            matched = matcher.match(line, engine_path)
+            if not matched:
+                continue
+            if stack:
+                matched["stack"] = stack.replace("\r\n", "\n")
+            fp = fingerprint(line, matched.get("stack"))
+            ts = record_time(line, default_ts)
+            entry = found.get(fp.key)
+            if entry is None:
+                found[fp.key] = {"label": fp.label, "count": 1, "first_seen": ts, "last_seen": ts, "files": 1,
+                                 "sample": [path, pos, matched]}
+            else:
+                entry["count"] += 1
+                entry["first_seen"] = min(entry["first_seen"], ts)
+                entry["last_seen"] = max(entry["last_seen"], ts)
+        if not state.get("pending"):
+            break
+    offset = state["pos"] - len(state.get("carry", b""))
+    return {"path": path, "start": start, "offset": offset, "bytes": reader.bytes_read,
+            "lines": reader.lines_scanned, "fingerprints": found}
+
+
+def find_logs(folders, patterns=None, recursive=True):
+    """Log files under folders matching patterns, largest first (keeps the pool busy until the end)."""
+    patterns = patterns or DEFAULT_PATTERNS
+    found = []
+    for folder in folders:
+        for root, dirs, files in os.walk(folder):
+            for name in files:
+                if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                    path = os.path.abspath(os.path.join(root, name))
+                    try:
+                        found.append((os.path.getsize(path), path))
+                    except OSError:
+                        pass  # removed (or rotated away) during the walk
+            if not recursive:
+                break
+    found.sort(key=lambda item: item[0], reverse=True)
+    return [path for _, path in found]
+
+
+class BackfillState(object):
+    """
+    Per-file progress on disk: path -> {offset, fp, fp_len, fingerprints}.
+    Rewritten atomically after every finished file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self.uploaded = []  # fingerprint keys already filed
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            self.files = data.get("files", {})
+            self.uploaded = data.get("uploaded", [])
+
+    def resume_offset(self, path):
+        """Where to continue path: the stored offset if it is still the same file, else 0."""
+        entry = self.files.get(path)
+        if not entry:
+            return 0
+        try:
+            if os.path.getsize(path) < entry["offset"]:
+                return 0
+            if entry.get("fp_len") and head_fingerprint(path, entry["fp_len"])[0] != entry.get("fp"):
+                return 0
+        except OSError:
+            return 0
+        return entry["offset"]
+
+    def update(self, result):
+        path = result["path"]
+        entry = self.files.get(path)
+        fingerprints = {}
+        if entry and result["start"]:
+            # continued where the previous run stopped: add to what it found
+            fingerprints = entry["fingerprints"]
+        for key, found in result["fingerprints"].items():
+            if key in fingerprints:
+                merge(fingerprints, key, dict(found, files=0))
+            else:
+                fingerprints[key] = found
+        fp, fp_len = head_fingerprint(path, FINGERPRINT_BYTES)
+        self.files[path] = {"offset": result["offset"], "fp": fp, "fp_len": fp_len, "fingerprints": fingerprints}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"files": self.files, "uploaded": self.uploaded}, fh)
+        os.replace(tmp, self.path)
+
+    def aggregate(self, paths=None):
+        """key -> entry over all (or the given) files."""
+        total = {}
+        for path, entry in self.files.items():
+            if paths is not None and path not in paths:
+                continue
+            for key, found in entry["fingerprints"].items():
+                merge(total, key, found)
+        return total
+
+
+def run_backfill(paths, settings, state, workers=None, logger=None):
+    """Scan paths in a process pool, recording each finished file in state. Returns scan totals."""
+    logger = logger or logging.getLogger(__name__)
+    totals = {"files": len(paths), "scanned": 0, "skipped": 0, "bytes": 0, "lines": 0}
+    jobs = []
+    for path in paths:
+        start = state.resume_offset(path)
+        if start and start >= os.path.getsize(path):
+            totals["skipped"] += 1
+            continue
+        jobs.append((path, start))
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(scan_file, path, settings, start): path for path, start in jobs}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception:
+                logger.exception("Cannot scan %s", path)
+                continue
+            state.update(result)
+            state.save()
+            totals["scanned"] += 1
+            totals["bytes"] += result["bytes"]
+            totals["lines"] += result["lines"]
+            logger.info("Scanned %s: %d incidents, %.1f MB (%d/%d)", path,
+                        sum(f["count"] for f in result["fingerprints"].values()), result["bytes"] / 1e6,
+                        totals["scanned"], len(jobs))
+    totals["elapsed"] = time.time() - t0
+    return totals
+
+
+def report(aggregate, totals=None):
+    """Report dict: incidents sorted by count (most frequent first)."""
+    incidents = []
+    for key, entry in sorted(aggregate.items(), key=lambda kv: (-kv[1]["count"], kv[1]["first_seen"])):
+        path, pos, matched = entry["sample"]
+        incidents.append({
+            "fingerprint": key,
+            "label": entry["label"],
+            "count": entry["count"],
+            "files": entry["files"],
+            "first_seen": entry["first_seen"],
+            "last_seen": entry["last_seen"],
+            "sample_path": path,
+            "sample_offset": pos,
+            "sample_line": matched.get("matched_line", ""),
+        })
+    return {"ts": time.time(), "totals": totals or {}, "incidents": incidents}
+
+
+def format_report(data, top=30):
+    stamp = lambda t: time.strftime("%Y-%m-%d %H:%M", time.localtime(t))  # noqa: E731
+    lines = ["%d distinct incidents, %d occurrences" % (
+        len(data["incidents"]), sum(i["count"] for i in data["incidents"]))]
+    for item in data["incidents"][:top]:
+        lines.append("%7d  %3d files  %s .. %s  %s" % (
+            item["count"], item["files"], stamp(item["first_seen"]), stamp(item["last_seen"]), item["label"]))
+    return "\n".join(lines)
+
+
+def upload(uploader, aggregate, state, per_minute=6, max_uploads=None, min_count=1, logger=None):
+    """
+    File one ticket per fingerprint, most frequent first, at most per_minute
+    tickets a minute (and max_uploads in total). A ticket created here gets
+    the backfilled occurrence count; an existing one gets it added (with the
+    uploader's occurrence tally, see Uploader.update_occurrences()). Returns
+    the number of fingerprints filed or updated.
+    """
+    logger = logger or logging.getLogger(__name__)
+    interval = 60.0 / per_minute if per_minute > 0 else 0
+    done = set(state.uploaded)
+    filed = 0
+    next_at = 0.0
+    for key, entry in sorted(aggregate.items(), key=lambda kv: -kv[1]["count"]):
+        if key in done or entry["count"] < min_count:
+            continue
+        if max_uploads is not None and filed >= max_uploads:
+            break
+        time.sleep(max(next_at - time.time(), 0))
+        next_at = time.time() + interval
+        path, pos, matched = entry["sample"]
+        trigger = dict(matched, detected_ts=entry["first_seen"], backfill={
+            "count": entry["count"], "files": entry["files"],
+            "first_seen": entry["first_seen"], "last_seen": entry["last_seen"],
+        })
+        try:
+            ok = uploader.upload_batch([(path, pos, trigger)])[0]
+        except Exception:
+            logger.warning("Backfill upload failed for %s", entry["label"], exc_info=True)
+            continue
+        if ok and uploader.occurrences is not None and len(uploader.occurrences):
+            # the ticket existed: apply the backfilled counts to it now
+            leftover = uploader.update_occurrences(uploader.occurrences.drain())
+            if leftover:
+                logger.warning("Cannot update occurrences of %s, will retry on the next run", entry["label"])
+                ok = False
+        if ok:
+            filed += 1
+            state.uploaded.append(key)
+            state.save()
+        else:
+            logger.warning("Backfill upload failed for %s", entry["label"])
+    return filed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folders", nargs="+")
+    parser.add_argument("--settings", help="JSON file with the app settings (matcher, upload, ...)")
+    parser.add_argument("--pattern", action="append", help="file name pattern (default: %s)" % DEFAULT_PATTERNS)
+    parser.add_argument("--no-recursive", action="store_true")
+    parser.add_argument("--workers", type=int, default=None, help="scan processes (default: CPU count)")
+    parser.add_argument("--state", default="backfill_state.json", help="progress file ('' to disable resuming)")
+    parser.add_argument("--report", default="backfill_report.json")
+    parser.add_argument("--top", type=int, default=30, help="incidents printed in the summary")
+    parser.add_argument("--upload", action="store_true", help="file tickets for the incidents found")
+    parser.add_argument("--max-uploads-per-minute", type=float, default=6)
+    parser.add_argument("--max-uploads", type=int, default=None)
+    parser.add_argument("--min-count", type=int, default=1, help="only file incidents seen at least this often")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    logger = logging.getLogger("tk-incidentreporter.backfill")
+    settings = {}
+    if args.settings:
+        with open(args.settings, encoding="utf-8") as fh:
+            settings = json.load(fh)
+
+    paths = find_logs(args.folders, args.pattern, recursive=not args.no_recursive)
+    state = BackfillState(args.state or None)
+    totals = run_backfill(paths, settings, state, args.workers, logger)
+    aggregate = state.aggregate(set(paths))
+    data = report(aggregate, totals)
+    with open(args.report, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=1)
+    print(format_report(data, args.top))
+    print("%(files)d files (%(skipped)d unchanged), %(lines)d lines, %(bytes)d bytes in %(elapsed).1fs" % totals)
+
+    if args.upload:
+        from .occurrences import OccurrenceAggregator
+        from .runtime import _connection_factory
+        from .uploader import Uploader
+        uploader = Uploader(shotgun=_connection_factory(logger)(), logger=logger, settings=settings,
+                            occurrences=OccurrenceAggregator())
+        try:
+            filed = upload(uploader, aggregate, state, args.max_uploads_per_minute, args.max_uploads,
+                           args.min_count, logger)
+        finally:
+            uploader.close()
+        print("%d incidents filed" % filed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
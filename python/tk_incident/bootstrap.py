@@ -1,5 +1,5 @@
-from .singleton import SingletonLock
-from .agent import AgentController
+# Qt modules are imported on use, so the package (and runtime.py) imports without Qt
+LOCK_NAME = "tk_incident_site_lock"
 
 _runner = None
 
@@ -24,21 +24,79 @@ def stop():
         _runner = None
 
 
+def read_metrics(timeout_ms=1000):
+    """Metrics JSON of the running agent (this or another process), or None."""
+    from .singleton import send_command
+    return send_command(LOCK_NAME, "metrics", timeout_ms)
+
+
 class AgentRunner(object):
+    """
+    Runs the agent as the primary instance (holds the leader FileLock in the
+    app cache, serves the SingletonLock socket, uploads) or, when another
+    process holds it, as a secondary one that tails its own logs and forwards
+    incidents to the primary over that socket (forwarding: false restores
+    "do not start"). The OS drops the FileLock when its holder dies, so
+    exactly one secondary wins it and carries on as the primary; the socket
+    is only the transport.
+    """
+
     def __init__(self, logger, shotgun, settings=None):
+        from .instance_lock import FileLock
+        from .paths import agent_lock_path
+        from .singleton import SingletonLock
         self.logger = logger
         self.shotgun = shotgun
         self.settings = settings or {}
-        self.lock = SingletonLock("tk_incident_site_lock")
+        self.leader = FileLock(agent_lock_path())
+        self.lock = SingletonLock(LOCK_NAME)
         self.controller = None
 
+    def _elect(self):
+        """Try to become the primary: take the leader lock, then serve the socket."""
+        if not self.leader.acquire():
+            return False
+        if not self.lock.listen():
+            self.logger.warning("tk-incidentreporter: cannot listen on %s, other sessions cannot forward to this one.",
+                                LOCK_NAME)
+        return True
+
     def start(self):
-        if not self.lock.acquire():
+        if self._elect():
+            self.logger.info("tk-incidentreporter starting.")
+            self._start_primary()
+            return
+        if not self.settings.get("forwarding", True):
             self.logger.warning("tk-incidentreporter: another instance running. Not starting.")
             return
-        self.logger.info("tk-incidentreporter starting.")
+        self.logger.info("tk-incidentreporter: another instance running, forwarding incidents to it.")
+        from .forwarder import ForwardingController
+        self.controller = ForwardingController(logger=self.logger, lock_name=LOCK_NAME, settings=self.settings)
+        self.controller.primary_lost.connect(self._on_primary_lost)
+        self.controller.start()
+
+    def _start_primary(self, backlog=()):
+        from .agent import AgentController
         self.controller = AgentController(logger=self.logger, shotgun=self.shotgun, settings=self.settings)
         self.controller.start()
+        self.lock.add_command("metrics", self.controller.metrics_json)
+        from .forwarder import STREAM
+        self.lock.add_stream(STREAM, self.controller.on_forwarded)
+        for event in backlog:
+            self.controller.pipeline.on_forwarded(event)
+
+    def _on_primary_lost(self):
+        """Failover: the first secondary to get the lock becomes the primary, the others reconnect to it."""
+        if not self._elect():
+            self.controller.reconnect()
+            return
+        secondary = self.controller
+        # stopped first: its tailer reports the blocks it still had pending into the backlog
+        secondary.stop()
+        backlog = secondary.take_backlog()
+        self.logger.info("tk-incidentreporter: primary instance gone, taking over (%d incidents pending).",
+                         len(backlog))
+        self._start_primary(backlog)
 
     def stop(self):
         if self.controller:
@@ -48,4 +106,5 @@ class AgentRunner(object):
             self.lock.release()
         except Exception:
             pass
-        self.logger.info("tk-incidentreporter stopped.")
\ No newline at end of file
+        self.leader.release()
+        self.logger.info("tk-incidentreporter stopped.")
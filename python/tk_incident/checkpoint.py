@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+FINGERPRINT_BYTES = 1024
+
+
+def head_fingerprint(path, length=FINGERPRINT_BYTES):
+    """
+    Hash of the first bytes of a file: tells a rotated/recreated file apart
+    from the one a checkpoint was taken on, even if the inode was reused.
+    Returns (hex, hashed_length).
+    """
+    with open(path, "rb") as fh:
+        head = fh.read(length)
+    return hashlib.sha1(head).hexdigest()[:16], len(head)
+
+
+class CheckpointStore(object):
+    """
+    On-disk tail positions: path -> {inode, offset, fp, fp_len, ts}.
+
+    update() only touches memory; the JSON file is rewritten atomically at
+    most every flush_interval seconds (maybe_flush) and on flush().
+    """
+
+    def __init__(self, path, flush_interval=5.0, max_entries=512):
+        self.path = path
+        self.flush_interval = float(flush_interval)
+        self.max_entries = int(max_entries)
+        self._entries = {}
+        self.saved_at = None  # when the loaded file was last written (end of previous session)
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "r", encoding="utf-8") as fh:
+            entries = json.load(fh)
+        self.saved_at = os.path.getmtime(self.path)
+        with self._lock:
+            self._entries = entries if isinstance(entries, dict) else {}
+            return len(self._entries)
+
+    def get(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            return dict(entry) if entry else None
+
+    def resume_offset(self, path, st):
+        """
+        Offset to resume path at, or None if there is no checkpoint or it was
+        taken on a different file (inode / head fingerprint mismatch).
+        """
+        entry = self.get(path)
+        if not entry:
+            return None
+        inode = getattr(st, "st_ino", None)
+        if entry.get("inode") and inode and entry["inode"] != inode:
+            return None
+        if entry.get("offset", 0) > st.st_size:
+            return None
+        if entry.get("fp_len"):
+            try:
+                fp, _ = head_fingerprint(path, entry["fp_len"])
+            except OSError:
+                return None
+            if fp != entry.get("fp"):
+                return None
+        return int(entry.get("offset", 0))
+
+    def written_since_save(self, st):
+        """True if a file without checkpoint was modified after the previous session stopped."""
+        return self.saved_at is not None and st.st_mtime > self.saved_at
+
+    def update(self, path, inode, offset, fp, fp_len):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry.get("offset") == offset and entry.get("inode") == inode and entry.get("fp") == fp:
+                return
+            self._entries[path] = {"inode": inode, "offset": offset, "fp": fp, "fp_len": fp_len, "ts": time.time()}
+            self._dirty = True
+
+    def forget(self, path):
+        with self._lock:
+            if self._entries.pop(path, None) is not None:
+                self._dirty = True
+
+    def maybe_flush(self):
+        if self._dirty and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._dirty:
+                return
+            if len(self._entries) > self.max_entries:
+                keep = sorted(self._entries.items(), key=lambda kv: kv[1].get("ts", 0))[-self.max_entries:]
+                self._entries = dict(keep)
+            data = json.dumps(self._entries)
+            self._dirty = False
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(data)
+        os.replace(tmp, self.path)
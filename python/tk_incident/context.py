@@ -0,0 +1,127 @@
+from collections import OrderedDict
+
+
+class ContextBuffer(object):
+    """
+    Bounded per-file rings of the last bytes read from each log, so the
+    lines around a match go into the ticket description without reading the
+    (possibly huge, maybe rotated) log again.
+
+    Each ring holds at most per_file bytes, starting on a line boundary; all
+    rings together hold at most max_total bytes (the least recently fed
+    files are dropped first). around() takes up to before_lines lines before
+    a match from the chunk being read, then from the ring, and up to
+    after_lines lines after it from the chunk only (lines not written yet
+    are not waited for). Used by LogReader on the tail thread only.
+
+    The context captured for one delivered batch (one LogReader.read() or
+    flush(), see start_batch()) is capped at max_total bytes as well: in a
+    storm of matches only the first ones get their context, the others are
+    counted in `skipped`.
+    """
+
+    def __init__(self, before_lines=20, after_lines=5, per_file=16 * 1024, max_total=1024 * 1024):
+        self.before_lines = int(before_lines)
+        self.after_lines = int(after_lines)
+        self.per_file = int(per_file)
+        self.max_total = int(max_total)
+        self._rings = OrderedDict()  # key -> bytes
+        self.size = 0
+        self._batch_left = self.max_total
+
+        # counters
+        self.dropped = 0
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self._rings)
+
+    def feed(self, key, data, start, end):
+        """data[start:end] (complete lines) was consumed from key: keep its tail."""
+        if end <= start or self.per_file <= 0:
+            return
+        old = self._rings.pop(key, b"")
+        self.size -= len(old)
+        if end - start >= self.per_file:
+            ring = bytes(data[end - self.per_file:end])
+        else:
+            ring = old + bytes(data[start:end])
+        if len(ring) > self.per_file:
+            ring = ring[-self.per_file:]
+        if len(ring) == self.per_file:
+            # sliced mid-line: start at the next full line
+            ring = ring[ring.find(b"\n") + 1:]
+        self._rings[key] = ring
+        self.size += len(ring)
+        while self.size > self.max_total and self._rings:
+            _, dropped = self._rings.popitem(last=False)
+            self.size -= len(dropped)
+            self.dropped += 1
+
+    def forget(self, key):
+        self.size -= len(self._rings.pop(key, b""))
+
+    def _back(self, data, lo, end, count):
+        """(start, lines left): offset of the start of the last `count` lines in data[lo:end]."""
+        pos = end
+        while count and pos > lo:
+            nl = data.rfind(b"\n", lo, pos - 1)
+            if nl < 0:
+                pos = lo
+            else:
+                pos = nl + 1
+            count -= 1
+        return pos, count
+
+    def before(self, key, data, start, line_start):
+        """Up to before_lines lines ending at data[line_start] (from data[start:], then the ring)."""
+        if self.before_lines <= 0:
+            return b""
+        lo = max(start, line_start - self.per_file)
+        pos, left = self._back(data, lo, line_start, self.before_lines)
+        if pos == lo and lo > start:
+            # capped mid-line
+            pos = data.find(b"\n", lo, line_start) + 1 or line_start
+        text = bytes(data[pos:line_start])
+        if left and pos == start:
+            ring = self._rings.get(key, b"")
+            room = self.per_file - len(text)
+            if ring and room > 0:
+                ring_lo = max(len(ring) - room, 0)
+                ring_pos, _ = self._back(ring, ring_lo, len(ring), left)
+                if ring_pos == ring_lo and ring_lo > 0:
+                    ring_pos = ring.find(b"\n", ring_lo) + 1 or len(ring)
+                text = ring[ring_pos:] + text
+        return text
+
+    def after(self, data, end, cut):
+        """Up to after_lines complete lines from data[end:cut]."""
+        if self.after_lines <= 0 or end >= cut:
+            return b""
+        limit = min(cut, end + self.per_file)
+        pos = end
+        for _ in range(self.after_lines):
+            nl = data.find(b"\n", pos, limit)
+            if nl < 0:
+                break
+            pos = nl + 1
+        return bytes(data[end:pos])
+
+    def start_batch(self):
+        """A new batch of matches starts: its context gets max_total bytes again."""
+        self._batch_left = self.max_total
+
+    def around(self, key, data, start, line_start, end, cut):
+        """
+        (before, after) bytes for a match whose block spans data[line_start:end],
+        or None once the batch used up its share.
+        """
+        if self._batch_left <= 0:
+            self.skipped += 1
+            return None
+        before, after = self.before(key, data, start, line_start), self.after(data, end, cut)
+        self._batch_left -= len(before) + len(after)
+        return before, after
+
+    def stats(self):
+        return {"files": len(self._rings), "bytes": self.size, "dropped": self.dropped, "skipped": self.skipped}
@@ -0,0 +1,108 @@
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+
+# compression -> (opener, file extension)
+COMPRESSORS = {
+    "gzip": (gzip.open, ".gz"),
+    "lzma": (lzma.open, ".xz"),
+    "none": (open, ""),
+}
+
+_COPY_BUFSIZE = 64 * 1024
+
+
+def _copy_range(src, dst, start, end):
+    """Stream src[start:end] into dst."""
+    src.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        buf = src.read(min(_COPY_BUFSIZE, remaining))
+        if not buf:
+            break
+        dst.write(buf)
+        remaining -= len(buf)
+
+
+def _window_start(src, pos, floor, max_bytes, max_lines):
+    """Offset where the excerpt starts: a line start before pos, no further back than max_bytes."""
+    start = max(pos - max_bytes, floor)
+    if start == pos:
+        return pos
+    src.seek(start)
+    data = src.read(pos - start)
+    if start > floor:
+        # drop the partial first line
+        nl = data.find(b"\n")
+        start = pos if nl < 0 else start + nl + 1
+        data = data[nl + 1:] if nl >= 0 else b""
+    if max_lines is not None:
+        # data ends with the matched line: keep it plus max_lines before it
+        lines = data.split(b"\n")
+        keep = b"\n".join(lines[-(max_lines + 2):])
+        start = pos - len(keep)
+    return start
+
+
+def _window_end(src, pos, size, max_bytes, max_lines):
+    """Offset where the excerpt ends: a line end after pos, no further than max_bytes."""
+    end = min(pos + max_bytes, size)
+    if end == pos:
+        return pos
+    src.seek(pos)
+    data = src.read(end - pos)
+    if max_lines is not None:
+        lines = data.split(b"\n")
+        if len(lines) > max_lines:
+            return pos + len(b"\n".join(lines[:max_lines])) + 1
+    if end < size:
+        nl = data.rfind(b"\n")
+        return pos if nl < 0 else pos + nl + 1
+    return end
+
+
+def write_excerpt(log_path, pos, before_bytes=64 * 1024, after_bytes=16 * 1024, header_bytes=4 * 1024,
+                  before_lines=None, after_lines=None, compression="gzip"):
+    """
+    Write the log header plus a window around byte offset pos (the end of the
+    matched line) to a compressed temp file, and return its path.
+    The window is before_bytes/after_bytes wide, or before_lines/after_lines
+    lines (still capped by the byte sizes). The caller removes the file with
+    remove_excerpt().
+    """
+    opener, ext = COMPRESSORS.get(compression, COMPRESSORS["gzip"])
+    size = os.path.getsize(log_path)
+    pos = min(max(int(pos or 0), 0), size)
+
+    tmp_dir = tempfile.mkdtemp(prefix="tk-incident-")
+    stem = os.path.splitext(os.path.basename(log_path))[0]
+    out_path = os.path.join(tmp_dir, f"{stem}.excerpt-{pos}.log{ext}")
+
+    with open(log_path, "rb") as src:
+        header = src.read(min(header_bytes, size))
+        if len(header) < size:
+            nl = header.rfind(b"\n")
+            header = header[:nl + 1] if nl >= 0 else b""
+        header_end = len(header)
+
+        if pos <= header_end:
+            # match inside the header: it is already in the excerpt
+            start = header_end
+        else:
+            start = _window_start(src, pos, header_end, before_bytes, before_lines)
+        end = max(_window_end(src, pos, size, after_bytes, after_lines), start)
+
+        with opener(out_path, "wb") as dst:
+            dst.write(header)
+            if start > header_end:
+                dst.write(b"\n... [%d bytes skipped] ...\n\n" % (start - header_end))
+            _copy_range(src, dst, start, end)
+            if end < size:
+                dst.write(b"\n... [%d more bytes, log size %d] ...\n" % (size - end, size))
+    return out_path
+
+
+def remove_excerpt(path):
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
@@ -0,0 +1,155 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from .assembler import parse_traceback
+
+
+# key:   stable id of the incident, used for throttling / de-dup
+# label: human readable part of the ticket title ("ValueError", "disk full at <path>")
+Fingerprint = namedtuple("Fingerprint", "key label")
+
+MEMO_SIZE = 8192
+LABEL_MAX_LEN = 80
+
+# "2026-01-14 19:49:11,961 [ 2764 ERROR sgtk.env...] message" -> "message"
+_PREFIX_RE = re.compile(r"^\s*(?:\d{4}-\d{2}-\d{2}[ T]\d{1,2}:\d{2}:\d{2}(?:[,.]\d+)?\s*)?(?:\[[^\]]*\]\s*)?")
+_EXC_RE = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*(?:Error|Exception))\b")
+_PATH_RE = re.compile(r"(?<![\w.$~:+-])[\w.$~:+-]*(?:[\\/][\w.$~:+-]*)+")
+
+
+def _path_token(m):
+    # absolute / home / relative-to-dot / drive paths, or at least two separators ("a/b/c"), not "and/or"
+    s = m.group()
+    c = s[0]
+    if c in "/\\~." or s[1:2] == ":" or s.count("/") + s.count("\\") >= 2:
+        return "<path>"
+    return s
+
+
+# volatile parts of a message, in the order they are replaced: (needle, regex, replacement).
+# A normalizer only runs when its needle is in the text (None = always), the substring
+# test being much cheaper than a regex scan that finds nothing.
+_NORMALIZERS = (
+    ("-", re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<uuid>"),
+    ("0x", re.compile(r"\b0x[0-9a-fA-F]+\b"), "<addr>"),
+    # balanced quotes only, not inside words: the apostrophe in "can't open" opens nothing
+    ("\"", re.compile(r"(?<!\w)\"[^\"\n]*\"(?!\w)"), "<str>"),
+    ("'", re.compile(r"(?<!\w)'[^'\n]*'(?!\w)"), "<str>"),
+    ("://", re.compile(r"\b[A-Za-z][\w+.-]*://[^\s\"']+"), "<url>"),
+    ("/", _PATH_RE, _path_token),
+    ("\\", _PATH_RE, _path_token),
+    (None, re.compile(r"\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b"), "<hex>"),
+    (None, re.compile(r"[-+]?\d+(?:\.\d+)?"), "<n>"),
+)
+
+
+def strip_prefix(line):
+    """Drop the leading timestamp and [pid LEVEL logger] block of a log record."""
+    return _PREFIX_RE.sub("", line or "", count=1)
+
+
+def normalize(text):
+    """Replace uuids, addresses, quoted values, urls, paths, hex ids and numbers with placeholders."""
+    for needle, regex, replacement in _NORMALIZERS:
+        if needle is None or needle in text:
+            text = regex.sub(replacement, text)
+    return " ".join(text.split())
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class _Memo(object):
+    """
+    Thread-safe LRU of fingerprints keyed by (message without its timestamp
+    prefix, short digest of the stack): repeats of a message hit even though
+    every log record has its own timestamp, and an entry never holds on to
+    the (up to 64 KB) stack itself.
+    """
+
+    def __init__(self, max_size=MEMO_SIZE):
+        self.max_size = int(max_size)
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            fp = self._items.get(key)
+            if fp is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return fp
+
+    def put(self, key, fp):
+        with self._lock:
+            self._items[key] = fp
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+_memo = _Memo()
+
+
+def fingerprint(line, stack=None):
+    """
+    Fingerprint of a matched line (and its traceback, if any). Lines that only
+    differ in numbers, paths, ids or quoted values get the same fingerprint.
+
+      - traceback: label = raised exception, key = exception + frame list
+      - exception name in the line: label = key source = exception name
+      - otherwise: label = normalized message (timestamp/prefix removed)
+    """
+    core = strip_prefix(line)
+    key = (core, hashlib.blake2b(stack.encode("utf-8", "replace"), digest_size=16).digest() if stack else None)
+    fp = _memo.get(key)
+    if fp is None:
+        fp = _compute(core, stack)
+        _memo.put(key, fp)
+    return fp
+
+
+def fingerprint_uncached(line, stack=None):
+    """fingerprint() without the memo (benchmarks)."""
+    return _compute(strip_prefix(line), stack)
+
+
+def _compute(core, stack):
+    if stack:
+        exc, frames = parse_traceback(stack)
+        if frames:
+            label = exc or _exception_label(core) or "Traceback"
+            key = "|".join([label] + ["%s:%s" % f for f in frames])
+            return Fingerprint(_digest(key), label)
+    label = _exception_label(core)
+    if not label:
+        label = normalize(core)[:LABEL_MAX_LEN].rstrip() or "Unknown error"
+    return Fingerprint(_digest(label), label)
+
+
+def _exception_label(text):
+    m = _EXC_RE.search(text)
+    return m.group(1) if m else None
+
+
+def memo_stats():
+    """Counters of the fingerprint memo."""
+    return _memo.stats()
+
+
+def memo_clear():
+    _memo.clear()
@@ -0,0 +1,237 @@
+import os
+import json
+import socket
+import time
+from collections import deque
+
+from sgtk.util.qt_importer import QtImporter
+imp = QtImporter()
+QtCore, QtGui, QtNetwork = imp.QtCore, imp.QtGui, imp.QtNetwork
+
+from .tail_worker import TailWorker
+from .fingerprint import fingerprint
+from .metrics import Metrics
+from .tail_config import TailConfig
+
+STREAM = "forward"
+
+
+class EventForwarder(object):
+    """
+    Client side of the "forward" stream of a SingletonLock: one compact JSON
+    line per incident to the process holding the lock.
+
+    Events sent while no primary is connected are kept (up to max_backlog,
+    oldest dropped) and go out on the next connect(). Sent events stay
+    pending until the primary acknowledges them; when the connection drops
+    the pending ones are sent again (to the next primary, or handled by
+    whoever takes over, see drain()).
+    """
+
+    def __init__(self, name, max_backlog=1000, timeout_ms=150):
+        self.name = name
+        self.timeout_ms = int(timeout_ms)
+        self._sock = None
+        self._backlog = deque(maxlen=max(int(max_backlog), 1))
+        self._unacked = deque()  # sent, not acknowledged yet
+
+        # counters
+        self.sent = 0
+        self.connects = 0
+        self.dropped = 0
+
+    def connected(self):
+        return self._sock is not None and self._sock.state() == QtNetwork.QLocalSocket.LocalSocketState.ConnectedState
+
+    def connect(self):
+        """(Re)connect to the primary and flush the backlog. False if nobody holds the lock."""
+        if self.connected():
+            return True
+        self._lost()
+        sock = QtNetwork.QLocalSocket()
+        sock.connectToServer(self.name)
+        if not sock.waitForConnected(self.timeout_ms):
+            sock.abort()
+            return False
+        sock.write((STREAM + "\n").encode("utf-8"))
+        self._sock = sock
+        self.connects += 1
+        events = list(self._backlog)
+        self._backlog.clear()
+        for event in events:
+            self._write(event)
+        sock.flush()
+        return True
+
+    def _read_acks(self):
+        while self._sock.canReadLine():
+            reply = bytes(self._sock.readLine()).decode("utf-8", "replace").split()
+            if len(reply) == 2 and reply[0] == "ack":
+                for _ in range(min(int(reply[1]), len(self._unacked))):
+                    self._unacked.popleft()
+
+    def _lost(self):
+        """Drop a dead connection; what it did not deliver goes back to the backlog."""
+        if self._sock is None:
+            return
+        self._read_acks()
+        self._sock.abort()
+        self._sock = None
+        self._backlog.extendleft(reversed(self._unacked))
+        self._unacked.clear()
+
+    def _write(self, event):
+        line = json.dumps(event, separators=(",", ":"), default=str) + "\n"
+        self._sock.write(line.encode("utf-8"))
+        self._unacked.append(event)
+        self.sent += 1
+
+    def send(self, event):
+        """Send one event, or keep it for later. False if it was not sent."""
+        if self._sock is not None:
+            self._read_acks()
+        if self.connected():
+            self._write(event)
+            self._sock.flush()
+            return True
+        if len(self._backlog) == self._backlog.maxlen:
+            self.dropped += 1
+        self._backlog.append(event)
+        return False
+
+    def poll(self):
+        """Read acknowledgements (keeps the pending list short when idle)."""
+        if self._sock is not None:
+            self._read_acks()
+
+    def drain(self):
+        """Take everything not known to be delivered (list of events), e.g. to handle it here."""
+        self._lost()
+        events = list(self._backlog)
+        self._backlog.clear()
+        return events
+
+    def close(self):
+        """Disconnect; what was not acknowledged stays pending (see drain())."""
+        if self._sock is not None:
+            self._read_acks()
+            self._sock.flush()
+            self._sock.disconnectFromServer()
+            self._sock = None
+            self._backlog.extendleft(reversed(self._unacked))
+            self._unacked.clear()
+
+    def stats(self):
+        return {"connected": self.connected(), "sent": self.sent, "unacked": len(self._unacked),
+                "backlog": len(self._backlog),
+                "connects": self.connects, "dropped": self.dropped}
+
+
+class ForwardingController(QtCore.QObject):
+    """
+    Secondary instance (another process holds the SingletonLock): tails and
+    matches like AgentController, but hands every incident to the primary
+    through an EventForwarder instead of spooling and uploading it here, so
+    dedup, throttling and uploads happen once per host.
+
+    Only the tailing half is built here (TailConfig: sources, matchers, tail
+    options) with its own in-memory metrics: no pipeline, spool, checkpoints,
+    title cache or metrics file, which the primary owns.
+    primary_lost is emitted when the primary cannot be reached; the owner
+    then either takes the lock over (stop(), take_backlog(), start an
+    AgentController) or calls reconnect() later.
+    """
+    primary_lost = QtCore.Signal()
+
+    def __init__(self, logger, lock_name, settings=None, check_ms=2000):
+        super(ForwardingController, self).__init__()
+        self.logger = logger
+        self.settings = settings or {}
+        self.metrics = Metrics()
+        self.tail = TailConfig(logger, self.settings, self.metrics)
+        self.host = socket.gethostname()
+        self.origin = "%s:%d" % (self.host, os.getpid())
+        self.forwarder = EventForwarder(lock_name, max_backlog=int(self.settings.get("forward_backlog", 1000)))
+        self.metrics.gauge("forward", self.forwarder.stats)
+        self.worker = None
+        self._check_ms = int(check_ms)
+        self._timer = None
+
+    def start(self):
+        self.worker = TailWorker(**self.tail.tail_options(checkpoints=False))
+        if self.tail.batch:
+            self.worker.lines_matched.connect(self._on_lines)
+        else:
+            self.worker.line_detected.connect(self._on_line)
+        self.worker.start()
+        self.reconnect()
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self._check)
+        self._timer.start(self._check_ms)
+
+    def reconnect(self):
+        if self.forwarder.connect():
+            self.logger.debug("Forwarding incidents to the primary instance")
+            return True
+        return False
+
+    def take_backlog(self):
+        """Events the primary may not have got, to be handled by whoever takes over."""
+        return self.forwarder.drain()
+
+    def stop(self):
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+        if self.worker:
+            self.worker.stop()
+            self.worker.wait(2000)
+            self.logger.debug("Tail worker stats: %s", self.worker.stats())
+            self.worker = None
+            # blocks the tailer flushed on its way out are still queued for _on_lines
+            QtCore.QCoreApplication.sendPostedEvents(self)
+        self.forwarder.close()
+
+    def metrics_json(self):
+        return json.dumps(self.metrics.snapshot(), sort_keys=True)
+
+    # ---------------------------
+    # forwarding
+    # ---------------------------
+    def _check(self):
+        if self.forwarder.connected():
+            self.forwarder.poll()
+        elif not self.reconnect():
+            self.primary_lost.emit()
+
+    def _forward(self, path, pos, matched, now, source=None, inode=None):
+        # same signature the primary computes for its own hits
+        sig = fingerprint(matched.get("matched_line") or "", matched.get("stack")).key
+        matched.setdefault("host", self.host)
+        event = {"path": path, "inode": inode, "pos": pos, "ts": now, "sig": sig, "source": source,
+                 "origin": self.origin, "matched": matched}
+        self.metrics.inc("incidents.matched")
+        if not self.forwarder.send(event):
+            # kept until the next _check() reconnects or someone takes over
+            self.metrics.inc("forward.deferred")
+
+    @QtCore.Slot(object)
+    def _on_line(self, payload):
+        try:
+            matcher = self.tail.matchers.get(payload.get("source"), self.tail.matcher)
+            matched = matcher.match(payload["line"], payload["path"])
+            if matched:
+                self._forward(payload["path"], payload.get("pos", 0), matched, payload.get("ts", time.time()),
+                              payload.get("source"), payload.get("inode"))
+        except Exception:
+            self.logger.exception("Error forwarding detected line.")
+
+    @QtCore.Slot(object)
+    def _on_lines(self, batch):
+        now = batch.get("ts", time.time())
+        for pos, matched in batch["hits"]:
+            try:
+                self._forward(batch["path"], pos, matched, now, batch.get("source"), batch.get("inode"))
+            except Exception:
+                self.logger.exception("Error forwarding detected line.")
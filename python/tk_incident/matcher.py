@@ -1,16 +1,178 @@
+import os
 import re
+from collections import namedtuple
+
+
+Rule = namedtuple("Rule", "name kind level literal regex compiled word engines exclude_engines")
+
+
+def _trie_pattern(node):
+    """Regex for a literal trie: one branch per distinct next character."""
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:%s)" % "|".join(branches)
+    if "" in node:
+        body = "(?:%s)?" % body
+    return body
+
+
+def literal_branches(words, word_bounded=False):
+    """
+    Compile literals into a prefix tree, returned as one alternative per first
+    character. Every alternative starts with a plain literal, which lets the
+    regex engine skip positions that can't start any rule, so the cost per
+    position does not grow with the number of literals.
+    For word-bounded literals the leading boundary is checked by a lookbehind
+    right after the first character, so it doesn't defeat that optimization.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    branches = []
+    for ch, child in sorted(trie.items()):
+        if not ch:
+            continue
+        if word_bounded:
+            branches.append(r"%s(?<!\w.)%s\b" % (re.escape(ch), _trie_pattern(child)))
+        else:
+            branches.append(re.escape(ch) + _trie_pattern(child))
+    return branches
+
+
+def engine_from_path(path):
+    """'.../tk-maya.log' -> 'tk-maya'"""
+    if not path:
+        return None
+    return os.path.splitext(os.path.basename(path))[0]
 
 
 class Matcher(object):
     """
-    detect ERROR/CRITICAL only.
+    Rule based incident detector.
+
+    All rules are compiled into a single combined regex (literal rules as a
+    prefix tree, regex rules as extra alternatives) so every line is scanned
+    once whatever the number of rules. match() reports which rule fired.
+
+    settings["matcher"] (all optional):
+      - levels: severity words, default ["ERROR", "CRITICAL"]
+      - exceptions: exception class names, e.g. ["MemoryError"]
+      - rules: list of {name, literal | regex, level, engines, exclude_engines}
+      - include_engines / exclude_engines: engine names (log file stem, e.g. "tk-maya")
+      - suppress: regexes; matching lines are ignored (allow-list)
     """
+
     def __init__(self, settings=None):
         self.settings = settings or {}
-        self.severity_re = re.compile(r"\b(ERROR|CRITICAL)\b")
+        cfg = self.settings.get("matcher") or {}
 
-    def match(self, line):
-        m = self.severity_re.search(line)
-        if m:
-            return {"reason": "severity", "level": m.group(1), "matched_line": line}
-        return None
+        self.rules = self._build_rules(cfg)
+        self.include_engines = set(cfg.get("include_engines") or [])
+        self.exclude_engines = set(cfg.get("exclude_engines") or [])
+        suppress = cfg.get("suppress") or []
+        self.suppress_re = re.compile("|".join("(?:%s)" % s for s in suppress)) if suppress else None
+
+        self._literal_rules = {}
+        self._compiled = {}  # engine -> compiled combined regex (None = no rule applies)
+        self.pattern = self._compile(self.rules)
+
+        # bytes version for the tail reader: lines that can't match are never decoded
+        self.prefilter = None
+        if self.pattern is not None:
+            try:
+                self.prefilter = re.compile(self.pattern.pattern.encode("utf-8"))
+            except (re.error, UnicodeError):
+                self.prefilter = None
+
+    def _build_rules(self, cfg):
+        rules = []
+        for level in cfg.get("levels") or ["ERROR", "CRITICAL"]:
+            rules.append(Rule("severity", "severity", None, level, None, None, True, None, None))
+        for exc in cfg.get("exceptions") or []:
+            rules.append(Rule(exc, "exception", "ERROR", exc, None, None, True, None, None))
+        for i, item in enumerate(cfg.get("rules") or []):
+            name = item.get("name") or "rule%d" % i
+            literal = item.get("literal")
+            compiled = None if literal else re.compile(item["regex"])
+            rules.append(Rule(
+                name,
+                "pattern",
+                item.get("level", "ERROR"),
+                literal,
+                compiled.pattern if compiled else None,
+                compiled,
+                bool(item.get("word", False)),
+                set(item["engines"]) if item.get("engines") else None,
+                set(item["exclude_engines"]) if item.get("exclude_engines") else None,
+            ))
+        return rules
+
+    def _compile(self, rules):
+        word, plain, alternatives = [], [], []
+        for rule in rules:
+            if rule.literal:
+                (word if rule.word else plain).append(rule.literal)
+                self._literal_rules.setdefault(rule.literal, rule)
+        alternatives.extend(literal_branches(word, word_bounded=True))
+        alternatives.extend(literal_branches(plain))
+        alternatives.extend("(?:%s)" % rule.regex for rule in rules if rule.regex)
+        if not alternatives:
+            return None
+        return re.compile("|".join(alternatives))
+
+    def _pattern_for(self, engine):
+        if engine is None:
+            return self.pattern
+        try:
+            return self._compiled[engine]
+        except KeyError:
+            pass
+        rules = [
+            r for r in self.rules
+            if (r.engines is None or engine in r.engines)
+            and (r.exclude_engines is None or engine not in r.exclude_engines)
+        ]
+        compiled = self.pattern if len(rules) == len(self.rules) else self._compile(rules)
+        self._compiled[engine] = compiled
+        return compiled
+
+    def _rule_for(self, m, line):
+        """Which rule produced m (only runs on hits)."""
+        rule = self._literal_rules.get(m.group())
+        if rule is not None:
+            return rule
+        for rule in self.rules:
+            if rule.regex and rule.compiled.match(line, m.start()):
+                return rule
+        return self.rules[0]
+
+    def engine_allowed(self, engine):
+        if engine is None:
+            return True
+        if self.include_engines and engine not in self.include_engines:
+            return False
+        return engine not in self.exclude_engines
+
+    def match(self, line, path=None):
+        engine = engine_from_path(path)
+        if not self.engine_allowed(engine):
+            return None
+        pattern = self._pattern_for(engine)
+        if pattern is None:
+            return None
+        m = pattern.search(line)
+        if not m:
+            return None
+        if self.suppress_re is not None and self.suppress_re.search(line):
+            return None
+        rule = self._rule_for(m, line)
+        return {
+            "reason": rule.kind,
+            "rule": rule.name,
+            "level": rule.level or m.group(),
+            "matched_line": line,
+        }
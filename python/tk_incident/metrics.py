@@ -0,0 +1,145 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# latency buckets (seconds), roughly x2 apart: 0.5ms .. 2min, the last one catches everything above
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, float("inf"),
+)
+
+
+class Histogram(object):
+    """Fixed-bucket histogram: O(1) observe, quantiles approximated by bucket upper bounds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics(object):
+    """
+    Small thread-safe metrics registry: counters, gauges and latency histograms.
+
+    Counters and histograms are updated in place (one lock, no allocation);
+    gauges and counter_fn() counters are callables evaluated only when a
+    snapshot is taken, so components that already count things (LogReader,
+    the spool, ...) are read instead of double counted.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._counter_fns = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = Histogram()
+            hist.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the block into histogram `name`; failures are counted in `<name>.errors` as well."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(name + ".errors")
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def gauge(self, name, fn):
+        """Register a callable returning the current value of `name`."""
+        self._gauges[name] = fn
+
+    def counter_fn(self, name, fn):
+        """Register a callable returning an ever-increasing count kept elsewhere."""
+        self._counter_fns[name] = fn
+
+    @staticmethod
+    def _read(fns):
+        values = {}
+        for name, fn in fns.items():
+            try:
+                values[name] = fn()
+            except Exception:
+                values[name] = None
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {name: hist.snapshot() for name, hist in self._histograms.items()}
+        counters.update(self._read(self._counter_fns))
+        return {
+            "ts": time.time(),
+            "uptime_sec": time.time() - self.started,
+            "counters": counters,
+            "gauges": self._read(self._gauges),
+            "histograms": histograms,
+        }
+
+    @staticmethod
+    def rates(previous, current):
+        """Per-second rate of every counter between two snapshots."""
+        elapsed = current["ts"] - previous["ts"]
+        if elapsed <= 0:
+            return {}
+        return {
+            name: (value - (previous["counters"].get(name) or 0)) / elapsed
+            for name, value in current["counters"].items()
+            if isinstance(value, (int, float))
+        }
+
+    def dump(self, path):
+        """Write a snapshot as JSON (atomically)."""
+        data = json.dumps(self.snapshot(), indent=1, sort_keys=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class OccurrenceAggregator(object):
+    """
+    Thread-safe per-title tally of incident occurrences that did not create
+    a ticket (dropped by cooldown / burst / blackout, or the ticket already
+    existed): count, first / last seen and the hosts they came from. drain()
+    hands the tally to a periodic flush that updates the existing tickets in
+    one sg.batch, so an error storm costs a constant number of FPTR calls per
+    flush interval.
+
+    At most max_keys titles are kept (LRU, least recently seen evicted and
+    counted) and at most max_hosts host names per title.
+    """
+
+    def __init__(self, max_keys=1024, max_hosts=20):
+        self.max_keys = max(int(max_keys), 1)
+        self.max_hosts = int(max_hosts)
+        self._items = OrderedDict()  # title -> entry dict, see _entry()
+        self._lock = threading.Lock()
+
+        # counters
+        self.recorded = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def _entry(title, now):
+        return {"title": title, "count": 0, "first_seen": now, "last_seen": now, "hosts": [], "flushes": 0}
+
+    def add(self, title, now=None, host=None, count=1, first_seen=None):
+        """count occurrences of title, the last one at now (the first at first_seen, default now)."""
+        now = time.time() if now is None else now
+        first_seen = now if first_seen is None else first_seen
+        with self._lock:
+            entry = self._items.get(title)
+            if entry is None:
+                entry = self._items[title] = self._entry(title, now)
+                if len(self._items) > self.max_keys:
+                    self._items.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._items.move_to_end(title)
+            entry["count"] += count
+            entry["first_seen"] = min(entry["first_seen"], first_seen)
+            entry["last_seen"] = max(entry["last_seen"], now)
+            if host and host not in entry["hosts"] and len(entry["hosts"]) < self.max_hosts:
+                entry["hosts"].append(host)
+            self.recorded += count
+
+    def drain(self):
+        """Take all pending entries (list of dicts), leaving the tally empty."""
+        with self._lock:
+            entries = list(self._items.values())
+            self._items.clear()
+        return entries
+
+    def restore(self, entries):
+        """Put back entries a flush could not apply (merged with what came in meanwhile)."""
+        with self._lock:
+            for old in entries:
+                entry = self._items.get(old["title"])
+                if entry is None:
+                    if len(self._items) >= self.max_keys:
+                        self.evicted += 1
+                        continue
+                    self._items[old["title"]] = dict(old, hosts=list(old["hosts"]))
+                    self._items.move_to_end(old["title"], last=False)
+                    continue
+                entry["count"] += old["count"]
+                entry["first_seen"] = min(entry["first_seen"], old["first_seen"])
+                entry["last_seen"] = max(entry["last_seen"], old["last_seen"])
+                entry["flushes"] = max(entry["flushes"], old["flushes"])
+                for host in old["hosts"]:
+                    if host not in entry["hosts"] and len(entry["hosts"]) < self.max_hosts:
+                        entry["hosts"].append(host)
+
+    def stats(self):
+        return {"pending": len(self._items), "recorded": self.recorded, "evicted": self.evicted}
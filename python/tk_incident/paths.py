@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+APP_CACHE_NAME = "tk-incidentreporter"
+# held by the one agent (Desktop or headless) that owns the spool and checkpoints of a cache folder
+LOCK_FILE = "tk_incident_agent.lock"
+
+
+def cache_dir():
+    """
+    Per-user cache folder for this app, under the Toolkit cache root
+    (falls back to the temp dir when sgtk can't tell).
+    """
+    try:
+        from sgtk.util import LocalFileStorageManager
+        root = LocalFileStorageManager.get_global_root(LocalFileStorageManager.CACHE)
+    except Exception:
+        root = os.path.join(tempfile.gettempdir(), "tk-cache")
+    path = os.path.join(root, APP_CACHE_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def agent_lock_path():
+    """The lock file that makes one agent the primary for this cache folder (see FileLock)."""
+    return os.path.join(cache_dir(), LOCK_FILE)
@@ -0,0 +1,571 @@
+import os
+import json
+import socket
+import time
+import threading
+from collections import deque
+
+import sgtk
+
+from .uploader import Uploader
+from .fingerprint import fingerprint, memo_stats
+from .metrics import Metrics
+from .occurrences import OccurrenceAggregator
+from .spool import MemorySpool, UploadSpool
+from .tail_config import TailConfig
+from .throttle import FloodGuard, SeenBlocks
+from .paths import cache_dir
+from .ratecontrol import CLOSED, RateController
+
+# upload priority = 2 * severity rank + 1 if the signature is new (no ticket known, never spooled)
+SEVERITY_RANK = {"CRITICAL": 3, "FATAL": 3, "ERROR": 2, "WARNING": 1}
+
+
+class IncidentPipeline(object):
+    """
+    Qt-free incident pipeline, shared by the Desktop app (AgentController)
+    and the headless runtime:
+    - per-signature burst detection + blacklist
+    - async uploader via durable spool + upload workers; the spool is a
+      priority queue (severity, then novelty) that evicts its lowest value
+      items when full, and the global upload budget is spent when items are
+      taken out of it, highest priority first
+    - adaptive rate control (AIMD on rate and concurrency, jittered backoff,
+      circuit breaker) driven by FPTR latency and errors
+    - occurrence tally of dropped duplicates, flushed to existing tickets
+      every occurrence_flush_sec
+    - metrics registry shared with the tailer and uploader
+    - incidents forwarded by secondary instances on this host
+      (on_forwarded()); a block seen both here and there is handled once
+
+    Matched lines come in through on_line() / on_lines(); the caller owns the
+    tailer (see tail_options() / TailConfig) and how upload workers are scheduled: threads
+    (start_workers()) or its own loop around upload_step().
+
+    Nothing here talks to FPTR on the caller's thread: the project check, user
+    and schema lookups and the title prefetch run once on an upload worker
+    (initialize()), while the tailer is already running; incidents found
+    meanwhile wait in the spool. Startup timings are in the "startup" metric.
+    """
+
+    def __init__(self, logger, shotgun, settings=None, connection_factory=None):
+        self.logger = logger
+        self.shotgun = shotgun
+        self.settings = settings or {}
+        self._connection_factory = connection_factory  # callable -> FPTR connection for an upload worker
+        self.metrics = Metrics()
+        self._last_metrics = None
+
+        # startup: FPTR checks happen on an upload worker, see initialize()
+        self._created = time.perf_counter()
+        self._startup = {}
+        self.metrics.gauge("startup", lambda: dict(self._startup))
+        self.ready = threading.Event()
+        self.disabled = False  # project missing / not accessible
+        self._init_lock = threading.Lock()
+        self._init_attempts = 0
+
+        # Flood protection params
+        self.cooldown_sec = int(self.settings.get("cooldown_sec", 60))  # per-signature cooldown (not primary here)
+        self.window_sec = 60
+        self.max_uploads_per_window = int(self.settings.get("max_uploads_per_minute", 10))
+
+        # Burst detection params
+        self.burst_threshold = int(self.settings.get("burst_threshold", 5))      # occurrences
+        self.burst_window = int(self.settings.get("burst_window", 10))           # seconds
+        self.blackout_period = int(self.settings.get("blackout_period", 300))   # seconds
+
+        # State
+        self._guard = FloodGuard(                # per-signature cooldown / burst / blacklist, bounded LRU
+            cooldown=self.cooldown_sec,
+            burst_threshold=self.burst_threshold,
+            burst_window=self.burst_window,
+            blackout=self.blackout_period,
+            max_keys=int(self.settings.get("throttle_max_signatures", 4096)),
+            sketch=bool(self.settings.get("burst_sketch", False)),
+        )
+        self._upload_timestamps = deque()        # global upload budget: start of each upload in the window
+        self._blocks = SeenBlocks(               # blocks tailed here and by a secondary instance: handled once
+            ttl=float(self.settings.get("forward_dedup_sec", 60)),
+            max_keys=int(self.settings.get("forward_dedup_keys", 4096)),
+        )
+        self._budget_lock = threading.Lock()
+
+        # spool retry params
+        self.retry_base = float(self.settings.get("upload_retry_base_sec", 10))
+        self.retry_max = float(self.settings.get("upload_retry_max_sec", 600))
+        self.max_attempts = int(self.settings.get("upload_max_attempts", 20))
+        self.replay_batch = int(self.settings.get("spool_batch_size", 20))
+
+        # occurrences of incidents that did not create a ticket; one batched flush per interval
+        self.host = socket.gethostname()
+        self.origin = "%s:%d" % (self.host, os.getpid())  # tells our own hits from forwarded ones
+        self.occurrence_interval = float(self.settings.get("occurrence_flush_sec", 60))
+        self.occurrences = None
+        if self.occurrence_interval > 0:
+            self.occurrences = OccurrenceAggregator(max_keys=int(self.settings.get("occurrence_max_signatures", 1024)))
+            self.metrics.gauge("occurrences.pending", lambda: len(self.occurrences))
+            self.metrics.counter_fn("occurrences.recorded", lambda: self.occurrences.recorded)
+            self.metrics.counter_fn("occurrences.evicted", lambda: self.occurrences.evicted)
+        self._next_occurrence_flush = time.time() + self.occurrence_interval
+        self._occurrence_lock = threading.Lock()
+
+        # adaptive upload rate: max_uploads_per_minute and upload_workers are the ceilings
+        self.upload_workers = max(int(self.settings.get("upload_workers", 2)), 1)
+        self.rate = RateController(
+            max_rate=self.max_uploads_per_window,
+            min_rate=float(self.settings.get("min_uploads_per_minute", 1)),
+            max_concurrency=self.upload_workers,
+            latency_target=float(self.settings.get("fptr_latency_target_sec", 2)),
+            adjust_interval=float(self.settings.get("rate_adjust_sec", 10)),
+            failure_threshold=int(self.settings.get("breaker_failures", 5)),
+            open_base=float(self.settings.get("breaker_pause_sec", 30)),
+            open_max=float(self.settings.get("breaker_pause_max_sec", 600)),
+            logger=self.logger,
+        )
+        self.metrics.gauge("rate.state", self.rate.state)
+
+        # uploader and async spool; each upload worker gets its own FPTR connection
+        self.uploader = Uploader(shotgun=self.shotgun, logger=self.logger, settings=self.settings, metrics=self.metrics,
+                                 occurrences=self.occurrences, rate_control=self.rate)
+        self._spool = self._open_spool()
+        self.metrics.gauge("spool.depth", lambda: len(self._spool))
+        self.metrics.gauge("spool.depth_by_priority", lambda: self._spool.depths())
+        self.metrics.counter_fn("spool.evicted", lambda: self._spool.evicted)
+        self.metrics.counter_fn("guard.evicted", lambda: self._guard.evicted)
+        self.metrics.gauge("guard.signatures", lambda: len(self._guard))
+        self._uploader_running = True
+        self._uploader_workers = []
+
+        # other
+        self.tail = TailConfig(self.logger, self.settings, self.metrics)
+        self.matcher = self.tail.matcher
+        self.batch = self.tail.batch
+        self.matchers = self.tail.matchers
+
+    def _open_spool(self):
+        max_items = int(self.settings.get("spool_max_items", 1000))
+        max_age = float(self.settings.get("spool_max_age_hours", 72)) * 3600
+        if self.settings.get("spool", True):
+            try:
+                spool = UploadSpool(os.path.join(cache_dir(), "upload_spool.sqlite"), max_items, max_age)
+                replay = len(spool)
+                if replay:
+                    spool.release_leases()
+                    self.logger.info("Replaying %d spooled uploads", replay)
+                return spool
+            except Exception:
+                self.logger.warning("Cannot open upload spool, uploads are kept in memory only", exc_info=True)
+        return MemorySpool(max_items, max_age)
+
+    def sources(self):
+        """LogSources for a Tailer, one per configured source."""
+        return self.tail.sources()
+
+    def tail_options(self):
+        """Keyword arguments for a Tailer (or TailWorker) feeding this pipeline."""
+        return self.tail.tail_options()
+
+    @property
+    def metrics_interval(self):
+        return float(self.settings.get("metrics_interval_sec", 300))
+
+    def start_workers(self):
+        """Run the upload workers as daemon threads."""
+        self._uploader_workers = [
+            threading.Thread(target=self._uploader_worker, args=(i,), name="tk-incident-upload-%d" % i, daemon=True)
+            for i in range(self.upload_workers)
+        ]
+        for thread in self._uploader_workers:
+            thread.start()
+
+    def wakeup(self):
+        self._spool.wakeup.set()
+
+    def stop(self, timeout=2.0, busy=False):
+        """
+        Stop the upload workers and flush state; items not uploaded yet stay
+        in the spool. busy: uploads are still running outside start_workers()
+        threads, keep the spool open.
+        """
+        self.logger.debug("Fingerprint memo stats: %s", memo_stats())
+        self.logger.debug("Flood guard stats: %s", self._guard.stats())
+        self._uploader_running = False
+        self.wakeup()
+        deadline = time.time() + timeout
+        for thread in self._uploader_workers:
+            thread.join(timeout=max(deadline - time.time(), 0))
+        if self.occurrences is not None and len(self.occurrences) and self.ready.is_set() and not busy:
+            self.flush_occurrences(self.uploader, force=True)
+        self.uploader.close()
+        if self._spool.evicted:
+            self.logger.warning("Upload spool evicted %d items this session", self._spool.evicted)
+        self.dump_metrics()
+        if not busy and not any(thread.is_alive() for thread in self._uploader_workers):
+            self._spool.close()
+
+    # ---------------------------
+    # metrics
+    # ---------------------------
+    def metrics_json(self):
+        """Current metrics as JSON (also served over the singleton socket)."""
+        return json.dumps(self.metrics.snapshot(), sort_keys=True)
+
+    def mark_metrics(self):
+        """Start the window the next dump_metrics() computes rates over."""
+        self._last_metrics = self.metrics.snapshot()
+
+    def dump_metrics(self):
+        """Log the metrics with per-second rates since the last dump; optionally write them to JSON."""
+        try:
+            snap = self.metrics.snapshot()
+            if self._last_metrics is not None:
+                snap["rates"] = {k: round(v, 2) for k, v in Metrics.rates(self._last_metrics, snap).items() if v}
+            self._last_metrics = snap
+            self.logger.debug("Metrics: %s", json.dumps(snap, sort_keys=True))
+            if self.settings.get("metrics_file", False):
+                self.metrics.dump(os.path.join(cache_dir(), "metrics.json"))
+        except Exception:
+            self.logger.debug("Cannot dump metrics", exc_info=True)
+
+    # ---------------------------
+    # signature & burst helpers
+    # ---------------------------
+    def _make_signature(self, text, stack=None):
+        # same fingerprint the uploader titles tickets with
+        return fingerprint(text or "", stack).key
+
+    def _is_blacklisted(self, sig, now):
+        return self._guard.is_blacklisted(sig, now)
+
+    def _record_sig_hit_and_check_burst(self, sig, now):
+        if self._guard.hit(sig, now):
+            self.logger.warning(
+                "Signature %s entered blackout until %s due to burst", sig, self._guard.blackout_until(sig)
+            )
+            return True
+        return False
+
+    def _priority(self, matched, sig, title):
+        """Upload priority (see SEVERITY_RANK): severity first, a new signature beats a repeat."""
+        rank = SEVERITY_RANK.get(str(matched.get("level", "ERROR")).upper(), 2)
+        novel = not self._guard.was_sent(sig) and title not in self.uploader.title_cache
+        return 2 * rank + int(novel)
+
+    # ---------------------------
+    # global throttle helpers
+    # ---------------------------
+    def _take_budget(self, wanted, now):
+        """
+        Reserve up to `wanted` uploads of the global budget (the rate
+        controller's current uploads per minute). Returns (granted, seconds
+        until a slot frees).
+        """
+        limit = max(int(self.rate.rate), 1)
+        with self._budget_lock:
+            # evict old
+            while self._upload_timestamps and (now - self._upload_timestamps[0] > self.window_sec):
+                self._upload_timestamps.popleft()
+            granted = max(min(wanted, limit - len(self._upload_timestamps)), 0)
+            self._upload_timestamps.extend([now] * granted)
+            wait = self._upload_timestamps[0] + self.window_sec - now if self._upload_timestamps else 0
+        return granted, wait
+
+    def _return_budget(self, count):
+        """Give back reserved uploads that were not used."""
+        with self._budget_lock:
+            for _ in range(min(count, len(self._upload_timestamps))):
+                self._upload_timestamps.pop()
+
+    # ---------------------------
+    # upload workers
+    # ---------------------------
+    def _worker_connection(self):
+        """A dedicated FPTR connection from the app's authenticated session (shared handle as fallback)."""
+        if self._connection_factory is not None:
+            return self._connection_factory()
+        try:
+            user = sgtk.get_authenticated_user()
+            if user:
+                return user.create_sg_connection()
+        except Exception:
+            self.logger.debug("Cannot create a dedicated FPTR connection", exc_info=True)
+        return self.shotgun
+
+    def worker_uploader(self, index):
+        """Uploader for upload worker `index`, on its own connection (blocking)."""
+        return self.uploader.with_connection(self._worker_connection())
+
+    def mark_startup(self, name):
+        """Record the time from pipeline creation to a startup milestone (e.g. "tailing")."""
+        self._startup[name + "_sec"] = round(time.perf_counter() - self._created, 3)
+
+    def initialize(self, uploader):
+        """
+        One-time startup work, kept off the app's startup path and done by an
+        upload worker before the first upload: check the project, look up
+        the user login and ticket fields, seed the title cache. Returns how
+        long to wait before the next step (retried with backoff when FPTR
+        cannot be reached).
+        """
+        if not self._init_lock.acquire(blocking=False):
+            return 0.5  # another worker is at it
+        try:
+            if self.ready.is_set():
+                return 0
+            started = time.perf_counter()
+            try:
+                found = uploader.project_exists()
+            except Exception as e:
+                delay = self.rate.backoff(self._init_attempts, self.retry_base, self.retry_max)
+                self._init_attempts += 1
+                self.logger.warning("Cannot access project_id=%s yet, retrying in %.0fs (%s)",
+                                    uploader.project_id, delay, e)
+                return delay
+            if not found:
+                self.disabled = True
+                self.logger.error("project_id=%s not found or no access. Uploads disabled.", uploader.project_id)
+                return self.retry_max
+            uploader.resolve()
+            try:
+                uploader.prefetch_titles()
+            except Exception:
+                self.logger.debug("Ticket title prefetch failed", exc_info=True)
+            self._startup["fptr_checks_sec"] = round(time.perf_counter() - started, 3)
+            self.mark_startup("ready")
+            self.ready.set()
+            self.wakeup()
+            self.logger.info("tk-incidentreporter ready %.2fs after start (FPTR checks took %.2fs)",
+                             self._startup["ready_sec"], self._startup["fptr_checks_sec"])
+            return 0
+        finally:
+            self._init_lock.release()
+
+    def upload_step(self, uploader):
+        """
+        Upload one batch of due spool items (blocking). Returns 0 if it did
+        some work, else how long to sleep before the next step (cut short by
+        a wakeup when something is spooled).
+        """
+        self._spool.evict()
+        if self.disabled:
+            return self.retry_max
+        # circuit breaker / concurrency: while FPTR is unhealthy items stay spooled
+        wanted, wait = self.rate.acquire(self.replay_batch)
+        if not wanted:
+            return max(wait, 0.05)
+        try:
+            if not self.ready.is_set():
+                return self.initialize(uploader)
+            return self._upload_due(uploader, wanted, probe=self.rate.probing)
+        finally:
+            self.rate.release()
+
+    def _upload_due(self, uploader, wanted, probe=False):
+        if probe:
+            # the breaker's probe is not held back by the budget it cut down
+            items = self._spool.fetch(wanted)
+        else:
+            self.flush_occurrences(uploader)
+            # the global budget is spent here, on the highest priority items first
+            granted, budget_wait = self._take_budget(wanted, time.time())
+            if not granted:
+                self.metrics.inc("upload.budget_waits")
+                # the rate may grow before a slot frees
+                return max(min(budget_wait, self.rate.adjust_interval), 0.05)
+            items = self._spool.fetch(granted)
+            self._return_budget(granted - len(items))
+        now = time.time()
+        for _, item, attempts in items:
+            if not attempts and item.get("ts"):
+                self.metrics.observe("spool.wait", now - item["ts"])
+                self.metrics.observe("spool.wait.p%d" % item.get("priority", 0), now - item["ts"])
+        if not items:
+            next_due = self._spool.next_due()
+            timeout = self.retry_max if next_due is None else max(next_due - time.time(), 0.05)
+            if self.occurrences is not None and len(self.occurrences):
+                timeout = min(timeout, max(self._next_occurrence_flush - time.time(), 0.05))
+            return min(timeout, self.retry_max)
+        self._upload_spooled(uploader, items)
+        return 0
+
+    def flush_occurrences(self, uploader, force=False):
+        """
+        Apply the occurrence tally to existing tickets once per
+        occurrence_flush_sec (one upload worker at a time). Titles without a
+        ticket yet are kept for a few more flushes, and for as long as FPTR
+        is unhealthy (breaker not closed) or their ticket is still spooled;
+        what is given up is counted (occurrences.dropped).
+        """
+        if self.occurrences is None or not len(self.occurrences):
+            return
+        now = time.time()
+        if not force and now < self._next_occurrence_flush:
+            return
+        if not self._occurrence_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_occurrence_flush = now + self.occurrence_interval
+            entries = self.occurrences.drain()
+            try:
+                leftover = uploader.update_occurrences(entries)
+            except Exception:
+                self.logger.exception("Occurrence flush failed for %d tickets", len(entries))
+                leftover = entries
+            for entry in leftover:
+                entry["flushes"] += 1
+            keep = [e for e in leftover if e["flushes"] < 3]
+            late = [e for e in leftover if e["flushes"] >= 3]
+            if late and self.rate.breaker == CLOSED:
+                held = self._spool.held_keys(e["title"] for e in late)
+                dropped = [e for e in late if e["title"] not in held]
+                late = [e for e in late if e["title"] in held]
+                if dropped:
+                    self.metrics.inc("occurrences.dropped", sum(e["count"] for e in dropped))
+                    self.logger.warning("Dropping %d occurrences of %d titles that have no ticket",
+                                        sum(e["count"] for e in dropped), len(dropped))
+            self.occurrences.restore(keep + late)
+            self.metrics.inc("occurrences.flushes")
+            self.logger.debug("Flushed occurrences of %d tickets (%d left)", len(entries) - len(leftover), len(leftover))
+        finally:
+            self._occurrence_lock.release()
+
+    def _uploader_worker(self, index):
+        uploader = self.worker_uploader(index)
+        while self._uploader_running:
+            try:
+                self._spool.wakeup.clear()
+                timeout = self.upload_step(uploader)
+                if timeout:
+                    self._spool.wakeup.wait(timeout)
+            except Exception:
+                # unexpected errors in worker loop
+                self.logger.exception("Uploader worker loop error")
+                time.sleep(0.5)
+
+    def _upload_spooled(self, uploader, items):
+        """Upload a batch of spooled items at once, then ack / reschedule each of them."""
+        try:
+            results = uploader.upload_batch([(i["path"], i["pos"], i["matched"]) for _, i, _ in items])
+        except Exception as exc:
+            # e.g. the title lookup failed: all of them are retried
+            self.logger.warning("Upload of %d items failed: %s", len(items), exc)
+            self.logger.debug("Upload failure", exc_info=True)
+            results = [False] * len(items)
+        for (item_id, item, attempts), ok in zip(items, results):
+            self._settle(item_id, item, attempts, ok)
+
+    def _settle(self, item_id, item, attempts, ok):
+        if ok:
+            self._spool.ack(item_id)
+            if item.get("ts"):
+                self.metrics.observe("upload.latency", time.time() - item["ts"])
+        elif attempts + 1 >= self.max_attempts:
+            self._spool.ack(item_id)
+            self.metrics.inc("upload.gave_up")
+            self.logger.error("Giving up upload for %s after %d attempts", item["path"], attempts + 1)
+        else:
+            # rescheduled, not slept on: the worker moves on to other items; jittered so
+            # clients failing together do not retry together
+            delay = self.rate.backoff(attempts, self.retry_base, self.retry_max)
+            self._spool.nack(item_id, delay, item)
+            self.metrics.inc("upload.retries")
+            self.logger.debug("Upload for %s failed, retrying in %.0fs", item["path"], delay)
+
+    # ---------------------------
+    # input
+    # ---------------------------
+    def on_line(self, payload):
+        try:
+            matcher = self.matchers.get(payload.get("source"), self.matcher)
+            matched = matcher.match(payload["line"], payload["path"])
+            if not matched:
+                return
+            self._handle_match(payload["path"], payload.get("pos", 0), matched, payload.get("ts", time.time()),
+                               inode=payload.get("inode"))
+        except Exception:
+            self.logger.exception("Error processing detected line.")
+
+    def on_lines(self, batch):
+        """Batch mode: lines were already matched on the tail thread."""
+        now = batch.get("ts", time.time())
+        for pos, matched in batch["hits"]:
+            try:
+                self._handle_match(batch["path"], pos, matched, now, inode=batch.get("inode"))
+            except Exception:
+                self.logger.exception("Error processing detected line.")
+
+    def on_forwarded(self, event):
+        """A match from a secondary instance (forwarder.ForwardingController), as a dict or its JSON line."""
+        try:
+            if not isinstance(event, dict):
+                event = json.loads(event)
+            self.metrics.inc("forward.received")
+            self._handle_match(event["path"], event.get("pos", 0), event["matched"], event.get("ts", time.time()),
+                               event.get("sig"), event.get("inode"), event.get("origin") or "forwarded")
+        except Exception:
+            self.logger.exception("Error processing forwarded incident.")
+
+    def _tally(self, matched, now):
+        """Count a dropped incident against its ticket (see flush_occurrences())."""
+        if self.occurrences is not None:
+            self.occurrences.add(self.uploader.title_for(matched), now, matched.get("host") or self.host)
+
+    def _handle_match(self, path, pos, matched, now, sig=None, inode=None, origin=None):
+        if sig is None:
+            sig = self._make_signature(matched.get("matched_line", ""), matched.get("stack"))
+        block = (os.path.normcase(os.path.abspath(path)), inode, pos, sig)
+        if self._blocks.duplicate(block, origin or self.origin):
+            # the same block was tailed by a secondary instance too
+            self.metrics.inc("drop.duplicate")
+            self._tally(matched, now)
+            return
+        self.metrics.inc("incidents.matched")
+        if self.disabled:
+            self.metrics.inc("drop.disabled")
+            return
+
+        # check blacklist
+        if self._is_blacklisted(sig, now):
+            self.logger.debug("Skipping blacklisted sig=%s", sig)
+            self.metrics.inc("drop.blackout")
+            self._tally(matched, now)
+            return
+
+        # per-signature cooldown (simple)
+        if self._guard.in_cooldown(sig, now):
+            # still in cooldown for this signature
+            # but still record hit to catch burst
+            self._record_sig_hit_and_check_burst(sig, now)
+            self.logger.debug("Skipping upload due cooldown sig=%s", sig)
+            self.metrics.inc("drop.cooldown")
+            self._tally(matched, now)
+            return
+
+        # check burst detection: returns True if we just entered blackout
+        entered_blackout = self._record_sig_hit_and_check_burst(sig, now)
+        if entered_blackout:
+            # just blacklisted; skip upload
+            self.metrics.inc("drop.burst")
+            self._tally(matched, now)
+            return
+
+        # Passed all guards: spool upload (survives restarts / FPTR outages);
+        # the global throttle applies when it is taken out of the spool
+        try:
+            # keyed by ticket title: one worker at a time per title, in order
+            title = self.uploader.title_for(matched)
+            priority = self._priority(matched, sig, title)
+            matched.setdefault("host", self.host)
+            item = {"path": path, "pos": pos, "matched": matched, "ts": time.time(), "priority": priority}
+            self._spool.put(item, key=title, priority=priority)
+            self.metrics.inc("incidents.spooled")
+            # mark sent immediately to provide per-signature cooldown
+            self._guard.mark_sent(sig, now)
+            self.logger.debug("Enqueued upload for sig=%s path=%s", sig, path)
+        except Exception:
+            self.logger.warning("Cannot spool upload for %s", path, exc_info=True)
+            self.metrics.inc("drop.spool_error")
+            # record hit (to detect burst)
+            # do not mark sent so cooldown won't be reset
+            self._record_sig_hit_and_check_burst(sig, now)
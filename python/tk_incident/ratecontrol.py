@@ -0,0 +1,194 @@
+import random
+import threading
+import time
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class RateController(object):
+    """
+    Adaptive upload rate for a shared FPTR site, fed with the latency and
+    outcome of every FPTR call (see Uploader._call):
+
+      - AIMD: every adjust_interval seconds, the upload rate (uploads per
+        minute) and the number of concurrent upload steps grow by one while
+        calls are fast and succeed (or there were none); they are halved
+        when the mean latency goes over latency_target or calls fail
+      - circuit breaker: failure_threshold failures in a row open it and
+        uploads pause (items stay spooled) for a jittered, exponentially
+        growing time; then a single probe upload is let through (half
+        open), and its success closes the breaker again. The rate restarts
+        at min_rate and doubles each interval up to half of what it was
+        when the breaker opened (slow start), then grows by one again
+      - backoff(): exponential backoff with jitter (for the breaker and for
+        spooled retries), so many clients failing at once do not retry in
+        lockstep
+
+    Calls slower by nature (attachment uploads) only count for errors, not
+    latency. State changes are logged; state() is exposed as metrics.
+    """
+
+    def __init__(self, max_rate=10, min_rate=1, max_concurrency=2, latency_target=2.0, adjust_interval=10.0,
+                 failure_threshold=5, open_base=30.0, open_max=600.0, logger=None):
+        self.max_rate = max(float(max_rate), 1.0)
+        self.min_rate = min(max(float(min_rate), 1.0), self.max_rate)
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.latency_target = float(latency_target)
+        self.adjust_interval = float(adjust_interval)
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.open_base = float(open_base)
+        self.open_max = float(open_max)
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+        # limiter state: start optimistic, AIMD finds the level the site copes with
+        self.rate = self.max_rate
+        self.concurrency = self.max_concurrency
+        self._slow_start_until = self.max_rate
+        self.breaker = CLOSED
+        self.open_until = 0.0
+        self._active = 0
+        self._failures_in_row = 0
+        self._trips_in_row = 0
+        self._window = [0, 0, 0.0, 0]  # calls, failures, latency sum, timed calls
+        self._window_start = time.monotonic()
+
+        # counters
+        self.trips = 0
+        self.decreases = 0
+
+    # -------------------------
+    # feedback
+    # -------------------------
+    def record(self, seconds, ok, timed=True):
+        """One FPTR call took `seconds`; ok: it did not raise. timed=False: ignore its latency."""
+        now = time.monotonic()
+        with self._lock:
+            window = self._window
+            window[0] += 1
+            if timed:
+                window[2] += seconds
+                window[3] += 1
+            if ok:
+                self._failures_in_row = 0
+                if self.breaker == HALF_OPEN:
+                    self._close()
+            else:
+                window[1] += 1
+                self._failures_in_row += 1
+                if self.breaker == HALF_OPEN or (
+                        self.breaker == CLOSED and self._failures_in_row >= self.failure_threshold):
+                    self._open(now)
+            self._roll(now)
+
+    def _roll(self, now):
+        if now - self._window_start < self.adjust_interval:
+            return
+        self._adjust()
+        self._window = [0, 0, 0.0, 0]
+        self._window_start = now
+
+    def _adjust(self):
+        calls, failures, latency, timed = self._window
+        if self.breaker != CLOSED:
+            return
+        mean = latency / timed if timed else 0.0
+        old = (self.rate, self.concurrency)
+        if failures or mean > self.latency_target:
+            # multiplicative decrease
+            self.rate = max(self.rate / 2, self.min_rate)
+            self.concurrency = max(self.concurrency // 2, 1)
+            self._slow_start_until = self.rate
+            self.decreases += 1
+        else:
+            # additive increase (doubling while in slow start)
+            if self.rate < self._slow_start_until:
+                self.rate = min(self.rate * 2, self._slow_start_until)
+            else:
+                self.rate = min(self.rate + 1, self.max_rate)
+            self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+        if (self.rate, self.concurrency) != old and self.logger:
+            self.logger.info(
+                "Upload rate %.1f -> %.1f/min, concurrency %d -> %d (mean latency %.2fs, %d/%d calls failed)",
+                old[0], self.rate, old[1], self.concurrency, mean, failures, calls,
+            )
+
+    def _open(self, now):
+        self._trips_in_row += 1
+        self.trips += 1
+        pause = self.backoff(self._trips_in_row - 1, self.open_base, self.open_max)
+        self.breaker = OPEN
+        self.open_until = now + pause
+        if self._trips_in_row == 1:
+            self._slow_start_until = max(self.rate / 2, self.min_rate)
+        self.rate = self.min_rate
+        self.concurrency = 1
+        if self.logger:
+            self.logger.warning(
+                "FPTR unhealthy (%d failed calls in a row): pausing uploads for %.0fs, they stay spooled",
+                self._failures_in_row, pause,
+            )
+
+    def _close(self):
+        self.breaker = CLOSED
+        self._trips_in_row = 0
+        # what happened while the breaker was open does not count
+        self._window = [0, 0, 0.0, 0]
+        self._window_start = time.monotonic()
+        if self.logger:
+            self.logger.info("FPTR healthy again: uploads resume at %.1f/min", self.rate)
+
+    # -------------------------
+    # gating
+    # -------------------------
+    def acquire(self, wanted):
+        """
+        Start an upload step of up to `wanted` items. Returns (granted, 0),
+        or (0, seconds to wait) while the breaker is open or all concurrency
+        slots are taken. Every granted acquire() needs a release().
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._roll(now)
+            if self.breaker == OPEN:
+                if now < self.open_until:
+                    return 0, self.open_until - now
+                self.breaker = HALF_OPEN
+                if self.logger:
+                    self.logger.info("Probing FPTR with one upload")
+            if self.breaker == HALF_OPEN:
+                # a single probe at a time
+                if self._active:
+                    return 0, 1.0
+                self._active += 1
+                return 1, 0
+            if self._active >= self.concurrency:
+                return 0, 0.5
+            self._active += 1
+            return wanted, 0
+
+    @property
+    def probing(self):
+        """True while the breaker lets a single probe upload through."""
+        return self.breaker == HALF_OPEN
+
+    def release(self):
+        with self._lock:
+            self._active = max(self._active - 1, 0)
+
+    def backoff(self, attempts, base, cap):
+        """Exponential backoff with jitter: between half and all of min(base * 2^attempts, cap)."""
+        delay = min(base * 2 ** min(attempts, 32), cap)  # bounded exponent: attempts may grow forever
+        return delay / 2 + self._random.uniform(0, delay / 2)
+
+    def state(self):
+        with self._lock:
+            return {
+                "breaker": self.breaker,
+                "uploads_per_minute": round(self.rate, 1),
+                "concurrency": self.concurrency,
+                "active": self._active,
+                "trips": self.trips,
+                "decreases": self.decreases,
+            }
@@ -0,0 +1,193 @@
+import mmap
+import os
+
+
+class LogReader(object):
+    """
+    Binary tail reader.
+
+    Reads appended bytes in large chunks (or through mmap for big catch-up
+    reads) and yields complete lines only; a trailing line without its newline
+    stays in a per-file carry-over buffer until the writer finishes it.
+
+    With a compiled bytes prefilter only candidate lines are located and
+    yielded, nothing else is split or decoded. With an IncidentAssembler as
+    well, each candidate line is yielded together with its continuation lines
+    (e.g. a traceback) as one block; a block that is still being written is
+    kept in the carry-over buffer. With a ContextBuffer too, the lines
+    around each candidate are captured from the data already in memory.
+
+    Per-file state lives in the dict passed to read():
+      - "pos":     bytes consumed from the file (read offset)
+      - "carry":   bytes read but not processed yet (incomplete line / block)
+      - "pending": see IncidentAssembler
+      - "context": end_offset -> (before, after) bytes of the items of the last read() call
+                   (at most ContextBuffer.max_total bytes in all)
+    """
+
+    def __init__(self, prefilter=None, assembler=None, chunk_size=256 * 1024, mmap_threshold=8 * 1024 * 1024,
+                 max_line_bytes=64 * 1024, context=None):
+        self.prefilter = prefilter
+        self.assembler = assembler if prefilter is not None else None
+        self.context = context  # ContextBuffer, only used with a prefilter
+        self.chunk_size = int(chunk_size)
+        self.mmap_threshold = int(mmap_threshold)
+        self.max_line_bytes = int(max_line_bytes)
+
+        # counters
+        self.bytes_read = 0
+        self.lines_scanned = 0
+
+    @staticmethod
+    def reset(state, pos=0):
+        """Restart reading at pos, the start of a line (rotation / truncation / resume)."""
+        state["pos"] = pos
+        state["carry"] = b""
+        state.pop("pending", None)
+
+    def read(self, path, state, size=None, limit=None):
+        """
+        Yield (end_offset, raw) for complete lines appended to path since the
+        last call. end_offset is the exact byte offset just past the (first)
+        line, i.e. past its newline. raw has no trailing line terminator; it
+        is a single line, or a head line plus continuation lines when an
+        assembler is set.
+
+        limit: read at most that many bytes this call (the rest is left for
+        the next one).
+        """
+        pos = state.get("pos", 0)
+        carry = state.get("carry", b"")
+        end = None if limit is None else pos + max(int(limit), 0)
+        if self.context is not None and self.prefilter is not None:
+            state["context"] = {}
+            self.context.start_batch()
+        with open(path, "rb") as fh:
+            if size is None:
+                size = os.fstat(fh.fileno()).st_size
+            if self.prefilter is not None and not carry and size - pos >= self.mmap_threshold and \
+                    (end is None or end >= size):
+                for item in self._read_mmap(fh, state, pos, path):
+                    yield item
+                return
+
+            fh.seek(pos)
+            while True:
+                want = self.chunk_size if end is None else min(self.chunk_size, max(end - pos, 0))
+                chunk = fh.read(want) if want else b""
+                if not chunk and not state.get("pending"):
+                    break
+                base = pos - len(carry)  # file offset of data[0]
+                data = carry + chunk if carry else chunk
+                pos += len(chunk)
+                cut = self._cut(data, 0, len(data))
+                items, hold = self._lines(data, 0, cut, base, state, at_eof=len(chunk) < want, key=path)
+
+                # update state before yielding so an abandoned generator loses nothing
+                carry = data[hold:]
+                state["pos"] = pos
+                state["carry"] = carry
+                self.bytes_read += len(chunk)
+
+                for item in items:
+                    yield item
+                if not chunk:
+                    break
+
+    def flush(self, path, state):
+        """
+        Return [(end_offset, raw)] for what the carry-over buffer still holds,
+        as if the writer were done: a pending block as it is, a last line
+        without its newline. For a file that is about to be reset (rotated,
+        truncated) or no longer read; the buffer is emptied.
+        """
+        carry = state.get("carry", b"")
+        if not carry:
+            state.pop("pending", None)
+            return []
+        if self.context is not None and self.prefilter is not None:
+            state["context"] = {}
+            self.context.start_batch()
+        base = state.get("pos", 0) - len(carry)
+        items, _ = self._lines(carry, 0, len(carry), base, state, at_eof=True, key=path, final=True)
+        state["carry"] = b""
+        state.pop("pending", None)
+        return items
+
+    def _read_mmap(self, fh, state, pos, key=None):
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm)
+            cut = self._cut(mm, pos, end)
+            # copy candidate lines out before the mapping is closed
+            items, hold = self._lines(mm, pos, cut, 0, state, at_eof=True, key=key)
+            state["pos"] = end
+            state["carry"] = mm[hold:end]
+            self.bytes_read += end - pos
+        for item in items:
+            yield item
+
+    def _cut(self, data, start, end):
+        """Offset just past the last complete line in data[start:end]."""
+        cut = data.rfind(b"\n", start, end) + 1
+        if cut <= start:
+            # no newline at all: only flush if the line is unreasonably long
+            return end if end - start >= self.max_line_bytes else start
+        return cut
+
+    def _count_lines(self, data, start, cut):
+        if isinstance(data, bytes):
+            return data.count(b"\n", start, cut)
+        # mmap has no count(): go through it chunk by chunk
+        return sum(data[i:min(i + self.chunk_size, cut)].count(b"\n") for i in range(start, cut, self.chunk_size))
+
+    def _lines(self, data, start, cut, base, state, at_eof, key=None, final=False):
+        """
+        Collect (end_offset, raw) items from data[start:cut].
+        Returns (items, hold): data from hold on is kept for the next read.
+        """
+        items, hold = self._collect(data, start, cut, base, state, at_eof, key, final)
+        if self.context is not None and self.prefilter is not None:
+            self.context.feed(key, data, start, hold)
+        return items, hold
+
+    def _collect(self, data, start, cut, base, state, at_eof, key, final=False):
+        items = []
+        if cut <= start:
+            return items, cut
+        self.lines_scanned += self._count_lines(data, start, cut)
+
+        if self.prefilter is None:
+            off = base + start
+            parts = data[start:cut].split(b"\n")
+            last = parts.pop()
+            for line in parts:
+                off += len(line) + 1
+                items.append((off, line.rstrip(b"\r")))
+            if last:
+                # overlong line flushed without its newline
+                items.append((off + len(last), last.rstrip(b"\r")))
+            return items, cut
+
+        last_end = start
+        for m in self.prefilter.finditer(data, start, cut):
+            if m.start() < last_end:
+                # several hits on the same line, or inside a block already taken
+                continue
+            s = max(data.rfind(b"\n", start, m.start()) + 1, start)
+            e = data.find(b"\n", m.start(), cut)
+            e = cut if e < 0 else e + 1
+
+            content_end = last_end = e
+            if self.assembler is not None:
+                block = self.assembler.block_end(data, s, e, cut, base + s, state, at_eof, final)
+                if block is None:
+                    # block still being written: keep it (and everything after) for later
+                    self.lines_scanned -= self._count_lines(data, s, cut)
+                    return items, s
+                content_end, last_end = block
+            if self.context is not None:
+                around = self.context.around(key, data, start, s, last_end, cut)
+                if around is not None:
+                    state["context"][base + e] = around
+            items.append((base + e, data[s:content_end].rstrip(b"\r\n")))
+        return items, cut
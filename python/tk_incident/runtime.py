@@ -0,0 +1,206 @@
+"""
+Headless runtime: the incident pipeline on an asyncio event loop, without Qt.
+
+For render nodes and farm blades where a Qt application is not available (or
+too costly to start). Same tailer, matcher, throttle, spool and uploader as
+the Desktop app, and the same lock file: one agent per cache folder, Desktop
+or headless, owns the upload spool and the tail checkpoints.
+
+    python -m tk_incident.runtime --settings settings.json [--log-folder DIR]
+
+settings.json holds the app settings (as in bootstrap.start(), with
+"upload": {"shotgun_project_id": ...}). The FPTR connection uses the sgtk
+authenticated user when there is one, else a script key from
+TK_INCIDENT_SG_URL / TK_INCIDENT_SG_SCRIPT / TK_INCIDENT_SG_KEY.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from .instance_lock import FileLock
+from .paths import agent_lock_path
+from .pipeline import IncidentPipeline
+from .tailer import Tailer
+
+
+class HeadlessRuntime(object):
+    """
+    Runs an IncidentPipeline on the running asyncio loop:
+      - a tail task stepping a Tailer on its own thread (blocking file reads
+        and watcher waits stay off the loop); matches are handed back to the
+        loop with call_soon_threadsafe
+      - upload_workers tasks, each running pipeline.upload_step() in a
+        thread pool and sleeping on an asyncio.Event between steps
+      - a metrics task dumping metrics every metrics_interval_sec
+    stop() (or SIGINT / SIGTERM) ends run(). The pipeline (with the spool it
+    replays) is only built once run() holds the agent lock.
+    """
+
+    def __init__(self, logger, shotgun, settings=None, connection_factory=None, lock_path=None):
+        self.logger = logger
+        self.shotgun = shotgun
+        self.settings = settings
+        self.connection_factory = connection_factory
+        self.pipeline = None
+        self.lock = FileLock(lock_path or agent_lock_path())
+        self.tailer = None
+        self._loop = None
+        self._stopping = None
+        self._wakeup = None
+
+    def stop(self):
+        """Ask run() to finish (thread safe)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def run(self):
+        """Run until stop(). Returns False if another agent (headless or Desktop) holds the lock."""
+        if not self.lock.acquire():
+            self.logger.warning("tk-incidentreporter: another instance running. Not starting.")
+            return False
+        self.pipeline = IncidentPipeline(self.logger, self.shotgun, self.settings, self.connection_factory)
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self._loop.add_signal_handler(signum, self._stopping.set)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass  # Windows / not the main thread
+
+        options = self.pipeline.tail_options()
+        if options["watch_backend"] == "auto":
+            # QFileSystemWatcher needs Qt: inotify where available, else polling
+            options["watch_backend"] = "inotify"
+        deliver = self.pipeline.on_lines if self.pipeline.batch else self.pipeline.on_line
+        self.tailer = Tailer(on_line=self._handoff(deliver), on_lines=self._handoff(deliver), **options)
+
+        tail_pool = ThreadPoolExecutor(1, thread_name_prefix="tk-incident-tail")
+        upload_pool = ThreadPoolExecutor(self.pipeline.upload_workers, thread_name_prefix="tk-incident-upload")
+        self.logger.info("tk-incidentreporter headless runtime starting.")
+        tasks = [self._loop.create_task(self._tail(tail_pool))]
+        tasks += [self._loop.create_task(self._upload_worker(i, upload_pool))
+                  for i in range(self.pipeline.upload_workers)]
+        if self.pipeline.metrics_interval > 0:
+            tasks.append(self._loop.create_task(self._dump_metrics()))
+        try:
+            await self._stopping.wait()
+        finally:
+            self.tailer.stop()
+            self._wakeup.set()
+            _, pending = await asyncio.wait(tasks, timeout=2)
+            for task in pending:
+                task.cancel()
+            self.logger.debug("Tail stats: %s", self.tailer.stats())
+            # an upload still running in the pool keeps the spool open; its item stays leased
+            self.pipeline.stop(timeout=0, busy=bool(pending))
+            tail_pool.shutdown(wait=False)
+            upload_pool.shutdown(wait=False)
+            self.lock.release()
+            self.logger.info("tk-incidentreporter stopped.")
+        return True
+
+    def _handoff(self, fn):
+        """Callback for the tail thread: run fn(arg) on the loop, then wake the upload workers."""
+        def deliver(arg):
+            self._loop.call_soon_threadsafe(self._deliver, fn, arg)
+        return deliver
+
+    def _deliver(self, fn, arg):
+        fn(arg)
+        self._wakeup.set()
+
+    async def _tail(self, pool):
+        await self._loop.run_in_executor(pool, self.tailer.open)
+        self.pipeline.mark_startup("tailing")
+        changed = None
+        try:
+            while not self._stopping.is_set():
+                changed = await self._loop.run_in_executor(pool, self.tailer.step, changed)
+        finally:
+            await self._loop.run_in_executor(pool, self.tailer.close)
+
+    async def _upload_worker(self, index, pool):
+        uploader = await self._loop.run_in_executor(pool, self.pipeline.worker_uploader, index)
+        while not self._stopping.is_set():
+            try:
+                self._wakeup.clear()
+                timeout = await self._loop.run_in_executor(pool, self.pipeline.upload_step, uploader)
+            except Exception:
+                # unexpected errors in worker loop
+                self.logger.exception("Uploader worker loop error")
+                timeout = 0.5
+            if timeout and not self._stopping.is_set():
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _dump_metrics(self):
+        self.pipeline.mark_metrics()
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.pipeline.metrics_interval)
+                return
+            except asyncio.TimeoutError:
+                self.pipeline.dump_metrics()
+
+
+def run(logger, shotgun, settings=None, connection_factory=None):
+    """Run the headless runtime in a new event loop until SIGINT / SIGTERM."""
+    runtime = HeadlessRuntime(logger, shotgun, settings, connection_factory)
+    return asyncio.run(runtime.run())
+
+
+def _connection_factory(logger):
+    """FPTR connections: the sgtk authenticated user if any, else a script key from the environment."""
+    try:
+        import sgtk
+        user = sgtk.get_authenticated_user()
+        if user:
+            return user.create_sg_connection
+    except Exception:
+        logger.debug("No sgtk authenticated user", exc_info=True)
+    try:
+        from tank_vendor import shotgun_api3
+    except ImportError:
+        import shotgun_api3
+
+    def connect():
+        return shotgun_api3.Shotgun(
+            os.environ["TK_INCIDENT_SG_URL"],
+            script_name=os.environ["TK_INCIDENT_SG_SCRIPT"],
+            api_key=os.environ["TK_INCIDENT_SG_KEY"],
+        )
+    return connect
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--settings", help="JSON file with the app settings")
+    parser.add_argument("--log-folder", help="folder to watch (default: settings log_folder, else the Toolkit one)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s [%(process)d %(levelname)s %(name)s] %(message)s",
+    )
+    logger = logging.getLogger("tk-incidentreporter")
+    settings = {}
+    if args.settings:
+        with open(args.settings, encoding="utf-8") as fh:
+            settings = json.load(fh)
+    if args.log_folder:
+        settings["log_folder"] = args.log_folder
+    factory = _connection_factory(logger)
+    return 0 if run(logger, factory(), settings, factory) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
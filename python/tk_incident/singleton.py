@@ -3,18 +3,67 @@ imp = QtImporter()
 QtCore, QtGui, QtNetwork = imp.QtCore, imp.QtGui, imp.QtNetwork
 
 
+def send_command(name, command, timeout_ms=1000):
+    """
+    Send a one-line command to the process holding the SingletonLock `name`
+    and return its reply (str), or None if nobody answers.
+    """
+    sock = QtNetwork.QLocalSocket()
+    sock.connectToServer(name)
+    if not sock.waitForConnected(timeout_ms):
+        return None
+    sock.write((command + "\n").encode("utf-8"))
+    sock.waitForBytesWritten(timeout_ms)
+    data = b""
+    while not data.endswith(b"\n") and sock.waitForReadyRead(timeout_ms):
+        data += bytes(sock.readAll())
+    sock.disconnectFromServer()
+    return data.decode("utf-8", "replace").rstrip("\n") if data else None
+
+
 class SingletonLock(object):
+    """
+    Single instance lock on a named local socket. The instance holding it
+    also answers one-line commands registered with add_command() (see
+    send_command()), and takes streams registered with add_stream(): a
+    connection that starts with "<stream>\n" stays open, each following
+    line goes to the stream's handler and is acknowledged with "ack <n>\n"
+    (n lines handled since the previous ack; see forwarder.EventForwarder).
+    """
+
     def __init__(self, name, parent=None):
         self.name = name
         self.parent = parent
         self._server = None
+        self._commands = {}
+        self._streams = {}
+        self._stream_socks = {}  # socket -> handler, for open streams
+
+    def add_command(self, command, handler):
+        """Answer "<command>\n" with handler() (a str)."""
+        self._commands[command] = handler
+
+    def add_stream(self, name, handler):
+        """Pass every line of "<name>\n" connections to handler(line) (a str), until they close."""
+        self._streams[name] = handler
 
     def acquire(self, timeout_ms=150):
         sock = QtNetwork.QLocalSocket(self.parent)
         sock.connectToServer(self.name)
         if sock.waitForConnected(timeout_ms):
+            sock.abort()
             return False
 
+        return self.listen()
+
+    def listen(self):
+        """
+        Serve on the name without checking for another holder, for a caller
+        that already won a real lock (bootstrap.AgentRunner holds a FileLock):
+        a socket left by a crashed holder is stale and replaced.
+        """
+        if self._server is not None:
+            return True
         server = QtNetwork.QLocalServer(self.parent)
 
         if not server.listen(self.name):
@@ -26,9 +75,54 @@ class SingletonLock(object):
                 return False
 
         self._server = server
+        server.newConnection.connect(self._on_connection)
         return True
 
+    def _on_connection(self):
+        while self._server and self._server.hasPendingConnections():
+            sock = self._server.nextPendingConnection()
+            sock.readyRead.connect(lambda s=sock: self._on_ready_read(s))
+            sock.disconnected.connect(lambda s=sock: self._stream_socks.pop(s, None))
+            sock.disconnected.connect(sock.deleteLater)
+
+    def _on_ready_read(self, sock):
+        stream = self._stream_socks.get(sock)
+        if stream is not None:
+            count = 0
+            while sock.canReadLine():
+                line = bytes(sock.readLine()).decode("utf-8", "replace").strip()
+                if line:
+                    count += 1
+                    try:
+                        stream(line)
+                    except Exception:
+                        pass
+            if count:
+                sock.write(f"ack {count}\n".encode("utf-8"))
+            return
+        if not sock.canReadLine():
+            return
+        command = bytes(sock.readLine()).decode("utf-8", "replace").strip()
+        if command in self._streams:
+            self._stream_socks[sock] = self._streams[command]
+            self._on_ready_read(sock)
+            return
+        handler = self._commands.get(command)
+        try:
+            reply = handler() if handler else f"unknown command: {command}"
+        except Exception as e:
+            reply = f"error: {e}"
+        sock.write((reply.replace("\n", " ") + "\n").encode("utf-8"))
+        sock.flush()
+        sock.disconnectFromServer()
+
     def release(self):
+        for sock in list(self._stream_socks):
+            try:
+                sock.abort()
+            except Exception:
+                pass
+        self._stream_socks.clear()
         if self._server:
             try:
                 name = self._server.serverName()
@@ -0,0 +1,128 @@
+from fnmatch import translate
+import os
+import re
+import time
+
+from .reader import LogReader
+
+_CASE_FLAGS = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+
+
+class LogSource(object):
+    """
+    One watched log root: a folder, its file patterns, the matcher profile
+    applied to its lines and its share of the tailer's read budget.
+
+    Patterns are fnmatch globs on the file name ("tk-*.log"); a pattern with
+    a "/" is matched against the path relative to root ("crash/*.log"), and
+    a "**/" prefix matches the rest of the pattern at any depth. Subfolders
+    are only walked when recursive is set (implied by "**/"), up to
+    max_depth levels.
+
+    Folder listings are cached per folder and redone only when the folder's
+    mtime changes (one os.scandir pass, all patterns in one regex).
+    """
+
+    def __init__(self, name, root, patterns=None, matcher=None, priority=1, recursive=False, max_depth=8):
+        self.name = name
+        self.root = os.path.normpath(os.path.expandvars(os.path.expanduser(str(root))))
+        self.patterns = patterns or ["tk-*.log"]
+        self.matcher = matcher
+        self.priority = max(float(priority), 0.001)
+        self.max_depth = int(max_depth)
+
+        names, paths = [], []
+        for pattern in self.patterns:
+            pattern = pattern.replace("\\", "/")
+            if pattern.startswith("**/"):
+                recursive = True
+                pattern = pattern[3:]
+            (paths if "/" in pattern else names).append(translate(pattern))
+        self.recursive = bool(recursive)
+        self._name_re = re.compile("|".join("(?:%s)" % p for p in names), _CASE_FLAGS) if names else None
+        self._path_re = re.compile("|".join("(?:%s)" % p for p in paths), _CASE_FLAGS) if paths else None
+
+        prefilter = getattr(matcher, "prefilter", None) if matcher else None
+        self.reader = LogReader(prefilter=prefilter)  # the tailer sets its assembler
+        self._listings = {}  # folder -> (mtime_ns, listed_at, files, subfolders)
+
+        # counters
+        self.dir_listings = 0
+        self.lines_forwarded = 0
+        self.scan_time = 0.0  # seconds spent reading this source's files
+        self.backlog = 0  # unread bytes in its files, as of their last check
+
+    def _matches(self, folder, name):
+        if self._name_re is not None and self._name_re.match(name):
+            return True
+        if self._path_re is not None:
+            rel = os.path.relpath(os.path.join(folder, name), self.root).replace(os.sep, "/")
+            return self._path_re.match(rel) is not None
+        return False
+
+    def matches(self, path):
+        """True if path (e.g. from a watcher event) belongs to this source."""
+        folder, name = os.path.split(path)
+        if folder != self.root:
+            if not self.recursive and self._path_re is None:
+                return False
+            if not folder.startswith(self.root + os.sep):
+                return False
+            if folder[len(self.root):].count(os.sep) > self.max_depth:
+                return False
+        return self._matches(folder, name)
+
+    def _list(self, folder):
+        """(files, subfolders, fresh) of one folder, from the cache when its mtime did not change."""
+        mtime = os.stat(folder).st_mtime_ns
+        cached = self._listings.get(folder)
+        # a listing taken within the mtime granularity of a change may have missed part of it
+        if cached is not None and cached[0] == mtime and cached[1] - mtime / 1e9 > 2.0:
+            return cached[2], cached[3], False
+        files, subfolders = [], []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if self.recursive or self._path_re is not None:
+                        subfolders.append(entry.path)
+                elif self._matches(folder, entry.name) and entry.is_file():
+                    files.append(entry.path)
+        self.dir_listings += 1
+        self._listings[folder] = (mtime, time.time(), files, subfolders)
+        return files, subfolders, True
+
+    def list_files(self):
+        """
+        (paths of matching files, folders walked), or (None, folders) when
+        no folder changed since the previous call.
+        """
+        found, folders, fresh = [], [], False
+        stack = [(self.root, 0)]
+        while stack:
+            folder, depth = stack.pop()
+            try:
+                files, subfolders, changed = self._list(folder)
+            except OSError:
+                fresh = fresh or self._listings.pop(folder, None) is not None
+                continue
+            fresh = fresh or changed
+            folders.append(folder)
+            found.extend(files)
+            if depth < self.max_depth:
+                stack.extend((sub, depth + 1) for sub in subfolders)
+        # forget folders that are gone
+        for folder in set(self._listings) - set(folders):
+            del self._listings[folder]
+            fresh = True
+        return (found if fresh else None), folders
+
+    def stats(self):
+        return {
+            "priority": self.priority,
+            "bytes_read": self.reader.bytes_read,
+            "lines_scanned": self.reader.lines_scanned,
+            "lines_forwarded": self.lines_forwarded,
+            "scan_sec": round(self.scan_time, 3),
+            "backlog": self.backlog,
+            "dir_listings": self.dir_listings,
+        }
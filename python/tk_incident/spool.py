@@ -0,0 +1,269 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class UploadSpool(object):
+    """
+    Durable upload queue backed by a SQLite file.
+
+    put() stores an item with a priority; fetch() leases a batch of due
+    items to one consumer, highest priority first; ack() removes an item once it is uploaded, nack() makes it due
+    again after a delay. Items with the same key are leased to one consumer
+    at a time, oldest first, so several consumers never work on the same key
+    concurrently and its items keep their order. An item leased by a process that died is handed out
+    again once its lease expires (or right away after release_leases() on the
+    next start), so nothing is lost between put() and ack().
+
+    The spool is bounded: beyond max_items the lowest priority items are
+    evicted (oldest first among equals), and items older than max_age
+    seconds are dropped by evict().
+    """
+
+    def __init__(self, path, max_items=1000, max_age=3 * 24 * 3600, lease=300):
+        self.path = path
+        self.max_items = int(max_items)
+        self.max_age = float(max_age)
+        self.lease = float(lease)
+        self.wakeup = threading.Event()  # set by put() / nack() so a waiting consumer picks items up
+        self._lock = threading.Lock()
+
+        # counters
+        self.evicted = 0
+
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created REAL NOT NULL,"
+            " due REAL NOT NULL,"
+            " lease_until REAL NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " payload TEXT NOT NULL,"
+            " key TEXT,"
+            " priority INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(spool)")]
+        if "key" not in columns:
+            self._db.execute("ALTER TABLE spool ADD COLUMN key TEXT")
+        if "priority" not in columns:
+            self._db.execute("ALTER TABLE spool ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS spool_due ON spool (due)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS spool_key ON spool (key)")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def depths(self):
+        """{priority: number of items}"""
+        with self._lock:
+            return dict(self._db.execute("SELECT priority, COUNT(*) FROM spool GROUP BY priority").fetchall())
+
+    def held_keys(self, keys):
+        """The keys (of the given ones) that still have items in the spool."""
+        keys = list(keys)
+        held = set()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._db.execute(
+                    "SELECT DISTINCT key FROM spool WHERE key IN (%s)" % ",".join("?" * len(chunk)), chunk
+                ).fetchall()
+                held.update(row[0] for row in rows)
+        return held
+
+    def put(self, item, key=None, now=None, priority=0):
+        now = time.time() if now is None else now
+        payload = json.dumps(item)
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO spool (created, due, payload, key, priority) VALUES (?, ?, ?, ?, ?)",
+                (now, now, payload, key, int(priority)),
+            )
+            over = self._db.execute("SELECT COUNT(*) FROM spool").fetchone()[0] - self.max_items
+            if over > 0:
+                self._db.execute(
+                    "DELETE FROM spool WHERE id IN (SELECT id FROM spool ORDER BY priority, id LIMIT ?)", (over,)
+                )
+                self.evicted += over
+        self.wakeup.set()
+        return cur.lastrowid
+
+    def fetch(self, limit=20, now=None):
+        """
+        Lease up to limit due items. Returns [(id, item, attempts)], highest
+        priority first, then oldest first. A key is due when all its items are and none of them is
+        leased; then all its items are handed out together.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, payload, attempts FROM spool"
+                    " WHERE (key IS NULL AND due <= ? AND lease_until <= ?)"
+                    " OR key IN (SELECT key FROM spool WHERE key IS NOT NULL"
+                    "            GROUP BY key HAVING MAX(due) <= ? AND MAX(lease_until) <= ?)"
+                    " ORDER BY priority DESC, id LIMIT ?",
+                    (now, now, now, now, int(limit)),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE spool SET lease_until = ? WHERE id = ?", [(now + self.lease, row[0]) for row in rows]
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    def ack(self, item_id):
+        with self._lock:
+            self._db.execute("DELETE FROM spool WHERE id = ?", (item_id,))
+
+    def nack(self, item_id, delay=0, item=None, now=None):
+        """Return a leased item (optionally updated); it is due again after delay seconds."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if item is not None:
+                self._db.execute("UPDATE spool SET payload = ? WHERE id = ?", (json.dumps(item), item_id))
+            self._db.execute(
+                "UPDATE spool SET due = ?, lease_until = 0, attempts = attempts + 1 WHERE id = ?",
+                (now + delay, item_id),
+            )
+        if delay <= 0:
+            self.wakeup.set()
+
+    def release_leases(self, now=None):
+        """
+        Make every item due now, including those leased by a previous (dead)
+        process or waiting for a retry. Used on start. Returns the item count.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._db.execute("UPDATE spool SET lease_until = 0, due = MIN(due, ?)", (now,)).rowcount
+
+    def evict(self, now=None):
+        """Drop items older than max_age. Returns how many were dropped."""
+        now = time.time() if now is None else now
+        with self._lock:
+            dropped = self._db.execute("DELETE FROM spool WHERE created < ?", (now - self.max_age,)).rowcount
+        self.evicted += dropped
+        return dropped
+
+    def next_due(self):
+        """Timestamp of the next item that is not leased, or None when there is none."""
+        with self._lock:
+            row = self._db.execute("SELECT MIN(MAX(due, lease_until)) FROM spool").fetchone()
+        return row[0]
+
+
+class MemorySpool(object):
+    """
+    In-memory UploadSpool (same interface) for when the spool is not persisted.
+    """
+
+    def __init__(self, max_items=1000, max_age=3 * 24 * 3600, lease=300):
+        self.max_items = int(max_items)
+        self.max_age = float(max_age)
+        self.lease = float(lease)
+        self.wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # id -> [created, due, lease_until, attempts, item, key, priority]
+        self._next_id = 1
+
+        # counters
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def close(self):
+        pass
+
+    def depths(self):
+        with self._lock:
+            depths = {}
+            for entry in self._items.values():
+                depths[entry[6]] = depths.get(entry[6], 0) + 1
+            return depths
+
+    def held_keys(self, keys):
+        with self._lock:
+            return set(keys) & set(entry[5] for entry in self._items.values())
+
+    def put(self, item, key=None, now=None, priority=0):
+        now = time.time() if now is None else now
+        with self._lock:
+            item_id = self._next_id
+            self._next_id += 1
+            self._items[item_id] = [now, now, 0, 0, item, key, int(priority)]
+            while len(self._items) > self.max_items:
+                # lowest priority, oldest first
+                del self._items[min(self._items, key=lambda i: (self._items[i][6], i))]
+                self.evicted += 1
+        self.wakeup.set()
+        return item_id
+
+    def fetch(self, limit=20, now=None):
+        now = time.time() if now is None else now
+        out = []
+        with self._lock:
+            keyed = [e for e in self._items.values() if e[5] is not None]
+            blocked = set(e[5] for e in keyed if e[1] > now or e[2] > now)
+            due_keys = set(e[5] for e in keyed) - blocked
+            for item_id, entry in sorted(self._items.items(), key=lambda kv: (-kv[1][6], kv[0])):
+                if len(out) >= limit:
+                    break
+                if entry[5] is None:
+                    ok = entry[1] <= now and entry[2] <= now
+                else:
+                    ok = entry[5] in due_keys
+                if ok:
+                    entry[2] = now + self.lease
+                    out.append((item_id, entry[4], entry[3]))
+        return out
+
+    def ack(self, item_id):
+        with self._lock:
+            self._items.pop(item_id, None)
+
+    def nack(self, item_id, delay=0, item=None, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._items.get(item_id)
+            if entry:
+                entry[1], entry[2] = now + delay, 0
+                if item is not None:
+                    entry[4] = item
+                entry[3] += 1
+        if delay <= 0:
+            self.wakeup.set()
+
+    def release_leases(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            for entry in self._items.values():
+                entry[1], entry[2] = min(entry[1], now), 0
+            return len(self._items)
+
+    def evict(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            old = [i for i, e in self._items.items() if e[0] < now - self.max_age]
+            for item_id in old:
+                del self._items[item_id]
+        self.evicted += len(old)
+        return len(old)
+
+    def next_due(self):
+        with self._lock:
+            return min((max(e[1], e[2]) for e in self._items.values()), default=None)
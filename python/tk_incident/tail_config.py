@@ -0,0 +1,104 @@
+import os
+
+import sgtk
+
+from .matcher import Matcher
+from .assembler import IncidentAssembler
+from .checkpoint import CheckpointStore
+from .context import ContextBuffer
+from .sources import LogSource
+from .paths import cache_dir
+
+
+class TailConfig(object):
+    """
+    The tailing half of the app settings: sources, matchers and the options
+    of the Tailer (or TailWorker) that feeds them. Used by IncidentPipeline,
+    and on its own by a secondary instance that only tails and matches.
+    """
+
+    def __init__(self, logger, settings=None, metrics=None):
+        self.logger = logger
+        self.settings = settings or {}
+        self.metrics = metrics
+        self.matcher = Matcher(self.settings)
+        self.batch = self.settings.get("batch_delivery", True)
+        # source name -> Matcher (sources without a matcher profile share the default one)
+        self.matchers = {}
+        for cfg in self.source_configs():
+            profile = cfg.get("matcher")
+            self.matchers[cfg["name"]] = Matcher(dict(self.settings, matcher=profile)) if profile else self.matcher
+
+    def source_configs(self):
+        """
+        settings["sources"]: list of {name, root, patterns, matcher, priority,
+        recursive, max_depth}; an empty root is the Toolkit log folder. Without
+        it, a single "toolkit" source (log_folder + glob_patterns).
+        """
+        configs = self.settings.get("sources") or [{"name": "toolkit"}]
+        out = []
+        for i, cfg in enumerate(configs):
+            cfg = dict(cfg)
+            cfg.setdefault("name", "source%d" % i)
+            cfg["root"] = cfg.get("root") or self.settings.get("log_folder") or sgtk.LogManager().log_folder
+            cfg["patterns"] = cfg.get("patterns") or self.settings.get("glob_patterns", ["tk-*.log"])
+            out.append(cfg)
+        return out
+
+    def sources(self):
+        """LogSources for a Tailer, one per configured source."""
+        return [
+            LogSource(
+                cfg["name"],
+                cfg["root"],
+                cfg["patterns"],
+                # matcher runs on the tail thread; only matched lines are handed over
+                matcher=self.matchers[cfg["name"]] if self.batch else None,
+                priority=float(cfg.get("priority", 1)),
+                recursive=bool(cfg.get("recursive", False)),
+                max_depth=int(cfg.get("max_depth", 8)),
+            )
+            for cfg in self.source_configs()
+        ]
+
+    def tail_options(self, checkpoints=True):
+        """
+        Keyword arguments for a Tailer (or TailWorker). checkpoints=False (or
+        the checkpoints setting) leaves the shared checkpoint file alone.
+        """
+        tb_cfg = self.settings.get("traceback") or {}
+        assembler = IncidentAssembler(
+            record_start=tb_cfg.get("record_start"),
+            timeout=float(tb_cfg.get("timeout_sec", 2)),
+            max_lines=int(tb_cfg.get("max_lines", 200)),
+        )
+        ctx_cfg = self.settings.get("context") or {}
+        context = None
+        if ctx_cfg.get("before_lines", 20) or ctx_cfg.get("after_lines", 5):
+            context = ContextBuffer(
+                before_lines=int(ctx_cfg.get("before_lines", 20)),
+                after_lines=int(ctx_cfg.get("after_lines", 5)),
+                per_file=int(ctx_cfg.get("file_kb", 16)) * 1024,
+                max_total=int(ctx_cfg.get("total_kb", 1024)) * 1024,
+            )
+        store = None
+        if checkpoints and self.settings.get("checkpoints", True):
+            store = CheckpointStore(os.path.join(cache_dir(), "tail_checkpoints.json"))
+            try:
+                store.load()
+            except Exception:
+                self.logger.debug("Cannot load tail checkpoints", exc_info=True)
+        return {
+            "sources": self.sources(),
+            "read_budget": int(self.settings.get("tail_cycle_kb", 8192)) * 1024,
+            "poll_interval": float(self.settings.get("poll_interval", 0.5)),
+            "watch_backend": self.settings.get("watch_backend", "auto"),
+            "idle_after": float(self.settings.get("idle_after_sec", 60)),
+            "cold_after": float(self.settings.get("cold_after_sec", 900)),
+            "cold_interval": float(self.settings.get("cold_interval_sec", 300)),
+            "assembler": assembler,
+            "context": context,
+            "checkpoints": store,
+            "logger": self.logger,
+            "metrics": self.metrics,
+        }
@@ -0,0 +1,577 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from .assembler import IncidentAssembler
+from .checkpoint import FINGERPRINT_BYTES, head_fingerprint
+from .metrics import Metrics
+from .sources import LogSource
+from .watcher import create_watcher
+
+# rotated / archived log names: tk-maya.log.3, render.log.gz
+_ROTATED_RE = re.compile(r"\.\d+$|\.(?:gz|bz2|xz|zip)$", re.IGNORECASE)
+_DIGITS_RE = re.compile(r"\d+")
+
+
+class Tailer(object):
+    """
+    Qt-free tail/follow core, driven by TailWorker (QThread) in the Desktop
+    app and by the asyncio runtime on headless machines.
+    Calls on_line(payload) with {path, line, pos, ts, source} per line.
+
+    Files come from one or more LogSources (or log_folder + glob_patterns +
+    matcher as a single source). For a source with a matcher the tailer runs
+    it itself (batch mode) and calls on_lines(batch) once per file per poll
+    cycle with only the matched lines:
+    {path, ts, source, hits: [(pos, matched), ...]}
+    Continuation lines following a matched line (e.g. a traceback) are
+    collected into the same hit as matched["stack"]. With a ContextBuffer the
+    lines around it are added as matched["context"] = {"before", "after"},
+    taken from memory (per-file rings, capped per file and in total; the
+    context of one batch is capped at the same total).
+
+    Files are read as bytes in large chunks (see LogReader); in batch mode the
+    matcher's bytes prefilter runs before anything is decoded. Incomplete
+    trailing lines are held back until their newline is written.
+
+    The loop sleeps on a watcher backend (inotify / QFileSystemWatcher, or
+    plain polling as fallback) and only reads files that changed or whose
+    check is due. Files that stay idle for longer than idle_after seconds are
+    checked less and less often, up to max_idle_interval. Rotated or
+    superseded files (an older "render-0412.log" next to a newer
+    "render-0413.log", same name but for the digits) idle for longer than
+    cold_after leave the working set: they are only stat'd every
+    cold_interval seconds (or on a watcher event) and come back when they
+    change, resuming where they stopped. Current logs never go cold, so a
+    quiet one is still seen within max_idle_interval whatever the backend.
+
+    Folder listings are cached and redone only when a folder's mtime
+    changes, i.e. when files are created, renamed or deleted (see LogSource).
+
+    Sources share one watcher and one thread. Each cycle reads at most
+    read_budget bytes, split between the sources with due files in
+    proportion to their priority (what one leaves unused goes to the
+    others), so a chatty source can't starve detection on the rest: its
+    backlog is read over the next cycles, which then follow without delay.
+
+    With a CheckpointStore, positions are saved in batches and files resume
+    where the previous session stopped. Files without a checkpoint start at
+    their end if they existed at startup (unless written since the previous
+    session stopped), or at 0 if they appeared later. The whole backlog is
+    read, at most read_budget bytes per cycle.
+
+    A block still pending (see IncidentAssembler) when its file is rotated,
+    truncated or goes away is reported as it is, and so are the pending
+    blocks left at close() when there are no checkpoints; with checkpoints
+    the next session reads them again.
+    """
+
+    def __init__(self, log_folder=None, glob_patterns=None, poll_interval=0.5, matcher=None,
+                 watch_backend="auto", idle_after=60.0, max_idle_interval=None, rescan_interval=None,
+                 assembler=None, checkpoints=None, logger=None, metrics=None,
+                 cold_after=900.0, cold_interval=300.0, sources=None, read_budget=8 * 1024 * 1024,
+                 context=None, on_line=None, on_lines=None):
+        self.poll_interval = float(poll_interval)
+        self.watch_backend = watch_backend
+        self.logger = logger
+        self.idle_after = float(idle_after)
+        self.cold_after = float(cold_after)
+        self.cold_interval = float(cold_interval)
+        self.on_line = on_line
+        self.on_lines = on_lines
+        self._max_idle_interval = max_idle_interval
+        self._rescan_interval = rescan_interval
+        self.assembler = assembler or IncidentAssembler()
+        if sources is None:
+            sources = [LogSource("default", log_folder, glob_patterns, matcher)]
+        self.context = context
+        for source in sources:
+            source.reader.assembler = self.assembler if source.reader.prefilter is not None else None
+            source.reader.context = context
+        # higher priority first: it also gets the first pick of leftover budget
+        self.sources = sorted(sources, key=lambda s: -s.priority)
+        self.read_budget = int(read_budget)
+        # path -> {"pos": int, "carry": bytes, "pending": tuple, "inode": int, "source": LogSource,
+        #          "interval": float, "next_check": float, "active": float, "backlog": int}
+        self._files = {}
+        # path -> {"offset": int, "inode": int, "size": int, "mtime": int, "next_check": float, "source": LogSource}
+        self._cold = {}
+        # (folder, name with digits as "#") -> paths in _files / _cold, and the newest of each group
+        self._groups = {}
+        self._newest = {}  # group -> (checked at, path)
+        self._next_cold_check = float("inf")
+        self._watched = set()  # folders given to the watcher
+        self._watcher = None
+        self._stopping = threading.Event()
+        self._next_rescan = 0.0
+        self._checkpoints = checkpoints
+        self._started = False  # True once the initial scan is done
+
+        # counters (written by the tailing thread only; per source in LogSource)
+        self.metrics = metrics or Metrics()
+        self.metrics.counter_fn("tail.bytes_read", lambda: self._total("bytes_read"))
+        self.metrics.counter_fn("tail.lines_scanned", lambda: self._total("lines_scanned"))
+        self.metrics.counter_fn("tail.lines_forwarded", lambda: self._total("lines_forwarded"))
+        self.metrics.counter_fn("tail.dir_listings", lambda: self._total("dir_listings"))
+        self.metrics.gauge("tail.files", lambda: len(self._files))
+        self.metrics.gauge("tail.cold_files", lambda: len(self._cold))
+        if context is not None:
+            self.metrics.gauge("tail.context_bytes", lambda: context.size)
+            self.metrics.counter_fn("tail.context_dropped", lambda: context.dropped)
+            self.metrics.counter_fn("tail.context_skipped", lambda: context.skipped)
+        for source in self.sources:
+            prefix = "source.%s." % source.name
+            self.metrics.counter_fn(prefix + "bytes_read", lambda s=source: s.reader.bytes_read)
+            self.metrics.counter_fn(prefix + "lines_forwarded", lambda s=source: s.lines_forwarded)
+            self.metrics.counter_fn(prefix + "scan_sec", lambda s=source: s.scan_time)
+            self.metrics.gauge(prefix + "backlog", lambda s=source: s.backlog)
+            self.metrics.gauge(prefix + "files", lambda s=source: self._count_files(s))
+
+    def _total(self, name):
+        return sum(source.stats()[name] for source in self.sources)
+
+    def _count_files(self, source):
+        return sum(1 for info in list(self._files.values()) if info["source"] is source)
+
+    def stats(self):
+        return {
+            "bytes_read": self._total("bytes_read"),
+            "lines_scanned": self._total("lines_scanned"),
+            "lines_forwarded": self._total("lines_forwarded"),
+            "dir_listings": self._total("dir_listings"),
+            "files": len(self._files),
+            "cold_files": len(self._cold),
+            "context": self.context.stats() if self.context is not None else None,
+            "sources": {source.name: dict(source.stats(), files=self._count_files(source)) for source in self.sources},
+        }
+
+    def stop(self):
+        """Ask run() to exit and wake the watcher so it does so promptly."""
+        self._stopping.set()
+        watcher = self._watcher
+        if watcher:
+            watcher.wakeup()
+
+    def _register_file(self, pstr, source, cold=None):
+        """Add a file to the working set; cold: its record when it comes back from the cold set."""
+        if pstr in self._files:
+            return
+        info = {"pos": 0, "carry": b"", "inode": None, "source": source, "backlog": 0,
+                "interval": self.poll_interval, "next_check": 0.0, "active": time.monotonic()}
+        self._files[pstr] = info
+        self._groups.setdefault(self._group(pstr), set()).add(pstr)
+        try:
+            st = os.stat(pstr)
+            info["inode"] = getattr(st, "st_ino", None)
+            start = None
+            if cold is not None:
+                # same file: continue where it went cold; replaced: read the new one from the start
+                same = cold["inode"] == info["inode"] and st.st_size >= cold["offset"]
+                start = cold["offset"] if same else 0
+            elif self._checkpoints is not None:
+                start = self._checkpoints.resume_offset(pstr, st)
+                if start is None and self._checkpoints.written_since_save(st):
+                    start = 0
+            if start is None:
+                start = st.st_size if not self._started else 0
+            source.reader.reset(info, start)
+            self._update_fingerprint(pstr, info)
+        except Exception:
+            pass
+        if self._watcher:
+            self._watcher.watch_file(pstr)
+
+    def _update_fingerprint(self, pstr, info):
+        if self._checkpoints is None:
+            return
+        if info.get("fp_len", 0) >= FINGERPRINT_BYTES:
+            return
+        info["fp"], info["fp_len"] = head_fingerprint(pstr)
+
+    def _save_checkpoint(self, pstr, info):
+        if self._checkpoints is None:
+            return
+        try:
+            self._update_fingerprint(pstr, info)
+        except OSError:
+            return
+        # resume point is the last fully processed line, not the read offset
+        offset = info["pos"] - len(info.get("carry", b""))
+        self._checkpoints.update(pstr, info.get("inode"), offset, info.get("fp"), info.get("fp_len", 0))
+
+    def _forget_file(self, pstr):
+        self._cold.pop(pstr, None)
+        group = self._group(pstr)
+        members = self._groups.get(group)
+        if members is not None:
+            members.discard(pstr)
+            if not members:
+                del self._groups[group]
+                self._newest.pop(group, None)
+        info = self._files.pop(pstr, None)
+        if info is not None and info.get("carry"):
+            # deleted or renamed away: report what it left pending
+            self._deliver(pstr, info, info["source"].reader.flush(pstr, info))
+        if self.context is not None:
+            self.context.forget(pstr)
+        if info is None:
+            return
+        if self._checkpoints is not None:
+            self._checkpoints.forget(pstr)
+        if self._watcher:
+            self._watcher.unwatch_file(pstr)
+
+    def _source_for(self, pstr):
+        for source in self.sources:
+            if source.matches(pstr):
+                return source
+        return None
+
+    def _watch(self, folder):
+        if folder in self._watched or self._watcher is None:
+            return
+        try:
+            self._watcher.watch(folder)
+            self._watched.add(folder)
+        except Exception:
+            if self.logger:
+                self.logger.debug("Cannot watch %s", folder, exc_info=True)
+
+    def _rescan(self):
+        for source in self.sources:
+            paths, folders = source.list_files()
+            for folder in folders:
+                self._watch(folder)
+            if paths is None:
+                continue
+            listed = set(paths)
+            for pstr in paths:
+                if pstr not in self._cold and pstr not in self._files:
+                    self._register_file(pstr, source)
+            # deleted (or renamed away) files leave both sets
+            for table in (self._files, self._cold):
+                gone = [p for p, info in table.items() if info["source"] is source and p not in listed]
+                for pstr in gone:
+                    self._forget_file(pstr)
+
+    @staticmethod
+    def _group(pstr):
+        folder, name = os.path.split(pstr)
+        return folder, _DIGITS_RE.sub("#", name)
+
+    def _superseded(self, pstr, info, now):
+        """True if pstr is a rotated log or an older sibling of its group, i.e. may go cold."""
+        if now < info.get("cold_recheck", 0.0):
+            return False
+        info["cold_recheck"] = now + self.cold_after
+        if _ROTATED_RE.search(pstr):
+            return True
+        group = self._group(pstr)
+        members = self._groups.get(group, ())
+        if len(members) < 2:
+            return False
+        checked = self._newest.get(group)
+        if checked is None or now - checked[0] > self.idle_after:
+            newest, newest_mtime = None, -1
+            for path in members:
+                cold = self._cold.get(path)
+                try:
+                    mtime = cold["mtime"] if cold is not None else os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                if mtime > newest_mtime:
+                    newest, newest_mtime = path, mtime
+            checked = self._newest[group] = (now, newest)
+        return checked[1] is not None and checked[1] != pstr
+
+    def _make_cold(self, pstr, info, now):
+        """Move an idle file out of the working set (its checkpoint is kept)."""
+        try:
+            st = os.stat(pstr)
+        except OSError:
+            return
+        del self._files[pstr]
+        if self._watcher:
+            self._watcher.unwatch_file(pstr)
+        self._cold[pstr] = {
+            "offset": info["pos"] - len(info.get("carry", b"")),
+            "inode": info.get("inode"),
+            "size": st.st_size,
+            "mtime": st.st_mtime_ns,
+            "next_check": now + self.cold_interval,
+            "source": info["source"],
+        }
+        self._next_cold_check = min(self._next_cold_check, now + self.cold_interval)
+
+    def _check_cold(self, now, changed):
+        """stat() the cold files that are due (or reported changed); bring back the ones that changed."""
+        if changed is None:
+            woken = list(self._cold)  # events were lost
+        else:
+            woken = [p for p in changed if p in self._cold]
+        if now >= self._next_cold_check:
+            woken += [p for p, c in self._cold.items() if c["next_check"] <= now]
+        for pstr in woken:
+            cold = self._cold.get(pstr)
+            if cold is None:
+                continue
+            try:
+                st = os.stat(pstr)
+            except OSError:
+                self._forget_file(pstr)
+                continue
+            if st.st_size != cold["size"] or st.st_mtime_ns != cold["mtime"] or \
+                    getattr(st, "st_ino", None) != cold["inode"]:
+                del self._cold[pstr]
+                self._register_file(pstr, cold["source"], cold=cold)
+            else:
+                cold["next_check"] = now + self.cold_interval
+        if woken or now >= self._next_cold_check:
+            self._next_cold_check = min((c["next_check"] for c in self._cold.values()), default=float("inf"))
+
+    def _scan_and_read(self, changed=None):
+        """
+        changed: set of paths reported by the watcher (None = events were lost,
+        re-check everything).
+        """
+        now = time.monotonic()
+
+        # register files: on schedule, when events were lost, or when a new file shows up
+        if changed is None or now >= self._next_rescan:
+            self._rescan()
+            self._next_rescan = now + self.rescan_interval
+            self._started = True
+        else:
+            for pstr in changed:
+                if pstr not in self._files and pstr not in self._cold:
+                    source = self._source_for(pstr)
+                    if source is not None:
+                        self._register_file(pstr, source)
+        if self._cold:
+            self._check_cold(now, changed)
+
+        # files that changed or are due, per source (oldest check first)
+        due = {}
+        for pstr, info in self._files.items():
+            if changed is not None and pstr not in changed and now < info["next_check"]:
+                continue
+            due.setdefault(info["source"], []).append((info["next_check"], pstr))
+
+        # read budget: shares by priority among the sources with due files, then leftovers
+        budget = self.read_budget
+        total = sum(source.priority for source in due)
+        queues = []
+        for source in self.sources:
+            if source in due:
+                queues.append([source, deque(sorted(due[source])), int(self.read_budget * source.priority / total)])
+        for queue in queues:
+            budget -= self._read_due(queue, now)
+        for queue in queues:
+            if budget <= 0:
+                break
+            if queue[1]:
+                queue[2] = budget
+                budget -= self._read_due(queue, now)
+
+        if self._checkpoints is not None:
+            self._checkpoints.maybe_flush()
+
+    def _read_due(self, queue, now):
+        """Read the due files of one source within its share; returns the bytes read."""
+        source, files, share = queue
+        spent = 0
+        started = time.perf_counter()
+        while files and spent < share:
+            check, pstr = files.popleft()
+            info = self._files.get(pstr)
+            if info is None:
+                continue
+            read = self._read_file(pstr, info, share - spent)
+            spent += read
+            if pstr not in self._files:
+                continue
+            if info["backlog"]:
+                # share used up mid-file: first in line for leftover budget
+                files.appendleft((check, pstr))
+            if read:
+                self._save_checkpoint(pstr, info)
+
+            # adaptive backoff: idle files are checked less and less often
+            if read:
+                info["active"] = now
+                info["interval"] = self.poll_interval
+            elif now - info["active"] < self.idle_after:
+                info["interval"] = self.poll_interval
+            elif now - info["active"] >= self.cold_after > 0 and not info.get("pending") and \
+                    self._superseded(pstr, info, now):
+                self._make_cold(pstr, info, now)
+                continue
+            else:
+                info["interval"] = min(info["interval"] * 2, self.max_idle_interval)
+            info["next_check"] = now + info["interval"]
+
+            # backlog left over the budget: due again right away
+            if info["backlog"]:
+                info["next_check"] = now
+            # a block still being written must be flushed once its timeout passes
+            elif info.get("pending"):
+                info["next_check"] = min(info["next_check"], now + self.assembler.timeout)
+        source.scan_time += time.perf_counter() - started
+        source.backlog = sum(i["backlog"] for i in self._files.values() if i["source"] is source)
+        return spent
+
+    def _read_file(self, pstr, info, limit=None):
+        """Read new lines from one file, at most limit bytes. Returns the number of bytes read."""
+        source = info["source"]
+        reader = source.reader
+        try:
+            st = os.stat(pstr)
+            inode = getattr(st, "st_ino", None)
+
+            # rotation detection: what the old file left pending is reported, not dropped
+            if info.get("inode") and inode != info.get("inode"):
+                self._deliver(pstr, info, reader.flush(pstr, info))
+                reader.reset(info)
+                info["inode"] = inode
+                info["fp_len"] = 0
+
+            # truncate detection
+            if st.st_size < info.get("pos", 0):
+                self._deliver(pstr, info, reader.flush(pstr, info))
+                reader.reset(info)
+                info["fp_len"] = 0
+
+            # nothing appended: skip the open()
+            if st.st_size == info.get("pos", 0) and not info.get("pending"):
+                info["backlog"] = 0
+                return 0
+
+            before = reader.bytes_read
+            self._deliver(pstr, info, reader.read(pstr, info, st.st_size, limit))
+            info["backlog"] = max(st.st_size - info["pos"], 0)
+            # a pending block re-read at the end counts as activity too
+            return max(reader.bytes_read - before, 1)
+        except FileNotFoundError:
+            self._forget_file(pstr)
+        except Exception:
+            pass
+        return 0
+
+    def _deliver(self, pstr, info, items):
+        """Hand (end_offset, raw) items read from pstr to on_line, or match them and call on_lines once."""
+        source = info["source"]
+        hits = []
+        for pos, raw in items:
+            line, _, stack = raw.decode("utf-8", errors="ignore").partition("\n")
+
+            if source.matcher is None:
+                payload = {
+                    "path": pstr,
+                    "line": line,
+                    "pos": pos,
+                    "inode": info.get("inode"),
+                    "ts": time.time(),
+                    "source": source.name,
+                }
+                source.lines_forwarded += 1
+                self.on_line(payload)
+                continue
+
+            matched = source.matcher.match(line, pstr)
+            if matched:
+                if stack:
+                    matched["stack"] = stack.replace("\r\n", "\n")
+                around = info.get("context", {}).get(pos)
+                if around and (around[0] or around[1]):
+                    matched["context"] = {
+                        "before": around[0].decode("utf-8", errors="ignore").replace("\r\n", "\n"),
+                        "after": around[1].decode("utf-8", errors="ignore").replace("\r\n", "\n"),
+                    }
+                hits.append((pos, matched))
+        info.pop("context", None)
+
+        # batch mode: one signal per file per cycle, matched lines only
+        if hits:
+            source.lines_forwarded += len(hits)
+            self.on_lines({"path": pstr, "inode": info.get("inode"), "ts": time.time(), "source": source.name,
+                           "hits": hits})
+
+    @property
+    def max_idle_interval(self):
+        if self._max_idle_interval is not None:
+            return float(self._max_idle_interval)
+        # with real events the schedule is only a safety net
+        return 8.0 if self._polling else 60.0
+
+    @property
+    def rescan_interval(self):
+        if self._rescan_interval is not None:
+            return float(self._rescan_interval)
+        return self.poll_interval if self._polling else 30.0
+
+    @property
+    def _polling(self):
+        return self._watcher is None or self._watcher.name == "poll"
+
+    def _next_wait(self):
+        now = time.monotonic()
+        deadline = min(self._next_rescan, self._next_cold_check)
+        for info in self._files.values():
+            deadline = min(deadline, info["next_check"])
+        return min(max(deadline - now, 0.0), self.max_idle_interval)
+
+    def open(self):
+        """Create the watcher backend; call on the thread that runs the loop."""
+        self._watcher = create_watcher(self.watch_backend, logger=self.logger)
+        roots = [source.root for source in self.sources if os.path.isdir(source.root)]
+        try:
+            for root in roots:
+                if root not in self._watched:
+                    self._watcher.watch(root)
+                    self._watched.add(root)
+        except Exception:
+            if self.logger:
+                self.logger.debug("Cannot watch %s, falling back to polling", roots, exc_info=True)
+            self._watcher.close()
+            self._watcher = create_watcher("poll")
+        if self.logger:
+            self.logger.debug("Tailing %s with %s backend", ", ".join("%s=%s" % (s.name, s.root) for s in self.sources),
+                              self._watcher.name)
+
+    def step(self, changed=None):
+        """One scan/read cycle, then wait for changes. Returns the changed set for the next step."""
+        try:
+            with self.metrics.timer("tail.cycle"):
+                self._scan_and_read(changed)
+        except Exception:
+            pass
+        return self._watcher.wait(self._next_wait())
+
+    def close(self):
+        if self._checkpoints is None:
+            # nothing resumes these next time: report the blocks still pending
+            for pstr, info in list(self._files.items()):
+                try:
+                    self._deliver(pstr, info, info["source"].reader.flush(pstr, info))
+                except Exception:
+                    if self.logger:
+                        self.logger.debug("Cannot flush %s", pstr, exc_info=True)
+        self._watcher.close()
+        if self._checkpoints is not None:
+            try:
+                self._checkpoints.flush()
+            except Exception:
+                if self.logger:
+                    self.logger.debug("Cannot save tail checkpoints", exc_info=True)
+
+    def run(self, should_stop=None):
+        """Tail until stop() is called (or should_stop() returns True)."""
+        self.open()
+        changed = None
+        try:
+            while not self._stopping.is_set() and not (should_stop and should_stop()):
+                changed = self.step(changed)
+        finally:
+            self.close()
@@ -0,0 +1,195 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+class CountMinSketch(object):
+    """
+    Approximate per-key hit counts over a sliding window in fixed memory
+    (depth x width counters). Estimates never undercount; they may overcount
+    when keys collide in every row (conservative update keeps that low).
+
+    Two sketches are kept, the current and the previous window; a count covers
+    between one and two windows.
+    """
+
+    def __init__(self, window, width=8192, depth=4):
+        self.window = float(window)
+        self.width = int(width)
+        self.depth = int(depth)
+        self._current = self._new()
+        self._previous = self._new()
+        self._window_start = None
+
+    def _new(self):
+        return [array("I", bytes(4 * self.width)) for _ in range(self.depth)]
+
+    def _rotate(self, now):
+        if self._window_start is None:
+            self._window_start = now
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+        self._previous = self._current if elapsed < 2 * self.window else self._new()
+        self._current = self._new()
+        self._window_start = now
+
+    def _cells(self, key):
+        return [hash((row, key)) % self.width for row in range(self.depth)]
+
+    def add(self, key, now=None):
+        """Count one hit for key; returns the new estimate."""
+        self._rotate(time.monotonic() if now is None else now)
+        cells = self._cells(key)
+        # conservative update: only raise the counters that are at the current minimum
+        target = min(self._current[row][cell] for row, cell in enumerate(cells)) + 1
+        for row, cell in enumerate(cells):
+            if self._current[row][cell] < target:
+                self._current[row][cell] = target
+        return target + min(self._previous[row][cell] for row, cell in enumerate(cells))
+
+    def estimate(self, key, now=None):
+        self._rotate(time.monotonic() if now is None else now)
+        return min(self._current[row][cell] + self._previous[row][cell] for row, cell in enumerate(self._cells(key)))
+
+
+class FloodGuard(object):
+    """
+    Per-signature flood protection in O(max_keys) memory:
+      - cooldown: at most one upload per signature every `cooldown` seconds
+      - burst: a token bucket per signature, emptied by burst_threshold hits
+        within about burst_window seconds; that blacklists the signature for
+        `blackout` seconds
+
+    Signature state lives in an LRU capped at max_keys; the least recently seen
+    signatures are evicted (and counted). With sketch=True, hits are also
+    counted in a CountMinSketch (fixed 2 x depth x width counters), so a
+    signature that keeps coming back but gets evicted in between (long tail of
+    unique errors) still trips the burst detection.
+    """
+
+    def __init__(self, cooldown=60, burst_threshold=5, burst_window=10, blackout=300, max_keys=4096, sketch=False,
+                 sketch_width=8192, sketch_depth=4):
+        self.cooldown = float(cooldown)
+        self.burst_threshold = int(burst_threshold)
+        self.burst_window = float(burst_window)
+        self.blackout = float(blackout)
+        self.max_keys = max(int(max_keys), 1)
+        # burst_threshold hits within burst_window: the first (threshold - 1) are covered by the bucket
+        self.capacity = max(self.burst_threshold - 1, 0)
+        self.refill_rate = self.capacity / self.burst_window if self.burst_window > 0 else float("inf")
+        self.sketch = CountMinSketch(burst_window, sketch_width, sketch_depth) if sketch else None
+        self._keys = OrderedDict()  # signature -> [tokens, refilled_at, sent_at, blackout_until]
+
+        # counters
+        self.evicted = 0
+        self.blackouts = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _entry(self, key, now, create=True):
+        entry = self._keys.get(key)
+        if entry is not None:
+            self._keys.move_to_end(key)
+            return entry
+        if not create:
+            return None
+        entry = self._keys[key] = [float(self.capacity), now, None, 0.0]
+        if len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+            self.evicted += 1
+        return entry
+
+    def is_blacklisted(self, key, now):
+        entry = self._keys.get(key)
+        if entry is None or not entry[3]:
+            return False
+        if now < entry[3]:
+            return True
+        entry[3] = 0.0
+        return False
+
+    def in_cooldown(self, key, now):
+        entry = self._keys.get(key)
+        return entry is not None and entry[2] is not None and now - entry[2] < self.cooldown
+
+    def hit(self, key, now):
+        """Record an occurrence; returns True if the signature just entered blackout."""
+        known = key in self._keys
+        entry = self._entry(key, now)
+        tokens = min(self.capacity, entry[0] + (now - entry[1]) * self.refill_rate)
+        entry[1] = now
+        burst = tokens < 1
+        entry[0] = tokens if burst else tokens - 1
+        if self.sketch is not None:
+            count = self.sketch.add(key, now)
+            # state was evicted (or never kept): fall back on the approximate count
+            burst = burst or (not known and count >= self.burst_threshold)
+        if not burst:
+            return False
+        entry[0] = float(self.capacity)
+        entry[3] = now + self.blackout
+        self.blackouts += 1
+        return True
+
+    def blackout_until(self, key):
+        entry = self._keys.get(key)
+        return entry[3] if entry else None
+
+    def was_sent(self, key):
+        """True if an upload was spooled for key (as far as the LRU remembers)."""
+        entry = self._keys.get(key)
+        return entry is not None and entry[2] is not None
+
+    def mark_sent(self, key, now):
+        self._entry(key, now)[2] = now
+
+    def stats(self):
+        return {"keys": len(self._keys), "max_keys": self.max_keys, "evicted": self.evicted, "blackouts": self.blackouts}
+
+
+class SeenBlocks(object):
+    """
+    Log blocks handled lately, so a block tailed both by this process and by
+    a secondary instance forwarding to it is handled once (see
+    IncidentPipeline.on_forwarded()). A block is keyed by (path, inode,
+    offset, signature); each origin (process) reports it once per
+    occurrence. A report from another origin within ttl seconds is the same
+    occurrence (a duplicate); a second report from the same origin is a new
+    one, e.g. the same bytes written again after a truncation, and starts
+    over. At most max_keys blocks are kept.
+    """
+
+    def __init__(self, ttl=60.0, max_keys=4096):
+        self.ttl = float(ttl)
+        self.max_keys = max(int(max_keys), 1)
+        self._items = OrderedDict()  # key -> [first report time, origins]; oldest first
+        self._lock = threading.Lock()
+
+        # counters
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def duplicate(self, key, origin, now=None):
+        """Record a report of block key from origin; True if another origin already reported it."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            while self._items:
+                oldest = next(iter(self._items.values()))
+                if oldest[0] > now - self.ttl:
+                    break
+                self._items.popitem(last=False)
+            entry = self._items.get(key)
+            if entry is not None and origin not in entry[1]:
+                entry[1].add(origin)
+                self.duplicates += 1
+                return True
+            self._items[key] = [now, {origin}]
+            self._items.move_to_end(key)
+            if len(self._items) > self.max_keys:
+                self._items.popitem(last=False)
+            return False
@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TitleCache(object):
+    """
+    Thread-safe TTL + LRU map of known ticket titles -> ticket id.
+
+    A hit means the ticket already exists and the FPTR lookup can be skipped.
+    Optionally persisted as JSON between sessions.
+    """
+
+    def __init__(self, max_size=4096, ttl=6 * 3600, path=None):
+        self.max_size = int(max_size)
+        self.ttl = float(ttl)
+        self.path = path
+        self._items = OrderedDict()  # title -> (ticket_id, expires_at)
+        self._lock = threading.Lock()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, title, now=None):
+        """Return the cached ticket id for title, or None."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._items.get(title)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._items[title]
+                self.misses += 1
+                return None
+            self._items.move_to_end(title)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, title):
+        """Known and not expired (not counted as a hit or miss)."""
+        entry = self._items.get(title)
+        return entry is not None and entry[1] >= time.time()
+
+    def add(self, title, ticket_id, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._items[title] = (ticket_id, now + self.ttl)
+            self._items.move_to_end(title)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+    # -------------------------
+    # persistence
+    # -------------------------
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        now = time.time()
+        with self._lock:
+            for title, (ticket_id, expires) in sorted(data.items(), key=lambda kv: kv[1][1]):
+                if expires > now:
+                    self._items[title] = (ticket_id, expires)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            return len(self._items)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = dict(self._items)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, self.path)
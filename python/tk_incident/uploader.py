@@ -1,11 +1,20 @@
+import copy
+import datetime
+import getpass
+import os
 import time
 import re
-import hashlib
 import logging
 from pathlib import Path
 
 import sgtk
 
+from .fingerprint import fingerprint
+from .metrics import Metrics
+from .excerpt import remove_excerpt, write_excerpt
+from .paths import cache_dir
+from .title_cache import TitleCache
+
 
 class Uploader(object):
     """
@@ -16,179 +25,481 @@ class Uploader(object):
       - shotgun_project_id (int)
       - ticket_entity_type (str)  # default "Ticket"
       - ticket_attachment_field (str)  # default "attachments"
-      - max_retries (int)  # default 3
-      - backoff_base_sec (int/float)  # default 2
+      - ticket_title_field (str)  # default: first of title/subject/name in the entity schema
+      - attachment_mode (str)  # "excerpt" (default) or "full"
+      - excerpt_before_kb / excerpt_after_kb / excerpt_header_kb (int)  # default 64 / 16 / 4
+      - excerpt_before_lines / excerpt_after_lines (int)  # optional, line based window
+      - excerpt_compression (str)  # "gzip" (default), "lzma" or "none"
+      - title_cache_size (int)  # default 4096
+      - title_cache_ttl_sec (int)  # default 6h
+      - title_cache_persist (bool)  # default False, keep known titles between sessions
+      - title_prefetch_days (int)  # default 30
+      - title_prefetch_limit (int)  # default 500
+      - occurrence_count_field (str)  # default "sg_occurrences", skipped if not in the schema
+      - occurrence_last_seen_field (str)  # default "sg_last_seen", skipped if not in the schema
+      - occurrence_notes (bool)  # default True, a Note per flushed ticket
+
+    occurrences: optional OccurrenceAggregator; duplicates of existing
+    tickets are tallied there instead of being dropped.
+    rate_control: optional RateController, told the latency and outcome of
+    every FPTR call.
     """
 
-    def __init__(self, shotgun=None, logger=None, settings=None):
+    def __init__(self, shotgun=None, logger=None, settings=None, metrics=None, occurrences=None, rate_control=None):
         self._sg = shotgun
         self.logger = logger or logging.getLogger(__name__)
         self.settings = settings or {}
+        self.metrics = metrics or Metrics()
+        self.rate_control = rate_control
 
         upload_cfg = self.settings.get("upload") or {}
         self.project_id = int(upload_cfg["shotgun_project_id"])
         self.ticket_entity_type = upload_cfg.get("ticket_entity_type", "Ticket")
         self.attach_field = upload_cfg.get("ticket_attachment_field", "attachments")
-        self.max_retries = int(upload_cfg.get("max_retries", 3))
-        self.backoff = float(upload_cfg.get("backoff_base_sec", 2))
+        self.title_field = upload_cfg.get("ticket_title_field")  # resolved from the schema on first use
+        # resolved once, shared with the with_connection() copies: user login, ticket schema
+        self._resolved = {}
+
+        # occurrences of existing tickets: count / last seen fields, resolved from the schema
+        self.occurrences = occurrences
+        self.occurrence_notes = bool(upload_cfg.get("occurrence_notes", True))
+        self._occurrence_wanted = {
+            "count": upload_cfg.get("occurrence_count_field", "sg_occurrences"),
+            "last_seen": upload_cfg.get("occurrence_last_seen_field", "sg_last_seen"),
+        }
+        self.occurrence_fields = None
+
+        # attachment: window around the match instead of the whole log
+        self.attachment_mode = upload_cfg.get("attachment_mode", "excerpt")
+        self.excerpt_opts = {
+            "before_bytes": int(upload_cfg.get("excerpt_before_kb", 64)) * 1024,
+            "after_bytes": int(upload_cfg.get("excerpt_after_kb", 16)) * 1024,
+            "header_bytes": int(upload_cfg.get("excerpt_header_kb", 4)) * 1024,
+            "before_lines": upload_cfg.get("excerpt_before_lines") or None,  # 0 / unset: byte window only
+            "after_lines": upload_cfg.get("excerpt_after_lines") or None,
+            "compression": upload_cfg.get("excerpt_compression", "gzip"),
+        }
+
+        # known titles: a hit skips the FPTR lookup entirely
+        self.prefetch_days = int(upload_cfg.get("title_prefetch_days", 30))
+        self.prefetch_limit = int(upload_cfg.get("title_prefetch_limit", 500))
+        cache_path = None
+        if upload_cfg.get("title_cache_persist", False):
+            cache_path = os.path.join(cache_dir(), f"titles_{self.project_id}.json")
+        self.title_cache = TitleCache(
+            max_size=int(upload_cfg.get("title_cache_size", 4096)),
+            ttl=float(upload_cfg.get("title_cache_ttl_sec", 6 * 3600)),
+            path=cache_path,
+        )
+        try:
+            self.title_cache.load()
+        except Exception:
+            self.logger.debug("Cannot load title cache", exc_info=True)
+        self.metrics.counter_fn("titles.cache_hits", lambda: self.title_cache.hits)
+        self.metrics.counter_fn("titles.cache_misses", lambda: self.title_cache.misses)
+
+    def with_connection(self, shotgun):
+        """Copy of this uploader using another FPTR connection (title cache is shared)."""
+        clone = copy.copy(self)
+        clone._sg = shotgun
+        return clone
+
+    def close(self):
+        self.logger.debug(f"Title cache stats: {self.title_cache.stats()}")
+        try:
+            self.title_cache.save()
+        except Exception:
+            self.logger.debug("Cannot save title cache", exc_info=True)
 
     # -------------------------
     # user helpers (sgtk)
     # -------------------------
     def _get_user_login(self):
-        """Try to get authenticated user via sgtk helper."""
+        """
+        Authenticated user via sgtk helper (OS user for script-key / headless
+        sessions); looked up once, it is in every ticket title.
+        """
+        if "login" in self._resolved:
+            return self._resolved["login"]
+        login = None
         try:
             user = sgtk.get_authenticated_user()
             if user:
                 login = getattr(user, "login", None)
-                return login
         except Exception:
             self.logger.debug("sgtk.get_authenticated_user() failed", exc_info=True)
+        if login is None:
+            try:
+                login = getpass.getuser()
+            except Exception:
+                pass
+        self._resolved["login"] = login
+        return login
 
     # -------------------------
     # title helpers
     # -------------------------
-    def _strip_leading_timestamp(self, text):
-        """
-        Remove leading timestamp like:
-        2026-01-14 19:49:11,961 ...
-        and common bracketed prefixes, to avoid time/engine leaking into title.
-        """
-        if not text:
-            return ""
-        # Remove leading ISO-like datetime (YYYY-MM-DD HH:MM:SS,ms)
-        txt = re.sub(r'^\s*\d{4}-\d{2}-\d{2}\s+\d{1,2}:\d{2}:\d{2}(?:,\d+)?\s*', '', text, count=1)
-        # Also remove leading bracketed PID/INFO blocks like "[2764 ERROR ...]"
-        txt = re.sub(r'^\s*\[[^\]]+\]\s*', '', txt, count=1)
-        return txt
-
-    def _extract_error_name(self, text):
-        """Try to extract Exception/Error name (OverflowError, ValueError, ...)"""
-        if not text:
-            return None
-        m = re.search(r'([A-Za-z_][A-Za-z0-9_]*(?:Error|Exception))', text)
-        if m:
-            return m.group(1)
-        return None
-
-    def _short_text(self, text, max_len=80):
-        if not text:
-            return ""
-        s = " ".join(text.strip().split())
-        return s[:max_len]
-
-    def _make_title_signature(self, matched_line):
+    def _make_title_signature(self, matched_line, stack=None):
         """
-        Title format: "<user_login> - <ErrorName or short message>"
-        This removes leading timestamp/engine info from matched_line first.
+        Title format: "<user_login> - <ErrorName or normalized short message>"
+        The label comes from the shared fingerprint (see fingerprint.py), so
+        titles and the agent's throttle keys always agree.
         """
         user_login = self._get_user_login()
-        core_line = self._strip_leading_timestamp(matched_line or "")
-        err = self._extract_error_name(core_line)
-        if err:
-            core = err
-        else:
-            core = self._short_text(core_line or "Unknown error", max_len=80)
-            if not core:
-                core = hashlib.sha1((matched_line or "").encode("utf-8")).hexdigest()[:10]
-
+        label = fingerprint(matched_line or "", stack).label
         user_s = re.sub(r"[\r\n\t]+", " ", str(user_login)).strip()
-        core_s = re.sub(r"[\r\n\t]+", " ", str(core)).strip()
-        return f"{user_s} - {core_s}"
+        return f"{user_s} - {label}"
+
+    def title_for(self, trigger):
+        """Ticket title a trigger (matched dict) will be filed under."""
+        return self._make_title_signature(trigger.get("matched_line", ""), trigger.get("stack"))
 
     # -------------------------
     # FPTR helpers
     # -------------------------
-    def _find_ticket_by_title(self, title):
-        """Find ticket with exact title. Return dict or None."""
-        if not self._sg:
-            return None
+    def _call(self, method, *args, **kwargs):
+        """self._sg.<method>(...), timed into the fptr.<method> histogram and reported to rate_control."""
+        started = time.perf_counter()
+        ok = False
         try:
-            return self._sg.find_one(self.ticket_entity_type, [["title", "is", title]], ["id"])
+            with self.metrics.timer("fptr." + method):
+                result = getattr(self._sg, method)(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            if self.rate_control is not None:
+                # attachment uploads are slow by nature: only their errors count
+                self.rate_control.record(time.perf_counter() - started, ok, timed=method != "upload")
+
+    def _read_schema(self):
+        """Field names of the ticket entity (read once), or None when the schema cannot be read."""
+        if "schema" not in self._resolved and self._sg:
+            try:
+                self._resolved["schema"] = set(self._call("schema_field_read", self.ticket_entity_type))
+            except Exception:
+                self.logger.debug(f"Cannot read {self.ticket_entity_type} schema", exc_info=True)
+        return self._resolved.get("schema")
+
+    def resolve(self):
+        """Look up the user login and ticket fields now (they are cached for every later upload)."""
+        self._get_user_login()
+        self.resolve_title_field()
+        self.resolve_occurrence_fields()
+
+    def project_exists(self):
+        """True if the project is visible to this connection (FPTR errors are raised)."""
+        return bool(self._call("find_one", "Project", [["id", "is", self.project_id]], ["id"]))
+
+    def resolve_title_field(self):
+        """Pick the field holding the title signature once, from the entity schema."""
+        if self.title_field:
+            return self.title_field
+        field = "title"
+        if self._sg:
+            schema = self._read_schema()
+            if schema is None:
+                return field
+            field = next((f for f in ("title", "subject", "name") if f in schema), field)
+        self.title_field = field
+        self.logger.debug(f"Ticket title field: {field}")
+        return field
+
+    def resolve_occurrence_fields(self):
+        """{"count": field or None, "last_seen": field or None}: the configured fields the schema has."""
+        if self.occurrence_fields is not None:
+            return self.occurrence_fields
+        schema = self._read_schema()
+        if schema is None:
+            return {"count": None, "last_seen": None}
+        self.occurrence_fields = {k: (f if f in schema else None) for k, f in self._occurrence_wanted.items()}
+        self.logger.debug(f"Ticket occurrence fields: {self.occurrence_fields}")
+        return self.occurrence_fields
+
+    def prefetch_titles(self):
+        """
+        Seed the title cache with one bulk find of this user's recent tickets
+        in the project (titles start with "<user_login> - ").
+        """
+        user_login = self._get_user_login()
+        if not self._sg or not user_login:
+            return 0
+        field = self.resolve_title_field()
+        filters = [
+            ["project", "is", {"type": "Project", "id": self.project_id}],
+            [field, "starts_with", f"{user_login} - "],
+            ["created_at", "in_last", [self.prefetch_days, "DAY"]],
+        ]
+        tickets = self._call(
+            "find",
+            self.ticket_entity_type,
+            filters,
+            ["id", field],
+            order=[{"field_name": "created_at", "direction": "desc"}],
+            limit=self.prefetch_limit,
+        )
+        for ticket in tickets:
+            if ticket.get(field):
+                self.title_cache.add(ticket[field], ticket["id"])
+        self.logger.debug(f"Prefetched {len(tickets)} ticket titles")
+        return len(tickets)
+
+    def _find_tickets_by_title(self, titles):
+        """
+        Find tickets with exact titles (cache first, then one FPTR find).
+        Return {title: ticket_id}. A failed find raises: without it every
+        uncached title would look new and get a duplicate ticket.
+        """
+        found = {}
+        missing = []
+        for title in titles:
+            ticket_id = self.title_cache.get(title)
+            if ticket_id is not None:
+                found[title] = ticket_id
+            else:
+                missing.append(title)
+        if not missing or not self._sg:
+            return found
+        field = self.resolve_title_field()
+        tickets = self._call("find", self.ticket_entity_type, [[field, "in", missing]], ["id", field])
+        for ticket in tickets:
+            title = ticket.get(field)
+            if title in missing and title not in found:
+                found[title] = ticket["id"]
+                self.title_cache.add(title, ticket["id"])
+        return found
+
+    def _create_tickets(self, payloads):
+        """Create tickets in one sg.batch call. Return the created ids (same order), or None on failure."""
+        requests = [
+            {"request_type": "create", "entity_type": self.ticket_entity_type, "data": payload}
+            for payload in payloads
+        ]
+        try:
+            created = self._call("batch", requests)
         except Exception:
-            self.logger.debug(f"Title-based lookup failed (title={title!r})", exc_info=True)
+            self.logger.exception(f"Batch create of {len(requests)} tickets failed")
             return None
+        return [(entity or {}).get("id") for entity in created]
 
-    def _attach_log_to_ticket(self, ticket_id, log_path):
-        """Upload log file to ticket (with retries)."""
+    def _attach_log_to_ticket(self, ticket_id, log_path, pos=None):
+        """Upload log file (or a compressed excerpt around pos) to ticket. Retries are up to the caller."""
         if not self._sg:
             return False
 
         p = log_path if isinstance(log_path, Path) else Path(log_path)
 
-        for attempt in range(1, self.max_retries + 1):
+        excerpt = None
+        if self.attachment_mode != "full" and pos is not None:
             try:
-                self._sg.upload(self.ticket_entity_type, ticket_id, str(p), field_name=self.attach_field)
-                return True
+                excerpt = write_excerpt(str(p), pos, **self.excerpt_opts)
             except Exception:
-                self.logger.exception(f"Upload attempt {attempt} failed (ticket={ticket_id}, file={p})")
-                if attempt < self.max_retries:
-                    time.sleep(self.backoff * attempt)
+                self.logger.exception(f"Cannot write log excerpt for {p}, attaching the full file")
+        upload_path = excerpt or str(p)
 
-        return False
+        try:
+            self._call("upload", self.ticket_entity_type, ticket_id, upload_path, field_name=self.attach_field)
+            return True
+        except Exception:
+            self.logger.exception(f"Upload failed (ticket={ticket_id}, file={upload_path})")
+            return False
+        finally:
+            if excerpt:
+                remove_excerpt(excerpt)
 
     # -------------------------
     # main method
     # -------------------------
+    def _make_description(self, p, pos, trigger, title):
+        matched_line = trigger.get("matched_line", "")
+        stack = trigger.get("stack")
+        detected_at = trigger.get("detected_ts", time.time())
+        description = f"Matched line:\n{matched_line}\n\n"
+        if stack:
+            description += f"Stack:\n{stack}\n\n"
+        context = trigger.get("context")
+        if context:
+            # lines around the match, from the agent's memory (the log may be gone or rotated by now)
+            description += f"Context:\n{context.get('before', '')}>> {matched_line}\n{context.get('after', '')}\n"
+        backfill = trigger.get("backfill")
+        if backfill:
+            description += (
+                f"Found by backfill: {backfill['count']} occurrences in {backfill['files']} files, "
+                f"first seen {backfill['first_seen']}, last seen {backfill['last_seen']}\n\n"
+            )
+        description += (
+            f"Detected at: {detected_at}\n"
+            f"Log path: {p}\n"
+            f"Matched byte offset: {pos}\n"
+            f"\n--- INCIDENT_TITLE_SIGNATURE: {title} ---\n"
+        )
+        return description
+
     def upload_log(self, log_path, pos, trigger):
         """
         Create a ticket whose title is the signature.
         If a ticket with the same title already exists, do nothing and return True.
         """
-        p = Path(log_path)
-        if not p.exists():
-            self.logger.error(f"Log file not found: {p}")
-            return False
+        return self.upload_batch([(log_path, pos, trigger)])[0]
 
-        matched_line = trigger.get("matched_line", "")
-        title = self._make_title_signature(matched_line)
+    def upload_batch(self, items):
+        """
+        upload_log() for a list of (log_path, pos, trigger) items, with one
+        title lookup and one batch create for all of them; only attachments
+        are uploaded one by one. Returns a list of bools (success per item);
+        raises if the title lookup fails (nothing was created, retry later).
 
-        # 1) check existing ticket by exact title
-        existing = self._find_ticket_by_title(title)
-        if existing:
-            self.logger.info(f"Ticket exists (id={existing.get('id')}). Skipping creation.")
-            return True
+        If a ticket was created but its attachment failed, trigger["attach_to"]
+        is set to the ticket id: retrying that item only uploads the attachment.
+        """
+        results = [False] * len(items)
+        if not self._sg:
+            return results
+        field = self.resolve_title_field()
 
-        # 2) create new ticket
-        detected_at = trigger.get("detected_ts", time.time())
-        description = (
-            f"Matched line:\n{matched_line}\n\n"
-            f"Detected at: {detected_at}\n"
-            f"Log path: {p}\n"
-            f"Matched byte offset: {pos}\n"
-            f"\n--- INCIDENT_TITLE_SIGNATURE: {title} ---\n"
-        )
+        # 1) titles (one ticket per title, even if it shows up several times)
+        by_title = {}
+        for i, (log_path, pos, trigger) in enumerate(items):
+            p = Path(log_path)
+            if not p.exists():
+                self.logger.error(f"Log file not found: {p}")
+                continue
+            if trigger.get("attach_to"):
+                results[i] = self._attach_log_to_ticket(trigger["attach_to"], p, pos)
+                continue
+            by_title.setdefault(self.title_for(trigger), []).append(i)
 
-        payload_base = {
-            "project": {"type": "Project", "id": self.project_id},
-            "description": description,
-        }
+        # 2) check existing tickets by exact title
+        existing = self._find_tickets_by_title(list(by_title))
+        new_titles = []
+        for title, indexes in by_title.items():
+            if title in existing:
+                self.logger.info(f"Ticket exists (id={existing[title]}). Skipping creation.")
+                self.metrics.inc("upload.tickets_existing")
+                for i in indexes:
+                    results[i] = True
+                    if self.occurrences is not None:
+                        trigger = items[i][2]
+                        backfill = trigger.get("backfill") or {}
+                        self.occurrences.add(title, backfill.get("last_seen", trigger.get("detected_ts")),
+                                             trigger.get("host"), count=backfill.get("count", 1),
+                                             first_seen=backfill.get("first_seen"))
+            else:
+                new_titles.append(title)
+        if not new_titles:
+            return results
 
-        created = None
-        for title_field in ("title", "subject", "name"):
-            try:
-                payload = dict(payload_base)
-                payload[title_field] = title
-                created = self._sg.create(self.ticket_entity_type, payload)
-                if created:
-                    break
-            except Exception:
-                self.logger.exception(f"Create attempt failed (field={title_field})")
-                created = None
+        # 3) create new tickets in one round trip
+        occurrence_fields = self.resolve_occurrence_fields()
+        payloads = []
+        for title in new_titles:
+            log_path, pos, trigger = items[by_title[title][0]]
+            payload = {
+                "project": {"type": "Project", "id": self.project_id},
+                "description": self._make_description(Path(log_path), pos, trigger, title),
+                field: title,
+            }
+            if occurrence_fields["count"]:
+                payload[occurrence_fields["count"]] = sum(
+                    (items[i][2].get("backfill") or {}).get("count", 1) for i in by_title[title])
+            if occurrence_fields["last_seen"]:
+                payload[occurrence_fields["last_seen"]] = datetime.datetime.fromtimestamp(
+                    trigger.get("detected_ts", time.time()))
+            payloads.append(payload)
+        ticket_ids = self._create_tickets(payloads)
+        self.metrics.inc("upload.tickets_created", len([t for t in ticket_ids or [] if t]))
+        if ticket_ids is None:
+            self.logger.error(f"Failed to create {len(new_titles)} tickets")
+            return results
 
-        if not created:
-            self.logger.error(f"Failed to create ticket for log {p}")
-            return False
+        # 4) attach log to each new ticket
+        for title, ticket_id in zip(new_titles, ticket_ids):
+            first = by_title[title][0]
+            log_path, pos, trigger = items[first]
+            p = Path(log_path)
+            if not ticket_id:
+                self.logger.error(f"FPTR returned invalid ticket id for {title!r}")
+                continue
+            self.title_cache.add(title, ticket_id)
+            # the ticket exists now: duplicates of it are done either way
+            for i in by_title[title][1:]:
+                results[i] = True
+            if self._attach_log_to_ticket(ticket_id, p, pos):
+                self.logger.info(f"Uploaded log {p.name} to new ticket id={ticket_id}")
+                results[first] = True
+            else:
+                self.logger.error(f"Attachment failed for newly created ticket {ticket_id}")
+                trigger["attach_to"] = ticket_id
+        return results
 
-        ticket_id = created.get("id")
-        if not ticket_id:
-            self.logger.error(f"FPTR returned invalid ticket id: {created!r}")
-            return False
+    # -------------------------
+    # occurrences of existing tickets
+    # -------------------------
+    def _occurrence_note(self, ticket_id, entry):
+        first = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["first_seen"]))
+        last = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["last_seen"]))
+        content = f"{entry['count']} more occurrences between {first} and {last}"
+        if entry["hosts"]:
+            content += f" on {', '.join(entry['hosts'])}"
+        return {
+            "request_type": "create",
+            "entity_type": "Note",
+            "data": {
+                "project": {"type": "Project", "id": self.project_id},
+                "subject": f"{entry['count']} more occurrences",
+                "content": content,
+                "note_links": [{"type": self.ticket_entity_type, "id": ticket_id}],
+            },
+        }
 
-        # 3) attach log to new ticket
-        if self._attach_log_to_ticket(ticket_id, p):
-            self.logger.info(f"Uploaded log {p.name} to new ticket id={ticket_id}")
-            return True
+    def update_occurrences(self, entries):
+        """
+        Apply aggregated occurrences (see occurrences.py) to their tickets:
+        one find for the ticket ids and current counts, then one sg.batch with
+        an update (count, last seen) and a Note per ticket. Returns the entries
+        that were not applied (no ticket yet, or FPTR failed).
+        """
+        if not entries or not self._sg:
+            return list(entries)
+        field = self.resolve_title_field()
+        occurrence_fields = self.resolve_occurrence_fields()
+        extra = [f for f in occurrence_fields.values() if f]
+        titles = [entry["title"] for entry in entries]
+        try:
+            tickets = self._call("find", self.ticket_entity_type, [[field, "in", titles]], ["id", field] + extra)
+        except Exception:
+            self.logger.debug(f"Occurrence lookup failed ({len(titles)} titles)", exc_info=True)
+            return list(entries)
+        by_title = {}
+        for ticket in tickets:
+            by_title.setdefault(ticket.get(field), ticket)
 
-        self.logger.error(f"Attachment failed for newly created ticket {ticket_id}")
-        return False
+        requests, applied, leftover = [], 0, []
+        for entry in entries:
+            ticket = by_title.get(entry["title"])
+            if ticket is None:
+                leftover.append(entry)
+                continue
+            self.title_cache.add(entry["title"], ticket["id"])
+            data = {}
+            if occurrence_fields["count"]:
+                data[occurrence_fields["count"]] = (ticket.get(occurrence_fields["count"]) or 1) + entry["count"]
+            if occurrence_fields["last_seen"]:
+                data[occurrence_fields["last_seen"]] = datetime.datetime.fromtimestamp(entry["last_seen"])
+            if data:
+                requests.append({
+                    "request_type": "update",
+                    "entity_type": self.ticket_entity_type,
+                    "entity_id": ticket["id"],
+                    "data": data,
+                })
+            if self.occurrence_notes:
+                requests.append(self._occurrence_note(ticket["id"], entry))
+            applied += 1
+        if requests:
+            try:
+                self._call("batch", requests)
+            except Exception:
+                self.logger.exception(f"Batch update of {applied} tickets with occurrences failed")
+                return list(entries)
+        self.metrics.inc("upload.occurrence_updates", applied)
+        return leftover
@@ -0,0 +1,218 @@
+"""
+File change watchers used by Tailer to sleep until something happens.
+
+All backends share the same small interface:
+  - watch(directory)       watch a directory (non recursive)
+  - watch_file(path)       watch a single file (only needed by some backends)
+  - unwatch_file(path)
+  - wait(timeout)          block until events or timeout. Returns the set of
+                           changed paths (may be empty), or None when events
+                           were lost and the caller should re-check everything
+  - wakeup()               interrupt a pending wait() from another thread
+  - close()
+"""
+import os
+import sys
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+
+
+class PollingWatcher(object):
+    """
+    Fallback backend: no events, wait() just sleeps.
+    """
+    name = "poll"
+
+    def __init__(self):
+        self._wake = threading.Event()
+
+    def watch(self, directory):
+        pass
+
+    def watch_file(self, path):
+        pass
+
+    def unwatch_file(self, path):
+        pass
+
+    def wait(self, timeout):
+        self._wake.wait(timeout)
+        self._wake.clear()
+        return set()
+
+    def wakeup(self):
+        self._wake.set()
+
+    def close(self):
+        pass
+
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_CLOEXEC = 0o2000000
+_IN_NONBLOCK = 0o4000
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM |
+               _IN_MOVED_TO | _IN_CREATE | _IN_DELETE)
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class InotifyWatcher(object):
+    """
+    Linux inotify backend (through ctypes, no extra dependency).
+    One watch per directory covers every file inside it.
+    """
+    name = "inotify"
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+        self._wds = {}  # wd -> directory
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+
+    def watch(self, directory):
+        directory = str(directory)
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self._wds[wd] = directory
+
+    def watch_file(self, path):
+        pass
+
+    def unwatch_file(self, path):
+        pass
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self._fd, self._wake_r], [], [], max(0.0, timeout))
+        if self._wake_r in ready:
+            try:
+                os.read(self._wake_r, 512)
+            except BlockingIOError:
+                pass
+        if self._fd not in ready:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    # kernel dropped events: caller must re-check everything
+                    return None
+                directory = self._wds.get(wd)
+                if directory and name:
+                    changed.add(os.path.join(directory, os.fsdecode(name)))
+        return changed
+
+    def wakeup(self):
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError:
+            pass
+
+    def close(self):
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._wds = {}
+
+
+class QtWatcher(object):
+    """
+    QFileSystemWatcher backend (all platforms).
+    Must be created on the thread that calls wait(): wait() spins a local
+    QEventLoop so the watcher signals are delivered on that thread.
+    """
+    name = "qt"
+
+    def __init__(self):
+        from sgtk.util.qt_importer import QtImporter
+        QtCore = QtImporter().QtCore
+        self._QtCore = QtCore
+        self._changed = set()
+        self._loop = QtCore.QEventLoop()
+        self._timer = QtCore.QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._loop.quit)
+        self._watcher = QtCore.QFileSystemWatcher()
+        self._watcher.directoryChanged.connect(self._on_changed)
+        self._watcher.fileChanged.connect(self._on_changed)
+
+    def _on_changed(self, path):
+        self._changed.add(path)
+        self._loop.quit()
+
+    def watch(self, directory):
+        self._watcher.addPath(str(directory))
+
+    def watch_file(self, path):
+        self._watcher.addPath(path)
+
+    def unwatch_file(self, path):
+        self._watcher.removePath(path)
+
+    def wait(self, timeout):
+        if not self._changed:
+            self._timer.start(max(0, int(timeout * 1000)))
+            exec_ = getattr(self._loop, "exec_", None) or self._loop.exec
+            exec_()
+            self._timer.stop()
+        changed, self._changed = self._changed, set()
+        return changed
+
+    def wakeup(self):
+        # queued: safe to call from another thread
+        self._QtCore.QMetaObject.invokeMethod(self._loop, "quit", self._QtCore.Qt.QueuedConnection)
+
+    def close(self):
+        self._timer.stop()
+        paths = list(self._watcher.files()) + list(self._watcher.directories())
+        if paths:
+            self._watcher.removePaths(paths)
+
+
+def create_watcher(backend="auto", logger=None):
+    """
+    Pick a watcher backend: "auto" (inotify on Linux, else Qt), "inotify",
+    "qt" or "poll". Falls back to polling if the requested backend fails.
+    """
+    candidates = {
+        "auto": (InotifyWatcher, QtWatcher) if sys.platform.startswith("linux") else (QtWatcher,),
+        "inotify": (InotifyWatcher,),
+        "qt": (QtWatcher,),
+    }.get(backend, ())
+    for cls in candidates:
+        try:
+            return cls()
+        except Exception:
+            if logger:
+                logger.debug("Watcher backend %s unavailable", cls.name, exc_info=True)
+    return PollingWatcher()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# tk_incident lives under python/; the modules tested here need neither sgtk nor Qt
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "python"))
@@ -0,0 +1,94 @@
+import re
+import time
+
+from tk_incident.assembler import IncidentAssembler, parse_traceback
+from tk_incident.reader import LogReader
+
+RECORD = b"2026-01-14 19:49:11,961 [ 2764 %s sgtk.env.project.tk-maya] %s\n"
+TRACEBACK = (
+    b"Traceback (most recent call last):\n"
+    b'  File "/studio/tk-maya/hooks/scene.py", line 10, in load\n'
+    b"    ref.load()\n"
+    b"ValueError: bad value\n"
+)
+
+
+def _reader(**kwargs):
+    return LogReader(prefilter=re.compile(b"ERROR"), assembler=IncidentAssembler(**kwargs))
+
+
+def _write(path, data, mode="ab"):
+    with open(path, mode) as fh:
+        fh.write(data)
+
+
+def test_block_ends_where_the_next_record_starts(tmp_path):
+    log = str(tmp_path / "tk-maya.log")
+    _write(log, RECORD % (b"ERROR", b"load failed") + TRACEBACK + RECORD % (b"INFO", b"next"), "wb")
+    items = list(_reader().read(log, {}))
+    assert len(items) == 1
+    end, raw = items[0]
+    head, _, stack = raw.decode().partition("\n")
+    assert head.endswith("load failed")
+    assert stack == TRACEBACK.decode().rstrip("\n")
+    # the offset is the end of the head line
+    assert end == len(RECORD % (b"ERROR", b"load failed"))
+
+
+def test_unfinished_block_is_held_until_the_next_record(tmp_path):
+    log = str(tmp_path / "tk-maya.log")
+    reader = _reader(timeout=60)
+    state = {}
+    _write(log, RECORD % (b"ERROR", b"load failed") + TRACEBACK[:40], "wb")
+    assert list(reader.read(log, state)) == []
+    assert state["pending"]
+
+    _write(log, TRACEBACK[40:])
+    assert list(reader.read(log, state)) == []
+
+    _write(log, RECORD % (b"INFO", b"next"))
+    items = list(reader.read(log, state))
+    assert [raw.count(b"\n") for _, raw in items] == [4]
+    assert "pending" not in state
+
+
+def test_block_is_emitted_once_the_writer_is_quiet_for_timeout(tmp_path):
+    log = str(tmp_path / "tk-maya.log")
+    reader = _reader(timeout=0.05)
+    state = {}
+    _write(log, RECORD % (b"ERROR", b"load failed") + TRACEBACK, "wb")
+    # first seen: pending; seen again after the timeout: emitted as it is
+    assert list(reader.read(log, state)) == []
+    time.sleep(0.06)
+    items = list(reader.read(log, state))
+    assert len(items) == 1 and items[0][1].endswith(b"ValueError: bad value")
+    assert state["carry"] == b""
+
+
+def test_flush_emits_the_pending_block_right_away(tmp_path):
+    log = str(tmp_path / "tk-maya.log")
+    reader = _reader(timeout=60)
+    state = {}
+    _write(log, RECORD % (b"INFO", b"ok") + RECORD % (b"ERROR", b"load failed") + TRACEBACK, "wb")
+    assert list(reader.read(log, state)) == []
+    items = reader.flush(log, state)
+    assert len(items) == 1 and items[0][1].startswith(RECORD[:10])
+    assert items[0][1].endswith(b"ValueError: bad value")
+    assert state["carry"] == b"" and "pending" not in state
+    assert reader.flush(log, state) == []
+
+
+def test_block_is_capped_at_max_lines(tmp_path):
+    log = str(tmp_path / "tk-maya.log")
+    frames = b"".join(b"  frame %d\n" % i for i in range(50))
+    _write(log, RECORD % (b"ERROR", b"deep") + frames + RECORD % (b"INFO", b"next"), "wb")
+    items = list(_reader(max_lines=10).read(log, {}))
+    assert len(items) == 1
+    assert items[0][1].count(b"\n") == 10
+
+
+def test_parse_traceback_drops_line_numbers_and_folders():
+    exc, frames = parse_traceback(TRACEBACK.decode())
+    assert exc == "ValueError"
+    assert frames == [("scene.py", "load")]
+    assert parse_traceback("") == (None, [])
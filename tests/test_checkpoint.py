@@ -0,0 +1,85 @@
+import os
+import time
+
+from tk_incident.checkpoint import CheckpointStore, head_fingerprint
+
+
+def _checkpoint(store, path, offset):
+    fp, fp_len = head_fingerprint(str(path))
+    store.update(str(path), os.stat(str(path)).st_ino, offset, fp, fp_len)
+
+
+def test_resume_offset_survives_a_restart(tmp_path):
+    log = tmp_path / "tk-maya.log"
+    log.write_bytes(b"first line\nsecond line\n")
+    store = CheckpointStore(str(tmp_path / "checkpoints.json"))
+    assert store.resume_offset(str(log), os.stat(str(log))) is None
+    _checkpoint(store, log, 11)
+    store.flush()
+
+    store = CheckpointStore(str(tmp_path / "checkpoints.json"))
+    assert store.load() == 1
+    assert store.resume_offset(str(log), os.stat(str(log))) == 11
+    # an appended file still resumes
+    with open(str(log), "ab") as fh:
+        fh.write(b"third line\n")
+    assert store.resume_offset(str(log), os.stat(str(log))) == 11
+
+
+def test_checkpoint_of_another_file_is_ignored(tmp_path):
+    log = tmp_path / "tk-maya.log"
+    log.write_bytes(b"first line\nsecond line\n")
+    store = CheckpointStore(str(tmp_path / "checkpoints.json"))
+    _checkpoint(store, log, 23)
+    # rewritten in place (same inode, different head)
+    log.write_bytes(b"other line\nsecond line\n")
+    assert store.resume_offset(str(log), os.stat(str(log))) is None
+    # truncated below the offset
+    _checkpoint(store, log, 23)
+    log.write_bytes(b"other line\n")
+    assert store.resume_offset(str(log), os.stat(str(log))) is None
+
+
+def test_flush_is_rate_limited_and_atomic(tmp_path):
+    log = tmp_path / "tk-maya.log"
+    log.write_bytes(b"line\n")
+    path = str(tmp_path / "checkpoints.json")
+    store = CheckpointStore(path, flush_interval=3600)
+    _checkpoint(store, log, 5)
+    store.maybe_flush()
+    assert not os.path.exists(path)
+    store.flush()
+    assert os.path.exists(path) and not os.path.exists(path + ".tmp")
+    store.forget(str(log))
+    store.flush()
+    assert CheckpointStore(path).load() == 0
+
+
+def test_oldest_entries_dropped_over_max_entries(tmp_path):
+    path = str(tmp_path / "checkpoints.json")
+    store = CheckpointStore(path, max_entries=2)
+    for i in range(3):
+        store.update("/logs/%d.log" % i, i + 1, 10, "fp", 4)
+        time.sleep(0.01)
+    store.flush()
+    store = CheckpointStore(path)
+    store.load()
+    assert store.get("/logs/0.log") is None
+    assert store.get("/logs/2.log")["offset"] == 10
+
+
+def test_written_since_save(tmp_path):
+    path = str(tmp_path / "checkpoints.json")
+    store = CheckpointStore(path)
+    log = tmp_path / "tk-maya.log"
+    log.write_bytes(b"line\n")
+    # no previous session
+    assert not store.written_since_save(os.stat(str(log)))
+    store.update("/logs/x.log", 1, 0, "fp", 4)
+    store.flush()
+    os.utime(path, (1000, 1000))
+    store = CheckpointStore(path)
+    store.load()
+    assert store.written_since_save(os.stat(str(log)))
+    os.utime(str(log), (500, 500))
+    assert not store.written_since_save(os.stat(str(log)))
@@ -0,0 +1,62 @@
+import re
+
+from tk_incident.context import ContextBuffer
+from tk_incident.reader import LogReader
+
+
+def _lines(first, count):
+    return b"".join(b"line %d\n" % i for i in range(first, first + count))
+
+
+def test_ring_keeps_the_last_bytes_on_line_boundaries():
+    ctx = ContextBuffer(per_file=64)
+    data = _lines(0, 100)
+    ctx.feed("a", data, 0, len(data))
+    ring = ctx._rings["a"]
+    assert len(ring) <= 64
+    assert ring.endswith(b"line 99\n")
+    assert ring.startswith(b"line ")
+
+
+def test_rings_are_capped_in_total():
+    ctx = ContextBuffer(per_file=100, max_total=250)
+    for key in "abcd":
+        data = _lines(0, 20)
+        ctx.feed(key, data, 0, len(data))
+    assert ctx.size <= 250
+    assert ctx.dropped == 2
+    assert len(ctx) == 2 and "a" not in ctx._rings
+    ctx.forget("d")
+    assert len(ctx) == 1 and ctx.size == len(ctx._rings["c"])
+
+
+def test_before_lines_continue_from_the_ring():
+    ctx = ContextBuffer(before_lines=3, after_lines=2)
+    old = _lines(0, 10)
+    ctx.feed("a", old, 0, len(old))
+    data = b"line 10\nERROR here\nline 12\nline 13\nline 14\n"
+    start = data.index(b"ERROR")
+    end = data.index(b"\n", start) + 1
+    before, after = ctx.around("a", data, 0, start, end, len(data))
+    assert before == b"line 8\nline 9\nline 10\n"
+    assert after == b"line 12\nline 13\n"
+
+
+def test_context_of_one_batch_is_capped(tmp_path):
+    # an error storm: every line matches
+    log = tmp_path / "tk-maya.log"
+    log.write_bytes(b"".join(b"ERROR storm %d\n" % i for i in range(5000)))
+    ctx = ContextBuffer(before_lines=20, after_lines=5, max_total=16 * 1024)
+    reader = LogReader(prefilter=re.compile(b"ERROR"), context=ctx)
+    state = {}
+    assert len(list(reader.read(str(log), state))) == 5000
+    captured = sum(len(before) + len(after) for before, after in state["context"].values())
+    # the last capture may go over by one match's context
+    assert captured <= 16 * 1024 + 25 * len(b"ERROR storm 0000\n")
+    assert ctx.skipped == 5000 - len(state["context"]) > 4000
+
+    # the next batch gets its share again
+    with open(str(log), "ab") as fh:
+        fh.write(b"ERROR again\n")
+    list(reader.read(str(log), state))
+    assert len(state["context"]) == 1
@@ -0,0 +1,76 @@
+import gzip
+import os
+
+import pytest
+
+from tk_incident.excerpt import remove_excerpt, write_excerpt
+
+HEADER = b"".join(b"header %d\n" % i for i in range(3))
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / "tk-maya.log"
+    path.write_bytes(HEADER + b"".join(b"line %04d\n" % i for i in range(100)))
+    return str(path)
+
+
+def _end_of(line):
+    return len(HEADER) + (line + 1) * 10
+
+
+def _excerpt(log, pos, **kwargs):
+    path = write_excerpt(log, pos, header_bytes=len(HEADER), compression="none", **kwargs)
+    try:
+        with open(path, "rb") as fh:
+            return fh.read()
+    finally:
+        remove_excerpt(path)
+        assert not os.path.exists(os.path.dirname(path))
+
+
+def _lines(data):
+    return [line for line in data.split(b"\n") if line.startswith(b"line")]
+
+
+def test_line_window_around_the_match(log):
+    data = _excerpt(log, _end_of(50), before_lines=2, after_lines=3)
+    assert data.startswith(HEADER + b"\n... [480 bytes skipped] ...\n\n")
+    assert _lines(data) == [b"line %04d" % i for i in range(48, 54)]
+    assert data.endswith(b"\n... [460 more bytes, log size 1027] ...\n")
+
+
+def test_byte_window_keeps_whole_lines(log):
+    data = _excerpt(log, _end_of(50), before_bytes=35, after_bytes=25)
+    # 35 bytes back starts mid line 47, 25 bytes forward ends mid line 53
+    assert _lines(data) == [b"line %04d" % i for i in range(48, 53)]
+
+
+def test_line_window_is_capped_by_bytes(log):
+    data = _excerpt(log, _end_of(50), before_lines=10, before_bytes=31, after_lines=0)
+    assert _lines(data) == [b"line 0048", b"line 0049", b"line 0050"]
+
+
+def test_window_clamped_to_header_and_file_end(log):
+    data = _excerpt(log, _end_of(1), before_lines=20, after_bytes=10 ** 6)
+    assert data.startswith(HEADER + b"line 0000\n")
+    assert b"skipped" not in data and b"more bytes" not in data
+    assert len(_lines(data)) == 100
+    # offsets past the end are clamped
+    assert _lines(_excerpt(log, 10 ** 6, before_lines=1)) == [b"line 0098", b"line 0099"]
+
+
+def test_match_in_header(log):
+    # the header already holds the match and the lines after it
+    data = _excerpt(log, 10, after_lines=1)
+    assert data == HEADER + b"\n... [1000 more bytes, log size 1027] ...\n"
+
+
+def test_gzip_by_default(log):
+    path = write_excerpt(log, _end_of(50), header_bytes=0, before_lines=1, after_lines=0)
+    try:
+        assert path.endswith(".excerpt-%d.log.gz" % _end_of(50))
+        with gzip.open(path, "rb") as fh:
+            assert _lines(fh.read()) == [b"line 0049", b"line 0050"]
+    finally:
+        remove_excerpt(path)
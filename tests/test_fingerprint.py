@@ -0,0 +1,63 @@
+from tk_incident.fingerprint import fingerprint, fingerprint_uncached, memo_clear, memo_stats, normalize, strip_prefix
+
+PREFIX = "2026-01-14 19:49:11,961 [ 2764 ERROR sgtk.env.project.tk-maya] "
+
+TRACEBACK = """Traceback (most recent call last):
+  File "/studio/pipeline/v%d/tk-maya/hooks/scene.py", line %d, in load
+    ref.load()
+  File "/studio/pipeline/v%d/tk-maya/python/ref.py", line 12, in load
+    raise ValueError("bad value %d")
+ValueError: bad value %d"""
+
+
+def test_strip_prefix_drops_timestamp_and_record_header():
+    assert strip_prefix(PREFIX + "disk full") == "disk full"
+    assert strip_prefix("no prefix here") == "no prefix here"
+
+
+def test_volatile_values_become_placeholders():
+    assert normalize("job 1234 took 5.5s") == "job <n> took <n>s"
+    assert normalize("object at 0x7f3a2b1c") == "object at <addr>"
+    assert normalize("id 123e4567-e89b-12d3-a456-426614174000 gone") == "id <uuid> gone"
+    assert normalize("cannot read /mnt/shows/abc/shot_010.ma") == "cannot read <path>"
+    assert normalize(r"cannot read C:\shows\abc.ma") == "cannot read <path>"
+    assert normalize("GET https://site.example.com/api/v1 failed") == "GET <url> failed"
+    assert normalize("key 'abc' and \"def ghi\" missing") == "key <str> and <str> missing"
+    assert normalize("read and/or write") == "read and/or write"
+
+
+def test_apostrophes_are_not_quotes():
+    assert normalize("can't open scene, don't retry") == "can't open scene, don't retry"
+    assert normalize("can't open 'a.ma'") == "can't open <str>"
+    # unrelated messages must not collapse into one signature
+    assert fingerprint("can't open scene, don't retry").key != fingerprint("can't load rig, don't retry").key
+
+
+def test_same_message_with_other_values_groups_together():
+    a = fingerprint(PREFIX + "disk full at /mnt/a/b after 3 tries")
+    b = fingerprint("2026-02-01 08:00:00,001 [ 99 ERROR x] disk full at /mnt/c/d after 7 tries")
+    assert a == b
+    assert a.label == "disk full at <path> after <n> tries"
+
+
+def test_exception_name_is_the_label():
+    fp = fingerprint(PREFIX + "Failed: MemoryError while loading 12 refs")
+    assert fp.label == "MemoryError"
+
+
+def test_traceback_key_ignores_line_numbers_and_checkout():
+    a = fingerprint(PREFIX + "load failed", TRACEBACK % (1, 10, 1, 5, 5))
+    b = fingerprint(PREFIX + "load failed", TRACEBACK % (2, 42, 2, 9, 9))
+    assert a == b
+    assert a.label == "ValueError"
+    assert a != fingerprint(PREFIX + "load failed")
+
+
+def test_memo_returns_the_uncached_result():
+    memo_clear()
+    line = PREFIX + "render node 12 unreachable"
+    first = fingerprint(line)
+    again = fingerprint("2026-01-14 19:50:00,000 [ 2764 ERROR x] render node 12 unreachable")
+    assert first == again == fingerprint_uncached(line)
+    stats = memo_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
@@ -0,0 +1,83 @@
+import re
+
+from tk_incident.matcher import Matcher, engine_from_path, literal_branches
+
+LINE = "2026-01-14 19:49:11,961 [ 2764 %s sgtk.env.project.tk-maya] %s"
+
+
+def _matcher(**cfg):
+    return Matcher({"matcher": cfg})
+
+
+def test_default_rules_are_error_and_critical():
+    matcher = Matcher()
+    assert matcher.match(LINE % ("ERROR", "boom"))["level"] == "ERROR"
+    assert matcher.match(LINE % ("CRITICAL", "boom"))["level"] == "CRITICAL"
+    assert matcher.match(LINE % ("WARNING", "boom")) is None
+    # whole words only
+    assert matcher.match(LINE % ("DEBUG", "no ERRORS here")) is None
+    assert matcher.match(LINE % ("DEBUG", "MYERROR")) is None
+
+
+def test_match_reports_the_rule_that_fired():
+    matcher = _matcher(
+        levels=["ERROR"],
+        exceptions=["MemoryError"],
+        rules=[
+            {"name": "traceback", "literal": "Traceback (most recent call last)"},
+            {"name": "disk", "regex": r"No space left on device", "level": "CRITICAL"},
+        ],
+    )
+    hit = matcher.match(LINE % ("INFO", "alloc failed: MemoryError"))
+    assert (hit["reason"], hit["rule"], hit["level"]) == ("exception", "MemoryError", "ERROR")
+    hit = matcher.match("Traceback (most recent call last):")
+    assert (hit["reason"], hit["rule"]) == ("pattern", "traceback")
+    hit = matcher.match(LINE % ("INFO", "write: No space left on device"))
+    assert (hit["rule"], hit["level"]) == ("disk", "CRITICAL")
+    assert matcher.match(LINE % ("INFO", "all good")) is None
+
+
+def test_literal_trie_matches_every_literal_and_nothing_else():
+    words = ["ERROR", "ERR", "EXCEPTION", "CRITICAL", "CRASH"]
+    pattern = re.compile("|".join(literal_branches(words, word_bounded=True)))
+    for word in words:
+        assert pattern.search("x %s y" % word).group() == word
+    assert pattern.search("x ERRORS y") is None
+    assert pattern.search("xERR y") is None
+    assert pattern.search("CRA") is None
+
+
+def test_engine_include_and_exclude_lists():
+    matcher = _matcher(include_engines=["tk-maya", "tk-nuke"], exclude_engines=["tk-nuke"])
+    assert matcher.match(LINE % ("ERROR", "x"), "/logs/tk-maya.log")
+    assert matcher.match(LINE % ("ERROR", "x"), "/logs/tk-nuke.log") is None
+    assert matcher.match(LINE % ("ERROR", "x"), "/logs/tk-houdini.log") is None
+    assert engine_from_path("/logs/tk-maya.log") == "tk-maya"
+
+
+def test_rules_can_be_limited_to_engines():
+    matcher = _matcher(levels=["ERROR"], rules=[
+        {"name": "maya_only", "literal": "Maya fault", "engines": ["tk-maya"]},
+        {"name": "not_nuke", "literal": "Render fault", "exclude_engines": ["tk-nuke"]},
+    ])
+    assert matcher.match("Maya fault", "/logs/tk-maya.log")["rule"] == "maya_only"
+    assert matcher.match("Maya fault", "/logs/tk-nuke.log") is None
+    assert matcher.match("Render fault", "/logs/tk-nuke.log") is None
+    assert matcher.match("Render fault", "/logs/tk-maya.log")["rule"] == "not_nuke"
+    # severity rules apply everywhere
+    assert matcher.match(LINE % ("ERROR", "x"), "/logs/tk-nuke.log")
+
+
+def test_suppress_list_wins_over_rules():
+    matcher = _matcher(suppress=[r"Qt: Untested Windows version", r"^.*license check"])
+    assert matcher.match(LINE % ("ERROR", "Qt: Untested Windows version 10.0 detected!")) is None
+    assert matcher.match(LINE % ("ERROR", "license check failed")) is None
+    assert matcher.match(LINE % ("ERROR", "real failure"))
+
+
+def test_prefilter_finds_the_same_lines_as_match():
+    matcher = _matcher(levels=["ERROR"], exceptions=["KeyError"], rules=[{"name": "re", "regex": r"fault #\d+"}])
+    lines = [LINE % ("INFO", "ok"), LINE % ("ERROR", "x"), "raise KeyError('a')", "fault #12 here", "fault # no"]
+    blob = ("\n".join(lines) + "\n").encode("utf-8")
+    found = [blob[:m.start()].count(b"\n") for m in matcher.prefilter.finditer(blob)]
+    assert found == [i for i, line in enumerate(lines) if matcher.match(line)] == [1, 2, 3]
@@ -0,0 +1,108 @@
+import logging
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("sgtk")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fake_shotgun import FakeShotgun  # noqa: E402
+from tk_incident.pipeline import IncidentPipeline  # noqa: E402
+
+LINE = "2026-01-14 19:49:11,961 [ 2764 %s sgtk.env.project.tk-maya] %s"
+
+
+@pytest.fixture
+def make_pipeline(tmp_path):
+    pipelines = []
+
+    def make(**settings):
+        options = {"upload": {"shotgun_project_id": 1}, "log_folder": str(tmp_path), "spool": False,
+                   "checkpoints": False, "cooldown_sec": 60, "burst_threshold": 3, "blackout_period": 300}
+        options.update(settings)
+        (tmp_path / "tk-maya.log").write_text(LINE % ("ERROR", "KeyError: 'a'") + "\n")
+        sg = FakeShotgun(scale=0)
+        pipeline = IncidentPipeline(logging.getLogger("test"), sg, options, connection_factory=lambda: sg)
+        pipelines.append(pipeline)
+        return pipeline
+
+    yield make
+    for pipeline in pipelines:
+        pipeline.stop()
+
+
+def _hit(pipeline, now, message="KeyError: 'a'", level="ERROR", pos=0, **kwargs):
+    matched = {"matched_line": LINE % (level, message), "level": level}
+    log = os.path.join(pipeline.settings["log_folder"], "tk-maya.log")
+    pipeline._handle_match(log, pos, matched, now, **kwargs)
+
+
+def _drops(pipeline):
+    counters = pipeline.metrics.snapshot()["counters"]
+    return {k[len("drop."):]: v for k, v in counters.items() if k.startswith("drop.")}
+
+
+def test_cooldown_then_burst_then_blackout(make_pipeline):
+    pipeline = make_pipeline()
+    for pos in range(6):
+        _hit(pipeline, 100.0, pos=pos)
+    # one upload, then cooldown; the hits in cooldown still count for the burst
+    assert len(pipeline._spool) == 1
+    assert _drops(pipeline) == {"cooldown": 2, "blackout": 3}
+    # the blackout outlasts the cooldown
+    _hit(pipeline, 200.0, pos=6)
+    assert _drops(pipeline)["blackout"] == 4
+    _hit(pipeline, 401.0, pos=7)
+    assert len(pipeline._spool) == 2
+    # every dropped hit is tallied against its ticket
+    assert sum(e["count"] for e in pipeline.occurrences.drain()) == 6
+
+
+def test_burst_without_cooldown(make_pipeline):
+    pipeline = make_pipeline(cooldown_sec=0)
+    for pos in range(5):
+        _hit(pipeline, 100.0, pos=pos)
+    assert len(pipeline._spool) == 2
+    assert _drops(pipeline) == {"burst": 1, "blackout": 2}
+    # other signatures are not affected
+    _hit(pipeline, 100.0, "ValueError: x")
+    assert len(pipeline._spool) == 3
+
+
+def test_duplicate_block_is_dropped_before_the_guards(make_pipeline):
+    pipeline = make_pipeline(cooldown_sec=0)
+    _hit(pipeline, 100.0, pos=10, inode=1, origin="other:1")
+    _hit(pipeline, 100.0, pos=10, inode=1)
+    assert len(pipeline._spool) == 1
+    assert _drops(pipeline) == {"duplicate": 1}
+    # the duplicate did not count as a hit for the burst (the third one trips it)
+    _hit(pipeline, 100.0, pos=0)
+    assert len(pipeline._spool) == 2
+
+
+def test_disabled_pipeline_spools_nothing(make_pipeline):
+    pipeline = make_pipeline()
+    pipeline.disabled = True
+    _hit(pipeline, 100.0)
+    assert len(pipeline._spool) == 0
+    assert _drops(pipeline) == {"disabled": 1}
+
+
+def test_budget_is_spent_on_the_highest_priority_first(make_pipeline):
+    pipeline = make_pipeline(max_uploads_per_minute=2)
+    _hit(pipeline, 100.0, "KeyError: 'a'")
+    _hit(pipeline, 100.0, "ValueError: b", level="CRITICAL")
+    _hit(pipeline, 100.0, "OSError: c")
+    _hit(pipeline, 100.0, "TypeError: d", level="CRITICAL")
+    uploader = pipeline.worker_uploader(0)
+    pipeline.ready.set()
+    assert pipeline.upload_step(uploader) == 0
+    titles = [t["title"] for _, t in pipeline.shotgun.created]
+    assert sorted(titles) == sorted(uploader.title_for({"matched_line": LINE % ("CRITICAL", m)})
+                                    for m in ("ValueError: b", "TypeError: d"))
+    # out of budget: the rest waits in the spool
+    assert pipeline.upload_step(uploader) > 0
+    assert len(pipeline._spool) == 2
+    assert pipeline.metrics.snapshot()["counters"]["upload.budget_waits"] == 1
@@ -0,0 +1,92 @@
+import time
+
+from tk_incident.ratecontrol import CLOSED, HALF_OPEN, OPEN, RateController
+
+
+def _controller(**kwargs):
+    options = dict(max_rate=8, min_rate=1, max_concurrency=4, latency_target=1.0, adjust_interval=3600,
+                   failure_threshold=3, open_base=0.05, open_max=0.05)
+    options.update(kwargs)
+    return RateController(**options)
+
+
+def test_acquire_is_limited_by_concurrency():
+    rc = _controller(max_concurrency=2)
+    assert rc.acquire(5) == (5, 0)
+    assert rc.acquire(5) == (5, 0)
+    assert rc.acquire(5) == (0, 0.5)
+    rc.release()
+    assert rc.acquire(5) == (5, 0)
+
+
+def test_slow_or_failing_calls_halve_the_rate_and_fast_ones_add_one():
+    rc = _controller(adjust_interval=0)
+    rc.record(3.0, True)
+    assert (rc.rate, rc.concurrency, rc.decreases) == (4, 2, 1)
+    rc.record(0.1, False)
+    assert (rc.rate, rc.concurrency) == (2, 1)
+    rc.record(0.1, True)
+    assert (rc.rate, rc.concurrency) == (3, 2)
+    # attachment uploads are slow by nature
+    rc.record(30.0, True, timed=False)
+    assert rc.rate == 4
+
+
+def test_breaker_opens_after_failures_in_a_row():
+    rc = _controller()
+    rc.record(0.1, False)
+    rc.record(0.1, False)
+    rc.record(0.1, True)
+    rc.record(0.1, False)
+    rc.record(0.1, False)
+    assert rc.breaker == CLOSED
+    rc.record(0.1, False)
+    assert rc.breaker == OPEN
+    assert (rc.rate, rc.concurrency, rc.trips) == (1, 1, 1)
+    granted, wait = rc.acquire(10)
+    assert granted == 0 and 0 < wait <= 0.05
+
+
+def test_half_open_lets_one_probe_through():
+    rc = _controller()
+    for _ in range(3):
+        rc.record(0.1, False)
+    time.sleep(0.06)
+    assert rc.acquire(10) == (1, 0)
+    assert rc.probing and rc.breaker == HALF_OPEN
+    assert rc.acquire(10) == (0, 1.0)
+    # a failed probe opens the breaker again
+    rc.record(0.1, False)
+    rc.release()
+    assert rc.breaker == OPEN and rc.trips == 2
+    time.sleep(0.06)
+    assert rc.acquire(10) == (1, 0)
+    rc.record(0.1, True)
+    rc.release()
+    assert rc.breaker == CLOSED
+    assert rc.state()["breaker"] == CLOSED
+
+
+def test_rate_slow_starts_to_half_of_the_rate_before_the_trip():
+    rc = _controller(max_rate=16)
+    for _ in range(3):
+        rc.record(0.1, False)
+    time.sleep(0.06)
+    rc.acquire(1)
+    rc.record(0.1, True)
+    rc.release()
+    rc.adjust_interval = 0
+    rates = []
+    for _ in range(5):
+        rc.record(0.1, True)
+        rates.append(rc.rate)
+    assert rates == [2, 4, 8, 9, 10]
+
+
+def test_backoff_is_jittered_and_capped():
+    rc = _controller()
+    for attempts in range(6):
+        delay = rc.backoff(attempts, 10, 100)
+        full = min(10 * 2 ** attempts, 100)
+        assert full / 2 <= delay <= full
+    assert rc.backoff(10 ** 6, 10, 100) <= 100
@@ -0,0 +1,66 @@
+import re
+
+from tk_incident.reader import LogReader
+
+
+def _write(path, data, mode="ab"):
+    with open(path, mode) as fh:
+        fh.write(data)
+
+
+def test_offsets_point_past_each_newline(tmp_path):
+    log = str(tmp_path / "tk-test.log")
+    _write(log, b"one\ntwo\r\nthree\n", "wb")
+    state = {}
+    items = list(LogReader().read(log, state))
+    assert items == [(4, b"one"), (9, b"two"), (15, b"three")]
+    assert state["pos"] == 15
+    assert state["carry"] == b""
+
+
+def test_partial_line_is_carried_until_finished(tmp_path):
+    log = str(tmp_path / "tk-test.log")
+    _write(log, b"first\nsecond ha", "wb")
+    reader = LogReader()
+    state = {}
+    assert list(reader.read(log, state)) == [(6, b"first")]
+    assert state["pos"] == 15
+    assert state["carry"] == b"second ha"
+
+    assert list(reader.read(log, state)) == []
+
+    _write(log, b"lf\nthird\n")
+    assert list(reader.read(log, state)) == [(18, b"second half"), (24, b"third")]
+    assert state["carry"] == b""
+
+
+def test_limit_leaves_the_rest_for_the_next_read(tmp_path):
+    log = str(tmp_path / "tk-test.log")
+    _write(log, b"aaaa\nbbbb\ncccc\n", "wb")
+    reader = LogReader()
+    state = {}
+    assert list(reader.read(log, state, limit=7)) == [(5, b"aaaa")]
+    assert state["pos"] == 7
+    assert list(reader.read(log, state)) == [(10, b"bbbb"), (15, b"cccc")]
+
+
+def test_prefilter_yields_candidates_with_exact_offsets(tmp_path):
+    log = str(tmp_path / "tk-test.log")
+    _write(log, b"ok\nan ERROR here\nok\nERROR again", "wb")
+    reader = LogReader(prefilter=re.compile(b"ERROR"))
+    state = {}
+    assert list(reader.read(log, state)) == [(17, b"an ERROR here")]
+    assert state["carry"] == b"ERROR again"
+
+    _write(log, b"\n")
+    assert list(reader.read(log, state)) == [(32, b"ERROR again")]
+
+
+def test_mmap_catch_up_matches_chunked_reads(tmp_path):
+    log = str(tmp_path / "tk-test.log")
+    _write(log, b"".join(b"line %d ERROR\n" % i if i % 7 == 0 else b"line %d\n" % i for i in range(500)), "wb")
+    prefilter = re.compile(b"ERROR")
+    chunked = list(LogReader(prefilter=prefilter, chunk_size=64).read(log, {}))
+    mapped = list(LogReader(prefilter=prefilter, mmap_threshold=1).read(log, {}))
+    assert mapped == chunked
+    assert len(chunked) == 72
@@ -0,0 +1,117 @@
+import pytest
+
+from tk_incident.spool import MemorySpool, UploadSpool
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def make_spool(request, tmp_path):
+    spools = []
+
+    def make(**kwargs):
+        if request.param == "sqlite":
+            spool = UploadSpool(str(tmp_path / "upload_spool.sqlite"), **kwargs)
+        else:
+            spool = MemorySpool(**kwargs)
+        spools.append(spool)
+        return spool
+
+    yield make
+    for spool in spools:
+        spool.close()
+
+
+def test_fetch_leases_items_until_the_lease_expires(make_spool):
+    spool = make_spool(lease=30)
+    item_id = spool.put({"n": 1}, now=100)
+    assert spool.fetch(now=100) == [(item_id, {"n": 1}, 0)]
+    assert spool.fetch(now=110) == []
+    assert spool.fetch(now=131) == [(item_id, {"n": 1}, 0)]
+
+
+def test_ack_removes_and_nack_delays(make_spool):
+    spool = make_spool()
+    first = spool.put({"n": 1}, now=100)
+    second = spool.put({"n": 2}, now=100)
+    spool.fetch(now=100)
+    spool.ack(first)
+    spool.nack(second, delay=60, item={"n": 2, "retry": True}, now=100)
+    assert len(spool) == 1
+    assert spool.fetch(now=120) == []
+    assert spool.fetch(now=161) == [(second, {"n": 2, "retry": True}, 1)]
+
+
+def test_release_leases_makes_everything_due(make_spool):
+    spool = make_spool()
+    item_id = spool.put({"n": 1}, now=100)
+    spool.fetch(now=100)
+    spool.release_leases(now=101)
+    assert [row[0] for row in spool.fetch(now=101)] == [item_id]
+
+
+def test_evict_drops_items_older_than_max_age(make_spool):
+    spool = make_spool(max_age=3600)
+    spool.put({"n": 1}, now=100)
+    fresh = spool.put({"n": 2}, now=3000)
+    assert spool.evict(now=3800) == 1
+    assert spool.evicted == 1
+    assert [row[0] for row in spool.fetch(now=3800)] == [fresh]
+
+
+def test_items_survive_a_restart(tmp_path):
+    path = str(tmp_path / "upload_spool.sqlite")
+    spool = UploadSpool(path, lease=300)
+    item_id = spool.put({"path": "tk-maya.log"}, now=100)
+    spool.fetch(now=100)
+    spool.close()  # died with the item leased
+
+    spool = UploadSpool(path, lease=300)
+    try:
+        assert spool.release_leases(now=101) == 1
+        assert spool.fetch(now=101) == [(item_id, {"path": "tk-maya.log"}, 0)]
+    finally:
+        spool.close()
+
+
+def test_items_of_a_key_are_leased_together(make_spool):
+    spool = make_spool()
+    a1 = spool.put({"n": 1}, key="a", now=100)
+    b1 = spool.put({"n": 2}, key="b", now=100)
+    a2 = spool.put({"n": 3}, key="a", now=100)
+    leased = [row[0] for row in spool.fetch(limit=10, now=100)]
+    assert leased == [a1, b1, a2]
+
+    spool.nack(a1, delay=10, now=100)
+    spool.ack(b1)
+    # a2 is still leased, so key "a" is not due even once a1 is
+    assert spool.fetch(now=111) == []
+    spool.ack(a2)
+    assert [row[0] for row in spool.fetch(now=111)] == [a1]
+
+def test_put_evicts_the_lowest_priority_beyond_max_items(make_spool):
+    spool = make_spool(max_items=2)
+    low = spool.put({"n": 1}, now=100, priority=1)
+    high = spool.put({"n": 2}, now=100, priority=5)
+    mid = spool.put({"n": 3}, now=100, priority=3)
+    assert spool.evicted == 1
+    assert [row[0] for row in spool.fetch(now=100)] == [high, mid]
+    assert low not in [row[0] for row in spool.fetch(now=1000)]
+
+
+def test_fetch_takes_the_highest_priority_first(make_spool):
+    spool = make_spool()
+    low = spool.put({"n": 1}, now=100, priority=0)
+    high = spool.put({"n": 2}, now=101, priority=5)
+    high2 = spool.put({"n": 3}, now=102, priority=5)
+    assert [row[0] for row in spool.fetch(limit=2, now=200)] == [high, high2]
+    assert spool.depths() == {0: 1, 5: 2}
+    assert [row[0] for row in spool.fetch(now=200)] == [low]
+
+
+def test_held_keys_are_the_ones_with_items_left(make_spool):
+    spool = make_spool()
+    a = spool.put({"n": 1}, key="a", now=100)
+    spool.put({"n": 2}, key="b", now=100)
+    spool.fetch(now=100)
+    spool.ack(a)
+    assert spool.held_keys(["a", "b", "c"]) == {"b"}
+    assert spool.held_keys("key%d" % i for i in range(1200)) == set()
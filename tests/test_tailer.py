@@ -0,0 +1,79 @@
+import os
+
+from tk_incident.assembler import IncidentAssembler
+from tk_incident.matcher import Matcher
+from tk_incident.tailer import Tailer
+
+ERROR = b"2026-01-14 19:49:11,961 [ 2764 ERROR sgtk.env.project.tk-maya] %s\n"
+INFO = b"2026-01-14 19:49:12,000 [ 2764 INFO sgtk.env.project.tk-maya] %s\n"
+
+
+def _write(path, data, mode="ab"):
+    with open(path, mode) as fh:
+        fh.write(data)
+
+
+def _tailer(folder, **kwargs):
+    batches = []
+    tailer = Tailer(str(folder), ["tk-*.log"], matcher=Matcher(), watch_backend="poll", poll_interval=0,
+                    max_idle_interval=0.01, rescan_interval=0, on_lines=batches.append,
+                    assembler=IncidentAssembler(timeout=60), **kwargs)
+    tailer.open()
+    return tailer, batches
+
+
+def _lines(batches):
+    return [matched["matched_line"].rsplit("] ", 1)[-1] for batch in batches for _, matched in batch["hits"]]
+
+
+def test_files_present_at_startup_are_read_from_their_end(tmp_path):
+    log = str(tmp_path / "tk-maya.log")
+    _write(log, ERROR % b"old", "wb")
+    tailer, batches = _tailer(tmp_path)
+    tailer.step()
+    _write(log, ERROR % b"new" + INFO % b"next")
+    tailer.step()
+    tailer.close()
+    assert _lines(batches) == ["new"]
+    assert batches[0]["inode"] == os.stat(log).st_ino
+
+
+def test_pending_block_is_reported_when_the_log_rotates(tmp_path):
+    log = str(tmp_path / "tk-maya.log")
+    _write(log, INFO % b"start", "wb")
+    tailer, batches = _tailer(tmp_path)
+    tailer.step()
+    _write(log, ERROR % b"before rotation")
+    tailer.step()
+    assert batches == []  # pending: the next record may still be a continuation line
+
+    os.rename(log, log + ".1")
+    _write(log, ERROR % b"after rotation" + INFO % b"next", "wb")
+    tailer.step()
+    tailer.close()
+    assert _lines(batches) == ["before rotation", "after rotation"]
+
+
+def test_pending_block_is_reported_when_the_log_is_truncated(tmp_path):
+    log = str(tmp_path / "tk-maya.log")
+    _write(log, INFO % b"start", "wb")
+    tailer, batches = _tailer(tmp_path)
+    tailer.step()
+    _write(log, ERROR % b"before truncation")
+    tailer.step()
+    _write(log, INFO % b"x", "wb")
+    tailer.step()
+    tailer.close()
+    assert _lines(batches) == ["before truncation"]
+
+
+def test_close_reports_pending_blocks_without_checkpoints(tmp_path):
+    log = str(tmp_path / "tk-maya.log")
+    _write(log, INFO % b"start", "wb")
+    tailer, batches = _tailer(tmp_path)
+    tailer.step()
+    _write(log, ERROR % b"last words")
+    tailer.step()
+    assert batches == []
+    tailer.close()
+    assert _lines(batches) == ["last words"]
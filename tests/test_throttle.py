@@ -0,0 +1,67 @@
+from tk_incident.throttle import FloodGuard, SeenBlocks
+
+# a forwarded block: (path, inode, offset, signature)
+BLOCK = ("/logs/tk-maya.log", 1234, 4096, "sig")
+
+
+def test_flood_guard_memory_is_capped():
+    guard = FloodGuard(max_keys=100)
+    for i in range(1000):
+        guard.hit("sig%d" % i, now=i)
+    assert len(guard) == 100
+    assert guard.evicted == 900
+
+
+def test_flood_guard_blacklists_a_burst():
+    guard = FloodGuard(burst_threshold=5, burst_window=10, blackout=300)
+    assert not any(guard.hit("sig", now=i * 0.1) for i in range(4))
+    assert guard.hit("sig", now=0.5)
+    assert guard.is_blacklisted("sig", now=100)
+    assert not guard.is_blacklisted("sig", now=301)
+
+
+def test_sketch_catches_a_burst_of_evicted_signatures():
+    guard = FloodGuard(burst_threshold=3, burst_window=10, max_keys=1, sketch=True)
+    burst = False
+    for i in range(6):
+        burst = guard.hit("sig", now=i * 0.1) or burst
+        guard.hit("other%d" % i, now=i * 0.1)
+    assert burst
+
+
+def test_block_reported_by_another_origin_is_a_duplicate():
+    blocks = SeenBlocks(ttl=60)
+    assert not blocks.duplicate(BLOCK, "host:1", now=0)
+    assert blocks.duplicate(BLOCK, "host:2", now=1)
+    assert blocks.duplicates == 1
+
+
+def test_same_origin_again_is_a_new_occurrence():
+    # e.g. the file was truncated and the same bytes written again
+    blocks = SeenBlocks(ttl=60)
+    assert not blocks.duplicate(BLOCK, "host:1", now=0)
+    assert not blocks.duplicate(BLOCK, "host:1", now=1)
+    assert blocks.duplicate(BLOCK, "host:2", now=2)
+    assert blocks.duplicates == 1
+
+
+def test_another_inode_is_another_block():
+    blocks = SeenBlocks(ttl=60)
+    assert not blocks.duplicate(BLOCK, "host:1", now=0)
+    assert not blocks.duplicate(BLOCK[:1] + (5678,) + BLOCK[2:], "host:2", now=1)
+
+
+def test_reports_expire_after_ttl():
+    blocks = SeenBlocks(ttl=60)
+    assert not blocks.duplicate(BLOCK, "host:1", now=0)
+    assert not blocks.duplicate(BLOCK, "host:2", now=61)
+    assert len(blocks) == 1
+
+
+def test_seen_blocks_are_capped():
+    blocks = SeenBlocks(ttl=60, max_keys=2)
+    for pos in range(3):
+        blocks.duplicate(("/logs/a.log", 1, pos, "sig"), "host:1", now=0)
+    assert len(blocks) == 2
+    # the oldest one was forgotten
+    assert not blocks.duplicate(("/logs/a.log", 1, 0, "sig"), "host:2", now=1)
@@ -0,0 +1,111 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("sgtk")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fake_shotgun import FakeShotgun, FakeShotgunError  # noqa: E402
+from tk_incident.uploader import Uploader  # noqa: E402
+
+LINE = "2026-01-14 19:49:11,961 [ 2764 ERROR sgtk.env.project.tk-maya] %s"
+
+
+class FlakyUploads(FakeShotgun):
+    """FakeShotgun whose first `fail` attachment uploads raise."""
+
+    def __init__(self, fail=1):
+        super(FlakyUploads, self).__init__(scale=0)
+        self.fail = fail
+
+    def upload(self, *args, **kwargs):
+        if self.fail:
+            self.fail -= 1
+            raise FakeShotgunError("upload failed")
+        return super(FlakyUploads, self).upload(*args, **kwargs)
+
+
+class Occurrences(object):
+    def __init__(self):
+        self.added = []
+
+    def add(self, title, last_seen, host, count=1, first_seen=None):
+        self.added.append((title, count))
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / "tk-maya.log"
+    path.write_text("\n".join(LINE % ("failure %d" % i) for i in range(10)) + "\n")
+    return str(path)
+
+
+def _uploader(sg, **kwargs):
+    return Uploader(sg, settings={"upload": {"shotgun_project_id": 1}}, **kwargs)
+
+
+def _item(log, message, **trigger):
+    trigger.setdefault("matched_line", LINE % message)
+    trigger.setdefault("detected_ts", 1.0)
+    return (log, 100, trigger)
+
+
+def test_duplicates_in_a_batch_make_one_ticket(log):
+    sg = FakeShotgun(scale=0)
+    uploader = _uploader(sg)
+    items = [_item(log, "KeyError: 'a'"), _item(log, "ValueError: bad"), _item(log, "KeyError: 'b'")]
+    assert uploader.upload_batch(items) == [True, True, True]
+    assert len(sg.created) == 2
+    assert len(sg.uploads) == 2
+    assert sg.calls["batch"] == 1
+    tickets = {t["title"]: t for _, t in sg.created}
+    assert tickets[uploader.title_for(items[0][2])]["sg_occurrences"] == 2
+
+
+def test_existing_tickets_are_not_created_again(log):
+    sg = FakeShotgun(scale=0)
+    occurrences = Occurrences()
+    uploader = _uploader(sg, occurrences=occurrences)
+    first = _item(log, "KeyError: 'a'")
+    title = uploader.title_for(first[2])
+    sg.create("Ticket", {"title": title})
+    assert uploader.upload_batch([first, _item(log, "KeyError: 'b'", backfill={"count": 4})]) == [True, True]
+    assert len(sg.created) == 1
+    assert sg.calls.get("batch") is None
+    assert occurrences.added == [(title, 1), (title, 4)]
+    # the title is cached now: no more lookups
+    finds = sg.calls["find"]
+    assert uploader.upload_batch([_item(log, "KeyError: 'c'")]) == [True]
+    assert sg.calls["find"] == finds
+
+
+def test_failed_attachment_is_retried_alone(log):
+    sg = FlakyUploads(fail=1)
+    uploader = _uploader(sg)
+    items = [_item(log, "KeyError: 'a'"), _item(log, "KeyError: 'b'")]
+    # the ticket exists: its duplicate is done, the first item needs its attachment
+    assert uploader.upload_batch(items) == [False, True]
+    ticket_id = items[0][2]["attach_to"]
+    assert [t["id"] for _, t in sg.created] == [ticket_id]
+    assert uploader.upload_batch(items[:1]) == [True]
+    assert len(sg.created) == 1
+    assert sg.calls["batch"] == 1
+    assert [u[0] for u in sg.uploads] == [ticket_id]
+
+
+def test_failed_lookup_raises_before_creating(log):
+    sg = FakeShotgun(scale=0, failure_rate=1.0)
+    uploader = _uploader(sg)
+    uploader.title_field = "title"
+    with pytest.raises(FakeShotgunError):
+        uploader.upload_batch([_item(log, "KeyError: 'a'")])
+    assert sg.created == [] and "batch" not in sg.calls
+
+
+def test_missing_log_fails_only_its_item(log):
+    sg = FakeShotgun(scale=0)
+    uploader = _uploader(sg)
+    assert uploader.upload_batch([_item(log + ".gone", "KeyError: 'a'"), _item(log, "OSError: x")]) == [False, True]
+    assert len(sg.created) == 1